@@ -0,0 +1,71 @@
+"""
+Micro benchmark of BRA xml extraction: the per field XPath `_get_*` functions (`xpath_reference` of the tests)
+versus the single pass `extract_bra`.
+
+    python -m benchmark.bra_extract [BRA.xml ...] --repeat 200
+
+Without file, the bulletin of the test suite is used. Numbers are bulletins/s on one core (cpu time, parsing
+excluded).
+"""
+import os
+import time
+from typing import Callable, List
+from unittest.mock import patch
+from uuid import uuid4
+
+import click
+import lxml.etree as ET
+
+from nivo_api.cli.bra_record_helper.extract import extract_bra
+from test.test_cli.test_bra_record_helper.xpath_reference import (
+    _get_bra_record,
+    _get_risk,
+    _get_bra_snow_records,
+    _get_fresh_snow_record,
+    _get_weather_forecast,
+    _get_risk_forecast,
+)
+
+DEFAULT_BRA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "test/test_cli/test_bra_record_helper/test_data/BRA.CHABLAIS.20190101142328.xml",
+)
+
+
+def legacy_extract(bra_xml: ET._ElementTree) -> None:
+    bra_id = uuid4()
+    _get_bra_record(bra_xml, bra_id, None)
+    list(_get_risk(bra_xml.find("//RISQUE"), bra_id))
+    list(_get_bra_snow_records(bra_xml, bra_id))
+    list(_get_fresh_snow_record(bra_xml, bra_id))
+    _get_weather_forecast(bra_xml, bra_id)
+    list(_get_risk_forecast(bra_xml, bra_id))
+
+
+def bench(func: Callable, bulletins: List[ET._ElementTree], repeat: int) -> float:
+    t1 = time.process_time()
+    for _ in range(repeat):
+        for b in bulletins:
+            func(b)
+    return repeat * len(bulletins) / (time.process_time() - t1)
+
+
+@click.command()
+@click.argument("files", nargs=-1, type=click.Path(exists=True))
+@click.option("--repeat", default=200, show_default=True)
+def main(files: List[str], repeat: int) -> None:
+    bulletins = [ET.parse(f) for f in files or [DEFAULT_BRA]]
+    with patch(
+        "test.test_cli.test_bra_record_helper.xpath_reference._get_massif_id",
+        return_value=uuid4(),
+    ):
+        legacy = bench(legacy_extract, bulletins, repeat)
+    single_pass = bench(extract_bra, bulletins, repeat)
+    click.echo(f"xpath _get_*:   {legacy:10.1f} bulletins/s/core")
+    click.echo(f"extract_bra:    {single_pass:10.1f} bulletins/s/core")
+    click.echo(f"speedup:        {single_pass / legacy:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Scaling of the BRA parse stage (`import_all_bra --workers`): bulletins/s extracted by a process pool of 1..N workers.
+
+    python -m benchmark.bra_parse_pool [BRA.xml ...] --bulletins 2000 --workers 1,2,4,8
+
+Without file, the bulletin of the test suite is used. `0` workers is the in process extraction, for reference.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import click
+
+from nivo_api.cli.bra_record_helper.extract import extract_bra_bytes
+
+DEFAULT_BRA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "test/test_cli/test_bra_record_helper/test_data/BRA.CHABLAIS.20190101142328.xml",
+)
+
+
+def bench(bulletins: List[bytes], workers: int) -> float:
+    if not workers:
+        t1 = time.perf_counter()
+        for b in bulletins:
+            extract_bra_bytes(b)
+        return len(bulletins) / (time.perf_counter() - t1)
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        # warm up, so worker start up is not measured.
+        list(executor.map(extract_bra_bytes, bulletins[:workers]))
+        t1 = time.perf_counter()
+        for _ in executor.map(extract_bra_bytes, bulletins, chunksize=8):
+            pass
+        return len(bulletins) / (time.perf_counter() - t1)
+
+
+@click.command()
+@click.argument("files", nargs=-1, type=click.Path(exists=True))
+@click.option("--bulletins", "nb_bulletins", default=2000, show_default=True)
+@click.option("--workers", default="0,1,2,4", show_default=True)
+def main(files: List[str], nb_bulletins: int, workers: str) -> None:
+    raw = list()
+    for f in files or [DEFAULT_BRA]:
+        with open(f, "rb") as fp:
+            raw.append(fp.read())
+    bulletins = [raw[i % len(raw)] for i in range(nb_bulletins)]
+    click.echo(f"{os.cpu_count()} cpu")
+    reference = None
+    for w in (int(x) for x in workers.split(",")):
+        throughput = bench(bulletins, w)
+        reference = reference or throughput
+        click.echo(
+            f"{w:3d} workers: {throughput:10.1f} bulletins/s ({throughput / reference:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
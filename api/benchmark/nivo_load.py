@@ -0,0 +1,105 @@
+"""
+Load of nivo records: the old multi values `INSERT` against the streamed `COPY` of `import_nivo`, on synthetic months
+of records (~150 stations, a record every 3 hours).
+
+    python -m benchmark.nivo_load --months 1,12,36 [--memory]
+
+Unlike the other benchmarks it needs the database (DB_URL settings) with the schema created (`init_db`). Everything is
+written in a transaction which is rolled back.
+"""
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List
+
+import click
+from sqlalchemy import Integer
+from sqlalchemy.dialects.postgresql import insert
+
+from nivo_api.cli.nivo_record_helper import (
+    copy_nivo_records,
+    create_unknown_nivo_sensor_stations,
+)
+from nivo_api.core.db.connection import connection_scope, create_database_connections
+from nivo_api.core.db.models.sql.nivo import NivoRecordTable
+
+STATIONS = 150
+RECORDS_PER_DAY = 8
+_SKIP = ("nr_id", "nr_date", "nr_nivo_sensor")
+
+
+def records(stations: List, months: int) -> Iterator[Dict]:
+    start = datetime(2010, 12, 1)
+    columns = [c for c in NivoRecordTable.columns if c.name not in _SKIP]
+    for hour in range(0, months * 30 * 24, 24 // RECORDS_PER_DAY):
+        for i, station in enumerate(stations):
+            record: Dict[str, Any] = {
+                c.name: (
+                    (i + hour) % 100 if isinstance(c.type, Integer) else 273.15 + i
+                )
+                for c in columns
+            }
+            record["nr_date"] = start + timedelta(hours=hour)
+            record["nr_nivo_sensor"] = station
+            yield record
+
+
+def insert_values(con, rows: Iterator[Dict]) -> None:
+    con.execute(insert(NivoRecordTable).values(list(rows)))
+
+
+def copy(con, rows: Iterator[Dict]) -> None:
+    copy_nivo_records(con, rows)
+
+
+def bench(loader: Callable, months: int, memory: bool) -> None:
+    db = create_database_connections().engine
+    with connection_scope(db) as con:
+        trans = con.begin()
+        try:
+            stations = list(
+                create_unknown_nivo_sensor_stations(
+                    range(1, STATIONS + 1), con
+                ).values()
+            )
+            if memory:
+                tracemalloc.start()
+            t1 = time.perf_counter()
+            loader(con, records(stations, months))
+            elapsed = time.perf_counter() - t1
+            if memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+        finally:
+            trans.rollback()
+    nb = months * 30 * RECORDS_PER_DAY * STATIONS
+    result = (
+        f"{loader.__name__:>13} {months:3d} months: {elapsed:7.2f}s "
+        f"({nb / elapsed:8.0f} records/s)"
+    )
+    if memory:
+        result += f", peak memory {peak / 1024 ** 2:7.1f} MiB"
+    click.echo(result)
+
+
+@click.command()
+@click.option("--months", default="1,12", show_default=True)
+@click.option(
+    "--skip-insert",
+    is_flag=True,
+    help="Only run the COPY loader (the INSERT needs GiB of memory for years of records)",
+)
+@click.option(
+    "--memory",
+    is_flag=True,
+    help="Trace the peak python memory (tracemalloc makes the load a lot slower)",
+)
+def main(months: str, skip_insert: bool, memory: bool) -> None:
+    for m in (int(x) for x in months.split(",")):
+        if not skip_insert:
+            bench(insert_values, m, memory)
+        bench(copy, m, memory)
+
+
+if __name__ == "__main__":
+    main()
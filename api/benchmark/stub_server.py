@@ -0,0 +1,147 @@
+"""
+Local http server of the synthetic meteofrance and isaw files of `benchmark.synthetic`, to load test the imports and
+the flowcapt proxy end to end.
+
+    python -m benchmark.stub_server --port 8000 --seasons 3 [--latency 0.05]
+
+then, in another shell, with the environment it prints exported:
+
+    import_all_bra / import_all_nivo_data / flask run (flowcapt measures)
+
+A missing file is a 302 to an html page, like meteofrance does (the page itself is a 200). `--latency` delays every
+response, to get closer to the upstream round trips.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlsplit, parse_qs
+
+import click
+
+from benchmark.synthetic import SyntheticSource, content_type, scale_options
+from nivo_api.cli.mirror import BRA_DIR, NIVO_DIR
+
+BRA_PATH = "/donnees_libres/Pdf/BRA/"
+NIVO_PATH = "/donnees_libres/Txt/Nivo/"
+FLOWCAPT_PATH = "/idod/idod.php"
+NOT_FOUND_PATH = "/404.html"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # set on the subclass made by `StubServer`
+    source: SyntheticSource
+    latency: float = 0
+
+    def do_GET(self) -> None:
+        time.sleep(self.latency)
+        url = urlsplit(self.path)
+        if url.path == NOT_FOUND_PATH:
+            return self._send(200, b"<html>Page introuvable</html>", "text/html")
+        if url.path == FLOWCAPT_PATH:
+            query = parse_qs(url.query)
+            station = query.get("s", [""])[0]
+            hours = int(query.get("d", ["168"])[0])
+            return self._send(
+                200, self.source.flowcapt_rss(station, hours), "application/rss+xml"
+            )
+        body = None
+        for prefix, directory in ((BRA_PATH, BRA_DIR), (NIVO_PATH, NIVO_DIR)):
+            if url.path.startswith(prefix):
+                body = self.source.get(directory, url.path[len(prefix) :])
+        if body is None:
+            self.send_response(302)
+            self.send_header("Location", NOT_FOUND_PATH)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(200, body, content_type(url.path))
+
+    def _send(self, status: int, body: bytes, mime: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", mime)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class StubServer:
+    """
+    Serve `source` on `port` (0: any free port) from a background thread, as a context manager.
+    """
+
+    def __init__(
+        self,
+        source: SyntheticSource,
+        port: int = 0,
+        latency: float = 0,
+        host: str = "127.0.0.1",
+    ) -> None:
+        handler = type(
+            "Handler", (StubHandler,), {"source": source, "latency": latency}
+        )
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.host = host
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.httpd.server_port}"
+
+    def env(self) -> Dict[str, str]:
+        """
+        Settings pointing the imports and the flowcapt proxy to the server.
+        """
+        nivo = f"{self.url}{NIVO_PATH}".rstrip("/")
+        return {
+            "BRA_BASE_URL": f"{self.url}{BRA_PATH}".rstrip("/"),
+            "METEO_FRANCE_NIVO_BASE_URL": nivo,
+            "METEO_FRANCE_LAST_NIVO_JS_URL": f"{nivo}/lastNivo.js",
+            "FLOWCAPT_MEASURE_URL": f"{self.url}{FLOWCAPT_PATH}",
+        }
+
+    def __enter__(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+@click.command()
+@click.option("--port", default=8000, show_default=True)
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option(
+    "--latency", default=0.0, show_default=True, help="Delay of the responses (s)"
+)
+@scale_options
+def main(
+    port: int,
+    host: str,
+    latency: float,
+    seasons: int,
+    massifs: Optional[int],
+    stations: int,
+    seed: int,
+) -> None:
+    source = SyntheticSource(seasons, massifs, stations, seed)
+    server = StubServer(source, port, latency, host)
+    for name, value in server.env().items():
+        click.echo(f"export {name}={value}")
+    click.echo(f"Serving on {server.url}, ctrl-c to stop")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,513 @@
+"""
+Synthetic meteofrance and isaw files, to load test the imports end to end without hitting the real services.
+
+`SyntheticSource` generates, on demand and deterministically (same seed, same bytes):
+
+* the BRA: `massifs.json`, the `bra.YYYYMMDD.json` lists and the bulletins they reference. Bulletins are the bulletin
+  of the test suite with their dates, massif, risks, snow and weather values rewritten.
+* the nivo files: `postesNivo.json`, `lastNivo.js`, the daily csv of the last 15 days and the monthly archives.
+* the flowcapt RSS of any station.
+
+The scale is the number of seasons of history (ending with the current one), of massifs and of nivo stations. Files
+out of that range don't exist: the stub server answers them with a 302, like meteofrance.
+
+    python -m benchmark.synthetic TARGET_DIR --seasons 3 --stations 140
+
+writes them in the layout of a mirror, to be imported with `--source-dir TARGET_DIR`. `benchmark.stub_server` serves
+them over http.
+"""
+import gzip
+import json
+import math
+import os
+import random
+import re
+from copy import deepcopy
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import click
+import lxml.etree as ET
+
+from nivo_api.cli.bra_record_helper.geometry import get_massif_geometry_index
+from nivo_api.cli.bra_record_helper.miscellaneous import bra_xml_name
+from nivo_api.cli.mirror import BRA_DIR, NIVO_DIR
+from nivo_api.cli.nivo_partition import season_of, season_bounds
+from nivo_api.cli.nivo_record_helper import NivoDate
+
+TEMPLATE_BRA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "test/test_cli/test_bra_record_helper/test_data/BRA.CHABLAIS.20190101142328.xml",
+)
+# day of the template bulletin, all its dates are shifted from it.
+TEMPLATE_DAY = date(2019, 1, 1)
+_DATE_ATTRIBUTES = (
+    "DATE",
+    "DATEBULLETIN",
+    "DATEECHEANCE",
+    "DATEVALIDITE",
+    "DATEDIFFUSION",
+)
+_XML_DATE = "%Y-%m-%dT%H:%M:%S"
+# bulletins are published from december to may.
+BRA_MONTHS = (12, 1, 2, 3, 4, 5)
+# daily nivo files published, older days are in the archives.
+NIVO_DAILY_DAYS = 15
+NIVO_HEADER = (
+    "numer_sta;date;haut_sta;dd;ff;t;td;u;ww;w1;w2;n;nbas;hbas;cl;cm;ch;rr24;tn12;tn24;tx12;tx24;ht_neige;ssfrai;"
+    "perssfrai;phenspe1;phenspe2;nnuage1;t_neige;etat_neige;prof_sonde;nuage_val;chasse_neige;aval_descr;aval_genre;"
+    "aval_depart;aval_expo;aval_risque;dd_alti;ff_alti;ht_neige_alti;neige_fraiche;teneur_eau;grain_predom;"
+    "grain_nombre;grain_diametr;homogeneite;m_vol_neige;;"
+).split(";")
+# share of the measures missing ("mq") in the nivo files
+NIVO_MISSING = 0.1
+# the massifs.json zones, with the departments of their massifs.
+_ZONES = {
+    "Alpes du Nord": {
+        ("74", "Haute-Savoie"): ["CHABLAIS", "ARAVIS", "MONT-BLANC"],
+        ("73", "Savoie"): [
+            "BAUGES",
+            "BEAUFORTAIN",
+            "HAUTE-TARENTAISE",
+            "VANOISE",
+            "MAURIENNE",
+            "HAUTE-MAURIENNE",
+        ],
+        ("38", "Isère"): [
+            "CHARTREUSE",
+            "BELLEDONNE",
+            "GRANDES-ROUSSES",
+            "OISANS",
+            "VERCORS",
+        ],
+    },
+    "Alpes du Sud": {
+        ("05", "Hautes-Alpes"): [
+            "DEVOLUY",
+            "CHAMPSAUR",
+            "PELVOUX",
+            "THABOR",
+            "QUEYRAS",
+            "EMBRUNAIS-PARPAILLON",
+        ],
+        ("04", "Alpes-de-Haute-Provence"): ["UBAYE", "HAUT-VAR/HAUT-VERDON"],
+        ("06", "Alpes-Maritimes"): ["MERCANTOUR"],
+    },
+    "Pyrénées": {
+        ("64", "Pyrénées-Atlantiques"): ["PAYS-BASQUE", "ASPE-OSSAU"],
+        ("65", "Hautes-Pyrénées"): ["HAUTE-BIGORRE", "AURE-LOURON"],
+        ("31", "Haute-Garonne"): ["LUCHONNAIS"],
+        ("09", "Ariège"): [
+            "COUSERANS",
+            "HAUTE-ARIEGE",
+            "ORLU__ST_BARTHELEMY",
+            "ANDORRE",
+        ],
+        ("66", "Pyrénées-Orientales"): ["CAPCIR-PUYMORENS", "CERDAGNE-CANIGOU"],
+    },
+    "Corse": {("2A", "Corse"): ["CINTO-ROTONDO", "RENOSO-INCUDINE"]},
+}
+FLOWCAPT_MEASURES = (
+    "Snow drift",
+    "Wind speed",
+    "Wind gust",
+    "Wind direction",
+    "Air temperature",
+)
+
+CONTENT_TYPES = {
+    ".xml": "application/xml",
+    ".json": "application/json",
+    ".js": "application/javascript",
+    ".csv": "text/csv",
+    ".gz": "application/octet-stream",
+}
+
+
+def content_type(name: str) -> str:
+    return CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+
+
+@lru_cache(maxsize=1)
+def _template() -> ET._ElementTree:
+    return ET.parse(TEMPLATE_BRA)
+
+
+def snow_depth(altitude: float, day: date) -> float:
+    """
+    Snow depth in meters: none below 900m, a winter curve from november to june peaking in march.
+    """
+    day_of_winter = (day - date(season_of(day), 11, 1)).days
+    if not 0 <= day_of_winter <= 212:
+        return 0.0
+    return max(0.0, (altitude - 900) / 1000) * math.sin(math.pi * day_of_winter / 212)
+
+
+class SyntheticSource:
+    """
+    The files of `seasons` seasons of history until `today`, for the first `massifs` massifs and `stations` nivo
+    stations.
+    """
+
+    def __init__(
+        self,
+        seasons: int = 1,
+        massifs: Optional[int] = None,
+        stations: int = 140,
+        seed: int = 0,
+        today: Optional[date] = None,
+    ) -> None:
+        self.today = today or date.today()
+        self.seed = seed
+        self.start = season_bounds(season_of(self.today) - seasons + 1)[0].date()
+        all_massifs = [m.upper() for m in get_massif_geometry_index()]
+        self.massifs = all_massifs[:massifs] if massifs else all_massifs
+        self.stations = [self._station(i) for i in range(stations)]
+
+    def _random(self, *key) -> random.Random:
+        return random.Random("/".join(str(k) for k in (self.seed,) + key))
+
+    def _station(self, i: int) -> Dict:
+        rnd = self._random("station", i)
+        massif = self.massifs[i % len(self.massifs)]
+        geometry = get_massif_geometry_index().get(massif)
+        # massifs come from the index
+        assert geometry is not None
+        point = geometry.representative_point()
+        return {
+            "id": 7000 + i,
+            "name": f"{massif.title()} {i}",
+            "altitude": rnd.randrange(900, 2900, 5),
+            "coordinates": [point.x, point.y],
+        }
+
+    # BRA
+    def bra_days(self) -> Iterator[date]:
+        day = self.start
+        while day <= self.today:
+            if day.month in BRA_MONTHS:
+                yield day
+            day += timedelta(days=1)
+
+    def _published(self, day: date) -> bool:
+        return self.start <= day <= self.today and day.month in BRA_MONTHS
+
+    def diffusion(self, massif: str, day: date) -> datetime:
+        rnd = self._random("diffusion", massif, day)
+        return datetime.combine(day, datetime.min.time()) + timedelta(
+            hours=13, seconds=rnd.randrange(3 * 3600)
+        )
+
+    def massifs_json(self) -> List[Dict]:
+        zones = list()
+        for zone, departments in _ZONES.items():
+            zones.append(
+                {
+                    "zone": zone,
+                    "departements": [
+                        {
+                            "num_dep": number,
+                            "nom_dep": name,
+                            "massifs": [m for m in massifs if m in self.massifs],
+                        }
+                        for (number, name), massifs in departments.items()
+                    ],
+                }
+            )
+        return zones
+
+    def bra_list(self, day: date) -> Optional[List[Dict]]:
+        if not self._published(day):
+            return None
+        return [
+            {
+                "massif": m.replace("/", "_"),
+                "heures": [self.diffusion(m, day).strftime("%Y%m%d%H%M%S")],
+            }
+            for m in self.massifs
+        ]
+
+    def bra_xml(self, massif: str, diffusion: datetime) -> bytes:
+        """
+        The bulletin of `massif` diffused at `diffusion`.
+        """
+        rnd = self._random("bra", massif, diffusion)
+        bra = deepcopy(_template())
+        shift = diffusion.date() - TEMPLATE_DAY
+        root = bra.getroot()
+        for el in root.iter():
+            for attribute in _DATE_ATTRIBUTES:
+                if attribute in el.attrib:
+                    value = datetime.strptime(el.get(attribute), _XML_DATE) + shift
+                    el.set(attribute, value.strftime(_XML_DATE))
+        bulletin = root.find("BULLETINS_NEIGE_AVALANCHE")
+        bulletin.set("MASSIF", massif)
+        bulletin.set("DATEDIFFUSION", diffusion.strftime(_XML_DATE))
+        validity = bulletin.find("DateValidite")
+        validity.text = bulletin.get("DATEVALIDITE")
+
+        risk = bulletin.find("CARTOUCHERISQUE/RISQUE")
+        low = rnd.randint(1, 4)
+        high = min(5, low + rnd.randint(0, 1))
+        altitude = rnd.randrange(1600, 2800, 100)
+        risk.attrib.update(
+            {
+                "RISQUE1": str(low),
+                "RISQUE2": str(high),
+                "RISQUEMAXI": str(high),
+                "ALTITUDE": str(altitude),
+                "LOC1": f"<{altitude}",
+                "LOC2": f">{altitude}",
+            }
+        )
+        for side in bulletin.find("CARTOUCHERISQUE/PENTE").attrib:
+            if side != "COMMENTAIRE":
+                bulletin.find("CARTOUCHERISQUE/PENTE").set(
+                    side, rnd.choice(("true", "false"))
+                )
+        for snow in root.iter("ENNEIGEMENT"):
+            day = datetime.strptime(snow.get("DATE"), _XML_DATE).date()
+            snow.set("LimiteSud", str(rnd.randrange(900, 2000, 50)))
+            snow.set("LimiteNord", str(rnd.randrange(800, 1800, 50)))
+            for level in snow.iter("NIVEAU"):
+                depth = snow_depth(int(level.get("ALTI")), day) * 100
+                level.set("N", str(int(depth)))
+                level.set("S", str(int(depth * 0.7)))
+        for fresh in root.iter("NEIGE24H"):
+            fresh.set("SS241", str(rnd.choice((0, 0, 0, 5, 10, 20, 40))))
+        for forecast in root.iter("ECHEANCE"):
+            forecast.set("ISO0", str(rnd.randrange(500, 3500, 100)))
+            forecast.set("FF1", str(rnd.randrange(0, 80, 10)))
+            forecast.set("FF2", str(rnd.randrange(0, 100, 10)))
+        for trend in root.iter("TENDANCE"):
+            trend.set("VALEUR", str(rnd.randint(-1, 1)))
+        for past in root.iter("RISQUE"):
+            if "RISQUE1" not in past.attrib:
+                past.set("RISQUEMAXI", str(rnd.randint(1, 4)))
+        for avalanche in root.iter("AVALANCHE"):
+            avalanche.set("SPONTANE", str(rnd.choice((0, 0, 0, 1, 2))))
+        return ET.tostring(bra, encoding="UTF-8", xml_declaration=True)
+
+    # nivo
+    def postes_nivo_json(self) -> Dict:
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": s["coordinates"]},
+                    "properties": {
+                        "ID": f"{s['id']:05d}",
+                        "Nom": s["name"],
+                        "Altitude": str(s["altitude"]),
+                        "Latitude": str(s["coordinates"][1]),
+                        "Longitude": str(s["coordinates"][0]),
+                    },
+                }
+                for s in self.stations
+            ],
+        }
+
+    def last_nivo_js(self) -> str:
+        return f"jour={self.today.strftime('%Y%m%d')};\n"
+
+    def nivo_line(self, station: Dict, day: date) -> str:
+        rnd = self._random("nivo", station["id"], day)
+        altitude = station["altitude"]
+        # -6.5°C/1000m, colder in january
+        t = (
+            288.15
+            - altitude * 0.0065
+            - 10 * math.cos(2 * math.pi * (day.timetuple().tm_yday - 15) / 365)
+            + rnd.gauss(0, 3)
+        )
+        depth = snow_depth(altitude, day)
+        values = {
+            "numer_sta": f"{station['id']:05d}",
+            "date": f"{day.strftime('%Y%m%d')}{rnd.choice(('06', '07'))}{rnd.choice(('00', '30'))}00",
+            "haut_sta": altitude,
+            "dd": rnd.randrange(0, 370, 10),
+            "ff": rnd.randint(0, 15),
+            "t": t,
+            "td": t - rnd.uniform(0, 10),
+            "u": rnd.randint(30, 100),
+            "ww": rnd.choice((0, 0, 2, 71)),
+            "n": rnd.randint(0, 8),
+            "rr24": rnd.choice((0, 0, 0, 1.5, 5, 12)),
+            "tn12": t - rnd.uniform(0, 5),
+            "tn24": t - rnd.uniform(0, 8),
+            "tx12": t + rnd.uniform(0, 5),
+            "tx24": t + rnd.uniform(0, 8),
+            "ht_neige": depth,
+            "ssfrai": rnd.choice((0, 0, 0, 0.05, 0.2)) if depth else 0,
+            "perssfrai": -99,
+            "phenspe1": 768,
+            "phenspe2": 3100,
+            "t_neige": min(t, 273.15) - rnd.uniform(0, 5) if depth else "mq",
+            "aval_risque": rnd.randint(1, 4) if depth else "mq",
+        }
+        cells = list()
+        # the lines have one empty cell at the end, the header two.
+        for name in NIVO_HEADER[:-1]:
+            value = values.get(name, "mq") if name else ""
+            if name not in ("numer_sta", "date", "haut_sta") and (
+                rnd.random() < NIVO_MISSING
+            ):
+                value = "mq" if name else ""
+            cells.append(f"{value:f}" if isinstance(value, float) else str(value))
+        return ";".join(cells)
+
+    def nivo_csv(self, days: List[date]) -> str:
+        lines = [";".join(NIVO_HEADER)]
+        for day in days:
+            lines += [self.nivo_line(station, day) for station in self.stations]
+        return "\n".join(lines) + "\n"
+
+    def nivo_days(self, nivo_date: NivoDate) -> List[date]:
+        """
+        Days in the file of `nivo_date`, none if it's not published.
+        """
+        if not nivo_date.is_archive:
+            day = nivo_date.nivo_date
+            recent = self.today - timedelta(days=NIVO_DAILY_DAYS) <= day <= self.today
+            return [day] if recent and day >= self.start else list()
+        month = nivo_date.nivo_date.replace(day=1)
+        days = list()
+        day = max(month, self.start)
+        while day.month == month.month and day < self.today:
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def nivo_dates(self) -> Iterator[NivoDate]:
+        month = self.start.replace(day=1)
+        while month <= self.today:
+            yield NivoDate(is_archive=True, nivo_date=month)
+            month = (month + timedelta(days=32)).replace(day=1)
+        for x in range(NIVO_DAILY_DAYS + 1):
+            yield NivoDate(is_archive=False, nivo_date=self.today - timedelta(days=x))
+
+    # flowcapt
+    def flowcapt_rss(self, station: str, hours: int = 168) -> bytes:
+        rnd = self._random("flowcapt", station, self.today)
+        last = datetime.combine(self.today, datetime.min.time())
+        rss = ET.Element("rss", version="2.0")
+        channel = ET.SubElement(rss, "channel")
+        for tag, text in (
+            ("title", station),
+            ("link", f"http://www.isaw.ch/idod/idod.php?s={station}"),
+            ("description", f"FlowCapt {station}"),
+            ("lastdata", last.strftime("%Y-%m-%d %H:%M:%S")),
+            ("generation", last.strftime("%Y-%m-%d %H:%M:%S")),
+            ("generator", "idod"),
+        ):
+            ET.SubElement(channel, tag).text = text
+        for measure in FLOWCAPT_MEASURES:
+            item = ET.SubElement(channel, "item")
+            ET.SubElement(item, "title").text = measure
+            values = [
+                f"{rnd.uniform(0, 30):.1f}" if i % 3 else str(rnd.randint(0, 30))
+                for i in range(hours)
+            ]
+            ET.SubElement(item, "data").text = ",".join(values) + ","
+        return ET.tostring(rss, encoding="UTF-8", xml_declaration=True)
+
+    # files, by their path below the meteofrance base urls.
+    def bra_file(self, name: str) -> Optional[bytes]:
+        if name == "massifs.json":
+            return json.dumps(self.massifs_json()).encode()
+        match = re.fullmatch(r"bra\.(\d{8})\.json", name)
+        if match:
+            bra_list = self.bra_list(datetime.strptime(match.group(1), "%Y%m%d").date())
+            return None if bra_list is None else json.dumps(bra_list).encode()
+        match = re.fullmatch(r"BRA\.(.+)\.(\d{14})\.xml", name)
+        if match:
+            # HAUT-VAR/HAUT-VERDON is HAUT-VAR_HAUT-VERDON in the urls
+            names = {m.replace("/", "_"): m for m in self.massifs}
+            massif = names.get(match.group(1), "")
+            diffusion = datetime.strptime(match.group(2), "%Y%m%d%H%M%S")
+            if massif in self.massifs and diffusion == self.diffusion(
+                massif, diffusion.date()
+            ):
+                if self._published(diffusion.date()):
+                    return self.bra_xml(massif, diffusion)
+        return None
+
+    def nivo_file(self, name: str) -> Optional[bytes]:
+        if name == "postesNivo.json":
+            return json.dumps(self.postes_nivo_json()).encode()
+        if name == "lastNivo.js":
+            return self.last_nivo_js().encode()
+        match = re.fullmatch(r"(Archive/)?nivo\.(\d{6}|\d{8})\.csv(\.gz)?", name)
+        if not match or bool(match.group(1)) != bool(match.group(3)):
+            return None
+        is_archive = bool(match.group(1))
+        if is_archive != (len(match.group(2)) == 6):
+            return None
+        day = datetime.strptime(match.group(2), "%Y%m" if is_archive else "%Y%m%d")
+        days = self.nivo_days(NivoDate(is_archive=is_archive, nivo_date=day.date()))
+        if not days:
+            return None
+        raw = self.nivo_csv(days).encode()
+        # mtime fixed, the archives are the same bytes every time.
+        return gzip.compress(raw, mtime=0) if is_archive else raw  # type: ignore
+
+    def files(self) -> Iterator[Tuple[str, str]]:
+        """
+        (directory, name) of every published file, in the layout of a mirror.
+        """
+        yield BRA_DIR, "massifs.json"
+        for day in self.bra_days():
+            yield BRA_DIR, f"bra.{day.strftime('%Y%m%d')}.json"
+            for massif in self.massifs:
+                yield BRA_DIR, bra_xml_name(massif, self.diffusion(massif, day))
+        yield NIVO_DIR, "postesNivo.json"
+        yield NIVO_DIR, "lastNivo.js"
+        for nivo_date in self.nivo_dates():
+            if self.nivo_days(nivo_date):
+                yield NIVO_DIR, nivo_date.file_path
+
+    def get(self, directory: str, name: str) -> Optional[bytes]:
+        return (self.bra_file if directory == BRA_DIR else self.nivo_file)(name)
+
+    def write(self, root: str) -> int:
+        """
+        Write the files in `root`, as a mirror. Return the number of files written.
+        """
+        written = 0
+        for directory, name in self.files():
+            path = os.path.join(root, directory, *name.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(self.get(directory, name))  # type: ignore
+            written += 1
+        return written
+
+
+def scale_options(f):
+    for option in reversed(
+        [
+            click.option("--seasons", default=1, show_default=True),
+            click.option("--massifs", type=int, help="Default: all of them"),
+            click.option("--stations", default=140, show_default=True),
+            click.option("--seed", default=0, show_default=True),
+        ]
+    ):
+        f = option(f)
+    return f
+
+
+@click.command()
+@click.argument("target_dir", type=click.Path(file_okay=False))
+@scale_options
+def main(
+    target_dir: str, seasons: int, massifs: Optional[int], stations: int, seed: int
+) -> None:
+    source = SyntheticSource(seasons, massifs, stations, seed)
+    click.echo(f"{source.write(target_dir)} files written in {target_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Concurrent fetch stage for BRA imports. Downloads run in a thread pool, results are handed back to the caller in the
+order they were scheduled so persistence can stay single threaded (a DB connection is not thread safe).
+
+The number of requests in flight on a given host is capped by the shared http client pool (see `nivo_api.core.http`).
+
+Bulletins are extracted (`extract.extract_bra_bytes`) in the download threads, or with `workers`, in a process pool
+(it's cpu bound).
+"""
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Callable, Deque, Iterable, Iterator, Tuple, Any, Optional, Dict
+
+from nivo_api.cli.bra_record_helper.extract import extract_bra_bytes, BraRows
+from nivo_api.cli.bra_record_helper.miscellaneous import (
+    get_bra_date,
+    BraListMissing,
+    get_bra_xml_bytes,
+)
+from nivo_api.cli.ingest_journal import IngestJournal, IngestItem
+from nivo_api.core.db.models.sql.ingest import IngestStatus
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class BackfillReport:
+    """
+    What happened during an import, printed at the end of the command.
+    """
+
+    persisted: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        elapsed = self.elapsed
+        return self.persisted / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.persisted} bulletins persisted, {self.failed} failed, "
+            f"in {self.elapsed:.1f}s ({self.throughput:.2f} bulletins/s)"
+        )
+
+
+def fetch_bra(massif: str, bra_date: datetime) -> BraRows:
+    return extract_bra_bytes(get_bra_xml_bytes(massif, bra_date))
+
+
+class BraDayJournal:
+    """
+    Record each day of bra in the import journal (source "bra", key the iso date). A day is done once all its
+    bulletins are persisted, failed if one of them (or the bra list of the day) failed, skipped if meteofrance has no
+    bra list for it.
+
+    The last two days are never recorded nor skipped: bulletins can still be published for them.
+    """
+
+    SOURCE = "bra"
+
+    def __init__(self, journal: Optional[IngestJournal]) -> None:
+        self.journal = journal
+        self._items: Dict[date, IngestItem] = dict()
+        self._pending: Dict[date, int] = dict()
+        self._errors: Dict[date, Exception] = dict()
+        self._indexed: Dict[date, bool] = dict()
+        self._day_of: Dict[Tuple[str, datetime], date] = dict()
+
+    def _is_recent(self, day: date) -> bool:
+        return day >= date.today() - timedelta(days=1)
+
+    def should_fetch(self, day: date) -> bool:
+        if self.journal is None or self._is_recent(day):
+            return True
+        return self.journal.should_process(self.SOURCE, day.isoformat())
+
+    def start(self, day: date) -> None:
+        self._items[day] = IngestItem(self.SOURCE, day.isoformat(), rows=0, bytes=0)
+        self._pending[day] = 0
+
+    def index_failed(self, day: date, error: Exception) -> None:
+        if isinstance(error, BraListMissing):
+            # 302, no bra for this day. An upstream error is a failure, the day is tried again.
+            self._items[day].status = IngestStatus.SKIPPED
+            self._record(day)
+        else:
+            self._record(day, error)
+
+    def scheduled(self, day: date, massif: str, bra_date: datetime) -> None:
+        self._pending[day] += 1
+        self._day_of[(massif, bra_date)] = day
+
+    def indexed(self, day: date) -> None:
+        """
+        All the bulletins of the day are scheduled.
+        """
+        self._indexed[day] = True
+        if not self._pending[day]:
+            self._record(day, self._errors.get(day))
+
+    def downloaded(self, key: Tuple[str, datetime], size: int) -> None:
+        day = self._day_of.get(key)
+        if day is not None and day in self._items:
+            self._items[day].bytes += size  # type: ignore
+
+    def bulletin_done(
+        self, key: Tuple[str, datetime], error: Optional[Exception] = None
+    ) -> None:
+        day = self._day_of.pop(key, None)
+        if day is None or day not in self._items:
+            return
+        self._pending[day] -= 1
+        if error:
+            self._errors.setdefault(day, error)
+        else:
+            self._items[day].rows += 1  # type: ignore
+        if self._indexed.get(day) and not self._pending[day]:
+            self._record(day, self._errors.get(day))
+
+    def _record(self, day: date, error: Optional[Exception] = None) -> None:
+        item = self._items.pop(day)
+        self._pending.pop(day, None)
+        self._indexed.pop(day, None)
+        self._errors.pop(day, None)
+        if self.journal and not self._is_recent(day):
+            self.journal.record(item, error)
+
+
+class BraFetcher:
+    """
+    Fetch BRA indexes (bra.<date>.json) and BRA xml concurrently. Use it as a context manager so the pools are shut
+    down at the end of the import.
+
+    `window` is the number of tasks scheduled ahead of the consumer. It bounds the memory used by downloaded but not
+    yet persisted bulletins.
+    """
+
+    def __init__(self, jobs: int = 8, workers: int = 0) -> None:
+        self.jobs = max(jobs, 1)
+        self.workers = max(workers, 0)
+        self.window = self.jobs * 2
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.jobs, thread_name_prefix="bra-fetch"
+        )
+        self._parse_executor: Optional[ProcessPoolExecutor] = None
+        if self.workers:
+            # spawn: forking a process running threads (and an http pool) is asking for deadlocks.
+            self._parse_executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    def __enter__(self) -> "BraFetcher":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._executor.shutdown(wait=True)
+        if self._parse_executor:
+            self._parse_executor.shutdown(wait=True)
+
+    def _windowed(
+        self, scheduled: Iterable[Tuple[Any, Future]], window: int
+    ) -> Iterator[Tuple[Any, Future]]:
+        pending: Deque[Tuple[Any, Future]] = deque()
+        for key, future in scheduled:
+            pending.append((key, future))
+            if len(pending) >= window:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    def _ordered(
+        self, tasks: Iterable[Tuple[Any, Callable, Tuple]]
+    ) -> Iterator[Tuple[Any, Future]]:
+        return self._windowed(
+            ((key, self._executor.submit(func, *args)) for key, func, args in tasks),
+            self.window,
+        )
+
+    def _parsed(
+        self, fetched: Iterable[Tuple[Any, Future]]
+    ) -> Iterator[Tuple[Any, Future]]:
+        def scheduled() -> Iterator[Tuple[Any, Future]]:
+            for key, future in fetched:
+                try:
+                    raw = future.result()
+                except Exception as e:
+                    parsed: Future = Future()
+                    parsed.set_exception(e)
+                else:
+                    parsed = self._parse_executor.submit(extract_bra_bytes, raw)  # type: ignore
+                yield key, parsed
+
+        return self._windowed(scheduled(), self.workers * 2)
+
+    def indexes(self, days: Iterable[date]) -> Iterator[Tuple[date, Future]]:
+        """
+        yield, in order, the day and the future of `get_bra_date` for this day.
+        """
+        return self._ordered((d, get_bra_date, (d,)) for d in days)
+
+    def bulletins(
+        self, to_fetch: Iterable[Tuple[str, datetime]]
+    ) -> Iterator[Tuple[str, datetime, Future]]:
+        """
+        yield, in order, the massif, the bra date and the future of the extracted bulletin (`BraRows`). `to_fetch` is
+        consumed lazily from the calling thread.
+        """
+        # fetch the xml bytes when the workers parse it, else the extracted bulletin.
+        tasks: Iterator[Tuple[Any, Callable, Tuple]]
+        if self.workers:
+            tasks = (((m, d), get_bra_xml_bytes, (m, d)) for m, d in to_fetch)
+            results = self._parsed(self._ordered(tasks))
+        else:
+            tasks = (((m, d), fetch_bra, (m, d)) for m, d in to_fetch)
+            results = self._ordered(tasks)
+        for (massif, m_date), future in results:
+            yield massif, m_date, future
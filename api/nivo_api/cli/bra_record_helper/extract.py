@@ -0,0 +1,326 @@
+"""
+Single pass extraction of a BRA xml to the rows of every bra table.
+
+The sections we need are collected in one walk over the document (`iter` filters the tags in C), then each of them is
+read once. It replaced per field XPath searches over the whole document, kept in the tests as the reference
+(`test_bra_record_helper/xpath_reference.py`).
+"""
+import io
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from distutils.util import strtobool
+from typing import Dict, List, Optional, Any, Union, Tuple
+from uuid import UUID, uuid4
+
+import lxml.etree as ET
+from lxml.etree import _Element
+
+from nivo_api.core.db.models.sql.bra import (
+    RiskTable,
+    DangerousSlopes,
+    BraRecordTable,
+    SnowRecordTable,
+    FreshSnowRecordTable,
+    WeatherForecastTable,
+    RiskForecastTable,
+    WindDirection,
+    WeatherType,
+    RiskEvolution,
+    WeatherForecastAtAltitudeTable,
+)
+
+log = logging.getLogger(__name__)
+
+# first element of each of these tags, in document order, is what `find("//TAG")` returns.
+SECTIONS = (
+    "BULLETINS_NEIGE_AVALANCHE",
+    "DateValidite",
+    "RISQUE",
+    "PENTE",
+    "AVIS",
+    "QUALITE",
+    "STABILITE",
+    "ENNEIGEMENT",
+    "NEIGEFRAICHE",
+    "METEO",
+    "TENDANCES",
+)
+# sections where we only want the TEXTE child (`//QUALITE/TEXTE`)
+_TEXT_SECTIONS = ("QUALITE", "STABILITE")
+
+
+@dataclass
+class BraRows:
+    """
+    Every row extracted from a bulletin. The massif is kept by name, it's resolved to an id when persisting.
+    """
+
+    bra_id: UUID
+    massif: str
+    record: Dict[str, Any]
+    risks: List[Dict] = field(default_factory=list)
+    snow_records: List[Dict] = field(default_factory=list)
+    fresh_snow_records: List[Dict] = field(default_factory=list)
+    weather_forecasts: List[Dict] = field(default_factory=list)
+    weather_forecasts_at_altitude: List[Dict] = field(default_factory=list)
+    risk_forecasts: List[Dict] = field(default_factory=list)
+    # size of the downloaded xml, when known
+    size: int = 0
+    # stage -> (wall, cpu) seconds spent extracting, wherever it ran (a worker process can't profile for the caller).
+    timings: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+
+    def as_entities(self, massif_id: UUID) -> List[Dict]:
+        """
+        Rows in the format `persist_bra` understand, record first.
+        """
+        return [
+            {BraRecordTable: dict(self.record, br_massif=massif_id)},
+            {RiskTable: self.risks},
+            {SnowRecordTable: self.snow_records},
+            {FreshSnowRecordTable: self.fresh_snow_records},
+            {WeatherForecastTable: self.weather_forecasts},
+            {WeatherForecastAtAltitudeTable: self.weather_forecasts_at_altitude},
+            {RiskForecastTable: self.risk_forecasts},
+        ]
+
+
+def _int_or_none(data: Optional[str]) -> Optional[int]:
+    if data:
+        try:
+            return int(data)
+        except ValueError:
+            log.debug(f"Failed to convert {data} to int, returning None")
+    return None
+
+
+def _int_or_null_value(data: str) -> Optional[int]:
+    """
+    -1 is meteofrance null value.
+    """
+    value = int(data)
+    return value if value != -1 else None
+
+
+def _date(data: str) -> datetime:
+    return datetime.strptime(data, "%Y-%m-%dT%H:%M:%S")
+
+
+def _collect_sections(bra_xml: Union[ET._ElementTree, _Element]) -> Dict[str, _Element]:
+    sections: Dict[str, _Element] = dict()
+    for el in bra_xml.iter(*SECTIONS):
+        if el.tag in _TEXT_SECTIONS:
+            text = el.find("TEXTE")
+            if text is not None:
+                sections.setdefault(el.tag, text)
+        else:
+            sections.setdefault(el.tag, el)
+    return sections
+
+
+def _section(s: Dict[str, _Element], tag: str) -> _Element:
+    try:
+        return s[tag]
+    except KeyError:
+        raise ValueError(f"{tag} is missing from the bulletin")
+
+
+def _record(s: Dict[str, _Element], bra_id: UUID, bra_xml: Any) -> Dict[str, Any]:
+    bulletin = _section(s, "BULLETINS_NEIGE_AVALANCHE")
+    risk = _section(s, "RISQUE")
+    slopes = _section(s, "PENTE")
+    snow = _section(s, "ENNEIGEMENT")
+    return {
+        "br_id": bra_id,
+        "br_production_date": bulletin.get("DATEDIFFUSION"),
+        "br_expiration_date": _section(s, "DateValidite").text,
+        "br_is_amended": strtobool(bulletin.get("AMENDEMENT")),
+        "br_max_risk": _int_or_none(risk.get("RISQUEMAXI")),
+        "br_risk_comment": risk.get("COMMENTAIRE"),
+        "br_dangerous_slopes": [
+            DangerousSlopes(k)
+            for k, v in slopes.items()
+            if v == "true" and k != "COMMENTAIRE"
+        ],
+        "br_dangerous_slopes_comment": slopes.get("COMMENTAIRE"),
+        "br_opinion": _section(s, "AVIS").text,
+        "br_snow_quality": _section(s, "QUALITE").text,
+        "br_snow_stability": _section(s, "STABILITE").text,
+        "br_last_snowfall_date": None,
+        "br_snowlimit_south": snow.get("LimiteSud"),
+        "br_snowlimit_north": snow.get("LimiteNord"),
+        "br_raw_xml": bra_xml,
+    }
+
+
+def _risks(risk: _Element, bra_id: UUID) -> List[Dict]:
+    risks = list()
+    first = _int_or_none(risk.get("RISQUE1"))
+    # -1 means no risk evaluated
+    if first != -1:
+        risks.append(
+            {
+                "r_record_id": bra_id,
+                "r_altitude_limit": risk.get("LOC1") or None,
+                "r_evolution": _int_or_none(risk.get("EVOLURISQUE1")),
+                "r_risk": first,
+            }
+        )
+    if risk.get("ALTITUDE") and risk.get("ALTITUDE") != "-1":
+        risks.append(
+            {
+                "r_record_id": bra_id,
+                "r_altitude_limit": risk.get("LOC2"),
+                "r_evolution": _int_or_none(risk.get("EVOLURISQUE2")),
+                "r_risk": _int_or_none(risk.get("RISQUE2")),
+            }
+        )
+    return risks
+
+
+def _snow_records(snow: _Element, bra_id: UUID) -> List[Dict]:
+    return [
+        {
+            "s_bra_record": bra_id,
+            "s_altitude": int(x.get("ALTI")),
+            "s_snow_quantity_cm_north": int(x.get("N")),
+            "s_snow_quantity_cm_south": int(x.get("S")),
+        }
+        for x in snow
+        if x.tag == "NIVEAU" and x.get("ALTI") != "-1"
+    ]
+
+
+def _fresh_snow_records(fresh_snow: _Element, bra_id: UUID) -> List[Dict]:
+    altitude = int(fresh_snow.get("ALTITUDESS"))
+    return [
+        {
+            "fsr_bra_record": bra_id,
+            "fsr_date": _date(x.get("DATE")),
+            "fsr_altitude": altitude,
+            "sfr_massif_snowfall": int(x.get("SS241")),
+            "fsr_second_massif_snowfall": int(x.get("SS242")),
+        }
+        for x in fresh_snow
+        if x.tag == "NEIGE24H"
+    ]
+
+
+def _altitudes(meteo: _Element) -> List[int]:
+    return [int(v) for v in meteo.attrib.values()]
+
+
+def _winds(echeance: _Element, altitudes: List[int], wf_id: UUID) -> List[Dict]:
+    """
+    wind direction and force of one ECHEANCE, for each altitude of the forecast.
+    """
+    winds = list()
+    for alt_index, alt in enumerate(altitudes, 1):
+        wind_dir = echeance.get(f"DD{alt_index}")
+        if wind_dir:  # sometime wind_dir is empty
+            winds.append(
+                {
+                    "wfaa_wf_id": wf_id,
+                    "wfaa_wind_altitude": alt,
+                    "wfaa_wind_direction": WindDirection(wind_dir),
+                    "wfaa_wind_force": int(echeance.get(f"FF{alt_index}")),
+                }
+            )
+    return winds
+
+
+def _weather_forecasts(meteo: _Element, rows: BraRows) -> None:
+    altitudes = _altitudes(meteo)
+    for echeance in meteo:
+        if echeance.tag != "ECHEANCE":
+            continue
+        wf_id = uuid4()
+        weather_type = echeance.get("TEMPSSENSIBLE")
+        rows.weather_forecasts.append(
+            {
+                "wf_id": wf_id,
+                "wf_bra_record": rows.bra_id,
+                "wf_expected_date": _date(echeance.get("DATE")),
+                "wf_weather_type": (
+                    WeatherType(int(weather_type)) if weather_type != "-1" else None
+                ),
+                "wf_sea_of_clouds": _int_or_null_value(echeance.get("MERNUAGES")),
+                "wf_rain_snow_limit": _int_or_null_value(echeance.get("PLUIENEIGE")),
+                "wf_iso0": _int_or_null_value(echeance.get("ISO0")),
+                "wf_iso_minus_10": _int_or_null_value(echeance.get("ISO-10")),
+            }
+        )
+        rows.weather_forecasts_at_altitude += _winds(echeance, altitudes, wf_id)
+
+
+def extract_winds(
+    bra_xml: Union[ET._ElementTree, _Element], wf_ids: Dict[datetime, UUID]
+) -> List[Dict]:
+    """
+    Wind rows of an already stored bulletin. `wf_ids` map the date of each forecast to its id, ECHEANCE without a
+    forecast are skipped.
+    """
+    meteo = _section(_collect_sections(bra_xml), "METEO")
+    altitudes = _altitudes(meteo)
+    winds = list()
+    for echeance in meteo:
+        if echeance.tag != "ECHEANCE":
+            continue
+        wf_id = wf_ids.get(_date(echeance.get("DATE")))
+        if wf_id:
+            winds += _winds(echeance, altitudes, wf_id)
+    return winds
+
+
+def _risk_forecasts(tendances: _Element, bra_id: UUID) -> List[Dict]:
+    return [
+        {
+            "rf_bra_record": bra_id,
+            "rf_date": _date(forecast.get("DATE")),
+            "rf_evolution": RiskEvolution(int(forecast.get("VALEUR"))),
+        }
+        for forecast in tendances
+    ]
+
+
+def extract_bra(
+    bra_xml: Union[ET._ElementTree, _Element], bra_id: Optional[UUID] = None
+) -> BraRows:
+    """
+    Extract all the rows of a bulletin. Raise ValueError on a bulletin missing mandatory parts.
+    """
+    bra_id = bra_id or uuid4()
+    s = _collect_sections(bra_xml)
+    rows = BraRows(
+        bra_id=bra_id,
+        massif=_section(s, "BULLETINS_NEIGE_AVALANCHE").get("MASSIF"),
+        record=_record(s, bra_id, bra_xml),
+        risks=_risks(_section(s, "RISQUE"), bra_id),
+        snow_records=_snow_records(_section(s, "ENNEIGEMENT"), bra_id),
+        fresh_snow_records=_fresh_snow_records(_section(s, "NEIGEFRAICHE"), bra_id),
+        risk_forecasts=_risk_forecasts(_section(s, "TENDANCES"), bra_id),
+    )
+    _weather_forecasts(_section(s, "METEO"), rows)
+    return rows
+
+
+def extract_bra_bytes(raw_xml: bytes) -> BraRows:
+    """
+    Parse and extract a bulletin as downloaded. Meant to run in a worker process: the result only holds picklable
+    values, the raw xml is kept as the string the XML column would have been given.
+    """
+    wall, cpu = time.perf_counter(), time.thread_time()
+    bra_xml = ET.parse(io.BytesIO(raw_xml))
+    parsed_wall, parsed_cpu = time.perf_counter(), time.thread_time()
+    rows = extract_bra(bra_xml)
+    rows.record["br_raw_xml"] = ET.tostring(bra_xml, encoding="utf-8").decode("utf-8")
+    rows.size = len(raw_xml)
+    rows.timings = {
+        "parse": (parsed_wall - wall, parsed_cpu - cpu),
+        "transform": (
+            time.perf_counter() - parsed_wall,
+            time.thread_time() - parsed_cpu,
+        ),
+    }
+    return rows
@@ -0,0 +1,78 @@
+"""
+Massif geometries, from `cli/data/all_massifs.geojson`. The file is parsed once per process into an index keyed by the
+upper cased massif name.
+"""
+import threading
+from typing import Dict, IO, Iterator, Optional
+
+import geojson
+from pkg_resources import resource_stream
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+from shapely.prepared import prep, PreparedGeometry
+
+
+class MassifGeometryIndex:
+    """
+    name -> geometry of the massifs. Lookups are case insensitive. If two features have the same name, the first one
+    wins.
+
+    Geometries are also kept prepared, so point in massif tests (e.g. to find the massif of a sensor station) are cheap.
+    """
+
+    def __init__(self) -> None:
+        self._geoms: Dict[str, BaseGeometry] = dict()
+        self._prepared: Dict[str, PreparedGeometry] = dict()
+        self._labels: Dict[str, str] = dict()
+
+    @classmethod
+    def from_geojson(cls, fp: IO) -> "MassifGeometryIndex":
+        index = cls()
+        for obj in geojson.load(fp).features:
+            index.add(obj.properties["label"], shape(obj.geometry))
+        return index
+
+    def add(self, label: str, geom: BaseGeometry) -> None:
+        key = label.upper()
+        if key in self._geoms:
+            return
+        self._geoms[key] = geom
+        self._prepared[key] = prep(geom)
+        self._labels[key] = label
+
+    def __contains__(self, massif: str) -> bool:
+        return massif.upper() in self._geoms
+
+    def __len__(self) -> int:
+        return len(self._geoms)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._labels.values())
+
+    def get(self, massif: str) -> Optional[BaseGeometry]:
+        return self._geoms.get(massif.upper())
+
+    def find(self, geom: BaseGeometry) -> Optional[str]:
+        """
+        return the label of the massif containing `geom`, None if it's outside of all massifs.
+        """
+        for key, prepared in self._prepared.items():
+            if prepared.contains(geom):
+                return self._labels[key]
+        return None
+
+
+_index: Optional[MassifGeometryIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_massif_geometry_index() -> MassifGeometryIndex:
+    """
+    Return the index built from the geojson shipped with the package, parsing it at first call.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            with resource_stream("nivo_api", "cli/data/all_massifs.geojson") as fp:
+                _index = MassifGeometryIndex.from_geojson(fp)
+        return _index
@@ -0,0 +1,144 @@
+"""
+Maintenance of already imported bulletins.
+"""
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+
+from nivo_api.cli.bra_record_helper.extract import extract_winds
+from nivo_api.core.db.models.sql.bra import (
+    BraRecordTable,
+    WeatherForecastTable,
+    WeatherForecastAtAltitudeTable,
+)
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class CompactReport:
+    records: int = 0
+    forecasts_fixed: int = 0
+    rows_deleted: int = 0
+    rows_inserted: int = 0
+    # only measured with a vacuum, before it the deleted rows still take their space.
+    size_before: Optional[int] = None
+    size_after: Optional[int] = None
+
+    def __str__(self) -> str:
+        rows = (
+            f"{self.records} bulletins checked, {self.forecasts_fixed} forecasts fixed, "
+            f"{self.rows_deleted} wind rows deleted, {self.rows_inserted} inserted. "
+        )
+        if self.size_before is None or self.size_after is None:
+            return rows + "The space of the deleted rows is only freed by a vacuum."
+        return rows + (
+            f"weather_forecast_at_altitude size: {self.size_before / 1024 ** 2:.1f} MiB -> "
+            f"{self.size_after / 1024 ** 2:.1f} MiB"
+        )
+
+
+def _relation_size(con: Connection) -> int:
+    return con.execute(
+        select([func.pg_total_relation_size(WeatherForecastAtAltitudeTable.fullname)])
+    ).scalar()
+
+
+def _compact_batch(con: Connection, batch: List, report: CompactReport) -> None:
+    records = [r.br_id for r in batch]
+    wf_ids: Dict[UUID, Dict] = defaultdict(dict)
+    for wf in con.execute(
+        select(
+            [
+                WeatherForecastTable.c.wf_id,
+                WeatherForecastTable.c.wf_bra_record,
+                WeatherForecastTable.c.wf_expected_date,
+            ]
+        ).where(WeatherForecastTable.c.wf_bra_record.in_(records))
+    ):
+        wf_ids[wf.wf_bra_record][wf.wf_expected_date] = wf.wf_id
+    if not wf_ids:
+        return
+    stored = dict(
+        con.execute(
+            select(
+                [
+                    WeatherForecastAtAltitudeTable.c.wfaa_wf_id,
+                    func.count(),
+                ]
+            )
+            .where(
+                WeatherForecastAtAltitudeTable.c.wfaa_wf_id.in_(
+                    [i for by_date in wf_ids.values() for i in by_date.values()]
+                )
+            )
+            .group_by(WeatherForecastAtAltitudeTable.c.wfaa_wf_id)
+        ).fetchall()
+    )
+    to_fix = set()
+    winds = list()
+    for record in batch:
+        expected = extract_winds(record.br_raw_xml, wf_ids[record.br_id])
+        count: Dict[UUID, int] = defaultdict(int)
+        for w in expected:
+            count[w["wfaa_wf_id"]] += 1
+        for wf_id in wf_ids[record.br_id].values():
+            if stored.get(wf_id, 0) != count[wf_id]:
+                to_fix.add(wf_id)
+        winds += [w for w in expected if w["wfaa_wf_id"] in to_fix]
+    if not to_fix:
+        return
+    deleted = con.execute(
+        WeatherForecastAtAltitudeTable.delete().where(
+            WeatherForecastAtAltitudeTable.c.wfaa_wf_id.in_(list(to_fix))
+        )
+    )
+    if winds:
+        con.execute(insert(WeatherForecastAtAltitudeTable), winds)
+    report.forecasts_fixed += len(to_fix)
+    report.rows_deleted += deleted.rowcount
+    report.rows_inserted += len(winds)
+
+
+def compact_wind_forecast(
+    con: Connection, batch_size: int = 500, vacuum: bool = False
+) -> CompactReport:
+    """
+    Before, every forecast of a bulletin got the winds of all the forecasts of the bulletin. Recompute the winds of
+    each forecast from the stored xml and replace the stored rows when they differ.
+
+    Bulletins are read by batch of `batch_size`, ordered by id (keyset pagination), one transaction per batch. Running
+    it twice is a no-op. Deleted rows only free space after a vacuum, `vacuum` runs a `VACUUM FULL` (it locks the table)
+    and the report gets the size of the table before and after it.
+    """
+    report = CompactReport()
+    last_id: Optional[UUID] = None
+    while True:
+        q = (
+            select([BraRecordTable.c.br_id, BraRecordTable.c.br_raw_xml])
+            .order_by(BraRecordTable.c.br_id)
+            .limit(batch_size)
+        )
+        if last_id:
+            q = q.where(BraRecordTable.c.br_id > last_id)
+        batch = con.execute(q).fetchall()
+        if not batch:
+            break
+        with con.begin():
+            _compact_batch(con, batch, report)
+        report.records += len(batch)
+        last_id = batch[-1].br_id
+        log.info(f"{report.records} bulletins checked")
+    if vacuum:
+        report.size_before = _relation_size(con)
+        con.execution_options(isolation_level="AUTOCOMMIT").execute(
+            text(f"VACUUM FULL {WeatherForecastAtAltitudeTable.fullname}")
+        )
+        report.size_after = _relation_size(con)
+    return report
@@ -1,39 +1,63 @@
 import io
 import logging
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
 from json import JSONDecodeError
-from typing import Dict, Tuple
-import geojson
-import requests
+from typing import Dict, Tuple, Set, Optional, List
 import lxml.etree as ET
 from copy import deepcopy
 from geoalchemy2 import WKBElement
 from geoalchemy2.shape import from_shape
-from pkg_resources import resource_stream
-from requests import HTTPError
-from shapely.geometry import shape
-from sqlalchemy import select, and_, exists
+from sqlalchemy import select, and_, exists, cast, Date
 from sqlalchemy.engine import Connection
 
+from nivo_api.cli.bra_record_helper.geometry import (
+    MassifGeometryIndex,
+    get_massif_geometry_index,
+)
 from nivo_api.core.db.models.sql.bra import BraRecordTable, MassifTable
+from nivo_api.core.http import get_http_client
+from nivo_api.core.profiling import stage
 from nivo_api.settings import Config
 
 log = logging.getLogger(__name__)
 
 
+class BraListMissing(AssertionError):
+    """
+    Meteofrance has no bra list for this day (302). Any other failure to get it, including a list missing from a
+    mirror (404), is a plain AssertionError.
+    """
+
+
 def get_bra_date(bra_date: date) -> Dict[str, datetime]:
     """
     return, for all massifs, the exact date for bra. in order to download it.
     """
     bra_date_str = bra_date.strftime("%Y%m%d")
-    res = requests.get(
-        Config.BRA_BASE_URL + f"/bra.{bra_date_str}.json", allow_redirects=False
-    )
+    with stage("fetch") as fetch:
+        res = get_http_client().get(
+            Config.BRA_BASE_URL + f"/bra.{bra_date_str}.json", allow_redirects=False
+        )
+        fetch.bytes += len(res.content)
+    if res.status_code == 302:
+        raise BraListMissing(f"Bra list does not exist for {bra_date}")
     if res.status_code != 200:
-        raise AssertionError(f"Bra list does not exist for {bra_date}")
+        raise AssertionError(
+            f"Cannot get the bra list for {bra_date}, status: {res.status_code}"
+        )
+    try:
+        return parse_bra_list(res.json())
+    except JSONDecodeError as e:
+        log.critical("Decoding of the json failed, I probably doesn't exist")
+        raise e
+
+
+def parse_bra_list(massifs_json: List[Dict]) -> Dict[str, datetime]:
+    """
+    massif -> date of its last bulletin, from a `bra.<date>.json`.
+    """
     try:
-        massifs_json = res.json()
         # special case. haut-var/haut-verdn has a character missmatch between bra.<date>.json and the bra xml file.
         def cleanup_json(massif: Dict):
             if massif["massif"] == "HAUT-VAR_HAUT-VERDON":
@@ -50,9 +74,6 @@ def get_bra_date(bra_date: date) -> Dict[str, datetime]:
 
         massif_dict = dict(map(merge_massifs, massifs_json))
         return massif_dict
-    except JSONDecodeError as e:
-        log.critical("Decoding of the json failed, I probably doesn't exist")
-        raise e
     except (KeyError, TypeError):
         raise ValueError("JSON provided is malformed. Cannot parse")
 
@@ -65,23 +86,35 @@ def get_last_bra_date() -> Dict[str, datetime]:
     return get_bra_date(today)
 
 
-def get_bra_xml(massif: str, bra_date: datetime) -> ET:
+def bra_xml_name(massif: str, bra_date: datetime) -> str:
     bra_date_str = bra_date.strftime("%Y%m%d%H%M%S")
     # massif named "HAUT-VAT/HAUT-VERDON" doesn't work that way in the URL...
     massif = massif.replace("/", "_")
-    url = Config.BRA_BASE_URL + f"/BRA.{massif}.{bra_date_str}.xml"
+    return f"BRA.{massif}.{bra_date_str}.xml"
+
+
+def get_bra_xml_bytes(massif: str, bra_date: datetime) -> bytes:
+    url = Config.BRA_BASE_URL + "/" + bra_xml_name(massif, bra_date)
     # meteofrance way of saying 404 is by redirecting you (302) to the 404 page, which is served with a 200 status...
     # so 302 means 404
-    r = requests.get(url, allow_redirects=False)
+    with stage("fetch") as fetch:
+        r = get_http_client().get(url, allow_redirects=False)
+        fetch.bytes += len(r.content)
     if r.status_code != 200:
         raise AssertionError(
             f"The bra for the massif {massif} at day {bra_date} doesn't exist, status: {r.status_code}"
         )
+    return r.content
+
+
+def get_bra_xml(massif: str, bra_date: datetime) -> ET:
     # we could pass the url directly. But mocking in test would be more tricky. Using requests lib helps.
-    return ET.parse(io.BytesIO(r.content))
+    return ET.parse(io.BytesIO(get_bra_xml_bytes(massif, bra_date)))
 
 
-def get_massif_geom(massif: str) -> WKBElement:
+def get_massif_geom(
+    massif: str, index: Optional[MassifGeometryIndex] = None
+) -> WKBElement:
     """process to get the massifs geometries:
      * go on the meteofrance bra website
      * then get the html "area" element
@@ -92,13 +125,11 @@ def get_massif_geom(massif: str) -> WKBElement:
     * swap X and Y coordinates (with plugin)
     * use grass v.transform with various x, y scale and rotation until you get what you want.
     """
-    with resource_stream("nivo_api", "cli/data/all_massifs.geojson") as fp:
-        gj = geojson.load(fp)
-    for obj in gj.features:
-        if obj.properties["label"].upper() == massif.upper():
-            return from_shape(shape(obj.geometry), 4326)
-    else:
+    index = index or get_massif_geometry_index()
+    geom = index.get(massif)
+    if geom is None:
         raise ValueError(f"Massif {massif} geometry cannot be found.")
+    return from_shape(geom, 4326)
 
 
 def check_bra_record_exist(con: Connection, massif: str, bra_date: datetime) -> bool:
@@ -117,3 +148,49 @@ def check_bra_record_exist(con: Connection, massif: str, bra_date: datetime) ->
         )
     )
     return con.execute(select([exists(s)])).first()[0]
+
+
+class BraIngestedIndex:
+    """
+    In memory index of the BRA already in db, loaded with one query. It replaces a `check_bra_record_exist` call (one
+    query) per massif and per date during big imports.
+
+    Bulletins are marked as soon as they are scheduled for download, not once persisted, so a bulletin listed in two
+    consecutive bra.<date>.json is fetched once.
+    """
+
+    def __init__(self, con: Connection, start: Optional[date] = None) -> None:
+        s = select(
+            [MassifTable.c.m_name, BraRecordTable.c.br_production_date]
+        ).select_from(
+            BraRecordTable.join(
+                MassifTable, MassifTable.c.m_id == BraRecordTable.c.br_massif
+            )
+        )
+        if start:
+            s = s.where(cast(BraRecordTable.c.br_production_date, Date) >= start)
+        self._bulletins: Set[Tuple[str, datetime]] = set()
+        self._massifs_by_day: Dict[date, Set[str]] = dict()
+        for row in con.execute(s):
+            self.add(row.m_name, row.br_production_date)
+        self._massifs = {r.m_name for r in con.execute(select([MassifTable.c.m_name]))}
+        log.debug(f"{len(self._bulletins)} bra already in db")
+
+    def __contains__(self, bulletin: Tuple[str, datetime]) -> bool:
+        return bulletin in self._bulletins
+
+    def __len__(self) -> int:
+        return len(self._bulletins)
+
+    def add(self, massif: str, bra_date: datetime) -> None:
+        self._bulletins.add((massif, bra_date))
+        self._massifs_by_day.setdefault(bra_date.date(), set()).add(massif)
+
+    def is_day_complete(self, day: date) -> bool:
+        """
+        every massif of the db already have a bra produced this day. Then downloading the list for this day is useless.
+        Current and previous days are never complete: an amended bra may still be published.
+        """
+        if not self._massifs or day >= date.today() - timedelta(days=1):
+            return False
+        return self._massifs <= self._massifs_by_day.get(day, set())
@@ -1,5 +1,5 @@
 import logging
-from typing import Generator, Dict, List
+from typing import Generator, Dict, List, Tuple, Any, Callable, Optional
 from uuid import UUID
 
 from sqlalchemy import select
@@ -7,7 +7,10 @@ from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.engine import Connection
 
 from nivo_api.cli.bra_record_helper.miscellaneous import get_massif_geom
+from nivo_api.cli.bra_record_helper.reference import get_reference_cache
+from nivo_api.core.db.copy import copy_rows
 from nivo_api.core.db.models.sql.bra import MassifTable, DepartmentTable, ZoneTable
+from nivo_api.core.profiling import stage
 
 log = logging.getLogger(__name__)
 
@@ -33,32 +36,138 @@ def persist_bra(con: Connection, bra: List[Dict]):
                     con.execute(insert(e), data)
 
 
+class BraBatchWriter:
+    """
+    Accumulate processed bulletins (what `process_xml` returns) and write them by batch of `batch_size`: one
+    transaction and one COPY per table for the whole batch, instead of one transaction and 7 inserts per bulletin.
+
+    If a batch fails, its bulletins are written again one by one with `persist_bra`, so only the bad ones are lost.
+    Use it as a context manager, the last (incomplete) batch is written at exit.
+
+    `on_result(key, error)` is called for each bulletin once it's written (error is None) or failed.
+    """
+
+    def __init__(
+        self,
+        con: Connection,
+        batch_size: int = 50,
+        on_result: Optional[Callable[[Any, Optional[Exception]], None]] = None,
+    ) -> None:
+        self.con = con
+        self.batch_size = max(batch_size, 1)
+        self.on_result = on_result
+        self.persisted = 0
+        self.failed: List[Any] = list()
+        self._pending: List[Tuple[Any, List[Dict]]] = list()
+
+    def __enter__(self) -> "BraBatchWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        if exc_type is None:
+            self.flush()
+
+    def add(self, key: Any, bra: List[Dict]) -> None:
+        """
+        `key` identify the bulletin in logs, in `failed` and for `on_result`.
+        """
+        # generators can only be read once, and a failed batch is written again.
+        rows = [
+            {table: [data] if isinstance(data, dict) else [x for x in data if x]}
+            for entities in bra
+            for table, data in entities.items()
+        ]
+        self._pending.append((key, rows))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def _copy_batch(self) -> None:
+        # tables are loaded in the order of `process_xml` (record first), foreign keys are fine.
+        rows_by_table: Dict[Any, List[Dict]] = dict()
+        for _, bra in self._pending:
+            for entities in bra:
+                for table, data in entities.items():
+                    rows_by_table.setdefault(table, list()).extend(x for x in data if x)
+        with stage("persist") as persist, self.con.begin():
+            for table, rows in rows_by_table.items():
+                persist.rows += copy_rows(self.con, table, rows)
+
+    def _done(self, key: Any, error: Optional[Exception] = None) -> None:
+        if error:
+            self.failed.append(key)
+        else:
+            self.persisted += 1
+        if self.on_result:
+            self.on_result(key, error)
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        try:
+            self._copy_batch()
+        except Exception as e:
+            log.warning(
+                f"batch of {len(self._pending)} bulletins failed, persisting them one by one"
+            )
+            log.debug(e)
+            for key, bra in self._pending:
+                try:
+                    with stage("persist"):
+                        persist_bra(self.con, bra)
+                except Exception as e:
+                    log.debug(e)
+                    log.critical(f"an error occured when persisting bulletin {key}")
+                    self._done(key, e)
+                else:
+                    self._done(key)
+        else:
+            for key, _ in self._pending:
+                self._done(key)
+        finally:
+            self._pending = list()
+        log.info(f"{self.persisted} bulletins persisted")
+
+
 def persist_zone(con: Connection, zone: str) -> UUID:
+    cache = get_reference_cache(con)
+    zone_id = cache.zone_id(con, zone)
+    if zone_id:
+        return zone_id
     ins = insert(ZoneTable).values(z_name=zone)
     ins = ins.on_conflict_do_nothing(index_elements=["z_name"])
     con.execute(ins)
     res = select([ZoneTable.c.z_id]).where(ZoneTable.c.z_name == zone)
-    return con.execute(res).first().z_id
+    cache.zones[zone] = con.execute(res).first().z_id
+    return cache.zones[zone]
 
 
 def persist_department(con: Connection, name: str, number: str, zone: str) -> UUID:
+    cache = get_reference_cache(con)
+    dept_id = cache.department_id(con, name)
+    if dept_id:
+        return dept_id
     zone_id = persist_zone(con, zone)
     ins = insert(DepartmentTable).values(d_name=name, d_number=number, d_zone=zone_id)
     ins = ins.on_conflict_do_nothing(index_elements=["d_name"])
     con.execute(ins)
     res = select([DepartmentTable.c.d_id]).where(DepartmentTable.c.d_name == name)
-    return con.execute(res).first().d_id
+    cache.departments[name] = con.execute(res).first().d_id
+    return cache.departments[name]
 
 
 def persist_massif(con: Connection, name: str, department: Dict, zone: str) -> UUID:
+    cache = get_reference_cache(con)
     dept = persist_department(con, department["name"], department["number"], zone)
+    if name in cache.massifs:
+        return cache.massifs[name]
     try:
         geom = get_massif_geom(name)
         ins = insert(MassifTable).values(m_name=name, m_department=dept, the_geom=geom)
         ins = ins.on_conflict_do_nothing(index_elements=["m_name"])
         con.execute(ins)
         res = select([MassifTable.c.m_id]).where(MassifTable.c.m_name == name)
-        return con.execute(res).first().m_id
+        cache.massifs[name] = con.execute(res).first().m_id
+        return cache.massifs[name]
 
     except ValueError as e:
         # get massif may fail with unknown massif.
@@ -0,0 +1,111 @@
+"""
+Reference data (zones, departments, massifs) cached in memory. They are a few dozen rows which almost never change, but
+every bulletin processed needs the id of its massif.
+"""
+import logging
+import threading
+from typing import Dict, Optional, Set
+from uuid import UUID
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import select
+from sqlalchemy.engine import Connection, Engine
+
+from nivo_api.core.db.models.sql.bra import ZoneTable, DepartmentTable, MassifTable
+
+log = logging.getLogger(__name__)
+
+
+def massif_name_variants(massif: str):
+    """
+    Name of a massif is not always the same between the xml, the bra list and massifs.json:
+    * Orlu St Barthelemy is "ORLU__ST_BARTHELEMY" in db but "ORLU  ST BARTHELEMY" in the xml.
+    * Haut-var/Haut-Verdon is "HAUT-VAR/HAUT-VERDON" in db but "HAUT-VAR_HAUT-VERDON" in the bra list.
+    """
+    yield massif
+    yield massif.replace(" ", "_")
+    yield massif.replace("_", "/")
+
+
+class BraReferenceCache:
+    """
+    name -> id of zones, departments and massifs. Loaded in one go at first use, then kept for the life of the
+    process. Call `refresh` after writing reference data from somewhere else.
+
+    An unknown massif reloads the tables once (it may have been imported by another process), then it's remembered as
+    missing until the next `refresh`: a backfill full of bulletins of an unknown massif doesn't reload them for each.
+    """
+
+    def __init__(self) -> None:
+        self.zones: Dict[str, UUID] = dict()
+        self.departments: Dict[str, UUID] = dict()
+        self.massifs: Dict[str, UUID] = dict()
+        self._missing: Set[str] = set()
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def refresh(self, con: Connection) -> None:
+        with self._lock:
+            self.zones = {
+                r.z_name: r.z_id
+                for r in con.execute(select([ZoneTable.c.z_name, ZoneTable.c.z_id]))
+            }
+            self.departments = {
+                r.d_name: r.d_id
+                for r in con.execute(
+                    select([DepartmentTable.c.d_name, DepartmentTable.c.d_id])
+                )
+            }
+            self.massifs = {
+                r.m_name: r.m_id
+                for r in con.execute(select([MassifTable.c.m_name, MassifTable.c.m_id]))
+            }
+            self._missing = set()
+            self._loaded = True
+        log.debug(
+            f"reference data loaded: {len(self.zones)} zones, {len(self.departments)} departments, "
+            f"{len(self.massifs)} massifs"
+        )
+
+    def _ensure_loaded(self, con: Connection) -> None:
+        if not self._loaded:
+            self.refresh(con)
+
+    def _find_massif(self, massif: str) -> Optional[UUID]:
+        for name in massif_name_variants(massif):
+            if name in self.massifs:
+                return self.massifs[name]
+        return None
+
+    def massif_id(self, con: Connection, massif: str) -> UUID:
+        self._ensure_loaded(con)
+        m_id = self._find_massif(massif)
+        if m_id is None and massif not in self._missing:
+            # maybe imported by another process since we loaded the cache.
+            self.refresh(con)
+            m_id = self._find_massif(massif)
+            if m_id is None:
+                self._missing.add(massif)
+        if m_id is None:
+            raise ValueError(f"Cannot found massif {massif} in the db")
+        return m_id
+
+    def zone_id(self, con: Connection, zone: str) -> Optional[UUID]:
+        self._ensure_loaded(con)
+        return self.zones.get(zone)
+
+    def department_id(self, con: Connection, department: str) -> Optional[UUID]:
+        self._ensure_loaded(con)
+        return self.departments.get(department)
+
+
+# one cache per engine, so two databases (or a database dropped and recreated in tests) never share ids.
+_caches: "WeakKeyDictionary[Engine, BraReferenceCache]" = WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def get_reference_cache(con: Connection) -> BraReferenceCache:
+    with _caches_lock:
+        if con.engine not in _caches:
+            _caches[con.engine] = BraReferenceCache()
+        return _caches[con.engine]
@@ -1,6 +1,12 @@
+import logging
+
+from nivo_api.cli.nivo_partition import create_season_partitions
 from nivo_api.core.db.connection import metadata, create_database_connections
+from sqlalchemy import inspect
 from sqlalchemy.engine import Engine
-from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.exc import ProgrammingError, IntegrityError
+
+log = logging.getLogger(__name__)
 
 
 def is_postgis_installed(engine: Engine) -> bool:
@@ -11,8 +17,32 @@ def is_postgis_installed(engine: Engine) -> bool:
         return False
 
 
+def create_missing_indexes(engine: Engine) -> None:
+    """
+    `create_all` only creates the indexes of the tables it creates. Add the indexes declared after a table was created.
+    """
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        if not engine.has_table(table.name, schema=table.schema):
+            continue
+        existing = {
+            i["name"] for i in inspector.get_indexes(table.name, schema=table.schema)
+        }
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(engine)
+            except IntegrityError:
+                # unique index on a table with duplicates, they must be cleaned first.
+                log.warning(
+                    f"Cannot create the unique index {index.name}, {table.fullname} has duplicates. "
+                    f"Run dedup_nivo_records."
+                )
+
+
 def create_schema_and_table(drop: bool) -> None:
-    schema = ["bra", "nivo", "flowcapt"]
+    schema = ["bra", "nivo", "flowcapt", "ingest"]
     db_con = create_database_connections()
     if not is_postgis_installed(db_con.engine):
         db_con.engine.execute("CREATE EXTENSION postgis")
@@ -23,3 +53,6 @@ def create_schema_and_table(drop: bool) -> None:
 
     [db_con.engine.execute(f"CREATE SCHEMA IF NOT EXISTS {s}") for s in schema]
     metadata.create_all(db_con.engine)
+    create_missing_indexes(db_con.engine)
+    with db_con.engine.connect() as con:
+        create_season_partitions(con)
@@ -1,27 +1,35 @@
-import json
+import functools
 import sys
+import threading
 from contextlib import contextmanager
 from datetime import datetime, date, timedelta
+from typing import Optional
 
 import click
 import geojson
-import requests
 from pkg_resources import resource_stream
 from requests import HTTPError
-from sqlalchemy import func, select
+from sqlalchemy import create_engine
 
+from nivo_api.cli.bra_record_helper.backfill import (
+    BraFetcher,
+    BackfillReport,
+    BraDayJournal,
+)
+from nivo_api.cli.bra_record_helper.maintenance import compact_wind_forecast
 from nivo_api.cli.bra_record_helper.miscellaneous import (
-    get_bra_xml,
     get_bra_date,
-    check_bra_record_exist
+    BraIngestedIndex,
 )
-from nivo_api.cli.bra_record_helper.persist import persist_bra, persist_massif
-from nivo_api.cli.bra_record_helper.process import process_xml
+from nivo_api.cli.bra_record_helper.persist import persist_massif, BraBatchWriter
+from nivo_api.cli.bra_record_helper.process import process_rows
+from nivo_api.cli.bra_record_helper.reference import get_reference_cache
 from nivo_api.cli.database import create_schema_and_table
+from nivo_api.cli.ingest_journal import IngestJournal
+from nivo_api.cli.mirror import Mirror, use_source_dir
 
 import logging
 import logging.config
-from sqlalchemy.dialects.postgresql import insert
 
 from nivo_api.cli.flowcapt_record_helper import persist_flowcapt_station
 from nivo_api.cli.nivo_record_helper import (
@@ -30,10 +38,25 @@ from nivo_api.cli.nivo_record_helper import (
     check_nivo_doesnt_exist,
     get_last_nivo_date,
     get_all_nivo_date,
+    get_nivo_sensor_station_ids,
+    NivoDate,
+    NivoIngestedIndex,
+    NivoFetcher,
+    NivoImportReport,
+    upsert_nivo_sensor_stations,
 )
+from nivo_api.cli import nivo_record_helper, nivo_partition, nivo_rollup
+from nivo_api.cli import ingest_daemon as ingest_daemon_helper
+from nivo_api.cli.nivo_partition import create_season_partitions, archive_season
 from nivo_api.core.db.connection import connection_scope, create_database_connections
 from nivo_api.core.db.models.sql.bra import DepartmentTable
-from nivo_api.core.db.models.sql.nivo import SensorStationTable
+from nivo_api.core.db.models.sql.ingest import IngestStatus
+from nivo_api.core.http import (
+    get_http_client,
+    configure_http_client,
+    get_http_cache,
+)
+from nivo_api.core.profiling import profile, stage, add_stage
 from nivo_api.settings import Config
 
 logging.basicConfig(level=Config.LOG_LEVEL)
@@ -52,7 +75,32 @@ def time_elapsed():
     click.echo(f"The command took {t2.seconds}s to execute ")
 
 
+def profile_option(f):
+    """
+    `--profile` and `--profile-pstats` options: profile the stages of the command (see `nivo_api.core.profiling`).
+    """
+
+    @click.option(
+        "--profile",
+        "profile_path",
+        type=click.Path(dir_okay=False, allow_dash=True),
+        help="Write a json summary of the time, bytes, rows and db round trips per stage to this file (- for stdout)",
+    )
+    @click.option(
+        "--profile-pstats",
+        type=click.Path(dir_okay=False),
+        help="Write the cProfile stats of the command (main thread) to this file",
+    )
+    @functools.wraps(f)
+    def wrapper(*args, profile_path, profile_pstats, **kwargs):
+        with profile(f.__name__, profile_path, profile_pstats):
+            return f(*args, **kwargs)
+
+    return wrapper
+
+
 @click.command()
+@profile_option
 def import_last_nivo_data():
     # setup
     # get http://donneespubliques.meteofrance.fr/donnees_libres/Txt/Nivo/lastNivo.js
@@ -61,74 +109,123 @@ def import_last_nivo_data():
     # import it.
     db = create_database_connections().engine
     with connection_scope(db) as con:
+        # a new season starts with a new partition
+        create_season_partitions(con)
         last_nivo = get_last_nivo_date()
         if check_nivo_doesnt_exist(con, last_nivo.nivo_date):
-            downloaded_nivo = download_nivo(last_nivo, con)
-            import_nivo(con, downloaded_nivo)
+            with download_nivo(last_nivo, con) as downloaded_nivo:
+                import_nivo(con, downloaded_nivo)
+
+
+retry_failed_option = click.option(
+    "--retry-failed",
+    is_flag=True,
+    help="Import again what failed in a previous run (what is done is never imported again)",
+)
+source_dir_option = click.option(
+    "--source-dir",
+    type=click.Path(exists=True),
+    help="Read the meteofrance files from a mirror (directory or tarball made by the `mirror` command)",
+)
+# first day with a bra list
+BRA_START_DATE = date(year=2016, month=3, day=10)
 
 
 @click.command()
-def import_all_nivo_data():
+@click.option(
+    "--jobs",
+    default=4,
+    show_default=True,
+    help="Number of concurrent downloads",
+)
+@retry_failed_option
+@source_dir_option
+@profile_option
+@time_elapsed()
+def import_all_nivo_data(jobs, retry_failed, source_dir):
     # setup
     # download from 2010 to now
-    # download all file (via http, better)
+    # download all file (via http, better), concurrently
     # process it
-    # import it
+    # import it, one file at a time
+    if source_dir:
+        use_source_dir(source_dir)
     all_nivo_date = get_all_nivo_date()
     log.info(f"Need to process {len(all_nivo_date)}")
     db = create_database_connections().engine
-    with connection_scope(db) as con:
-        for nivo_date in all_nivo_date:
-            if check_nivo_doesnt_exist(con, nivo_date.nivo_date):
-                try:
+    report = NivoImportReport()
+    with connection_scope(db) as con, IngestJournal(
+        db, "import_all_nivo_data", retry_failed
+    ) as journal, NivoFetcher(jobs) as fetcher:
+        create_season_partitions(con)
+        stations = get_nivo_sensor_station_ids(con)
+        ingested = NivoIngestedIndex(con)
+
+        def is_recent(nivo_date: NivoDate) -> bool:
+            # the last days can still be published or completed, always try them.
+            return nivo_date.nivo_date >= date.today() - timedelta(days=1)
+
+        to_fetch = (
+            nivo_date
+            for nivo_date in all_nivo_date
+            if (
+                is_recent(nivo_date)
+                or journal.should_process(NivoDate.SOURCE, nivo_date.journal_key)
+            )
+            and nivo_date.nivo_date not in ingested
+        )
+        for nivo_date, future in fetcher.files(to_fetch, con, stations):
+            try:
+                with journal.track(NivoDate.SOURCE, nivo_date.journal_key) as item:
                     log.info(
                         f"Processing for {nivo_date.nivo_date.strftime('%d-%m-%Y')}"
                     )
-                    downloaded_nivo = download_nivo(nivo_date, con)
-                    import_nivo(con, downloaded_nivo)
-                except Exception as e:
-                    click.echo("Something bad append")
-                    log.debug(e)
+                    try:
+                        downloaded_nivo = fetcher.result(future)
+                    except HTTPError as e:
+                        # 302, meteofrance has no file for this date.
+                        if (
+                            is_recent(nivo_date)
+                            or e.response is None
+                            or e.response.status_code != 302
+                        ):
+                            raise
+                        item.status = IngestStatus.SKIPPED
+                        log.info(f"No nivo for {nivo_date.journal_key}")
+                        continue
+                    with downloaded_nivo:
+                        downloaded_nivo.fetch_and_parse()
+                        item.rows = import_nivo(con, downloaded_nivo)
+                    item.bytes = downloaded_nivo.size
+                    report.add(downloaded_nivo)
+            except Exception as e:
+                report.failed += 1
+                click.echo("Something bad append")
+                log.debug(e)
+        report.timings["wait"] = fetcher.waited
+    click.echo(str(report))
+    _echo_http_stats()
 
 
 @click.command()
-def import_nivo_sensor_station():
-    # this need refactor
-    res = requests.get(f"{Config.METEO_FRANCE_NIVO_BASE_URL}/postesNivo.json")
-    res.raise_for_status()
-    db = create_database_connections().engine
-    with connection_scope(db) as con:
-        with con.begin():
-            for feature in res.json()["features"]:
-                pointz = feature["geometry"]
-                pointz["coordinates"].append(int(feature["properties"]["Altitude"]))
-                mf_id = (
-                    feature["properties"]["ID"]
-                    if feature["properties"]["ID"] != ""
-                    else None
-                )
-                ins = (
-                    insert(SensorStationTable)
-                    .values(
-                        **{
-                            "nss_name": feature["properties"]["Nom"],
-                            "nss_meteofrance_id": mf_id,
-                            "the_geom": func.ST_SetSRID(
-                                func.ST_GeomFromGeoJSON(json.dumps(pointz)), 4326
-                            ),
-                        }
-                    )
-                    .on_conflict_do_nothing(index_elements=["nss_name"])
-                )
-                con.execute(ins)
-        inserted = (
-            con.execute(
-                select([func.count(SensorStationTable.c.nss_id).label("count")])
-            )
-            .first()
-            .count
+@source_dir_option
+@profile_option
+def import_nivo_sensor_station(source_dir):
+    if source_dir:
+        use_source_dir(source_dir)
+    with stage("fetch") as fetch:
+        res = get_http_client().get(
+            f"{Config.METEO_FRANCE_NIVO_BASE_URL}/postesNivo.json"
         )
-        click.echo(f"{inserted} sensor station imported")
+        res.raise_for_status()
+        fetch.bytes += len(res.content)
+    with stage("parse"):
+        features = res.json()["features"]
+    db = create_database_connections().engine
+    with connection_scope(db) as con, stage("persist") as persist:
+        report = upsert_nivo_sensor_stations(con, features)
+        persist.rows += report.inserted + report.updated
+    click.echo(str(report))
 
 
 @click.command()
@@ -156,70 +253,281 @@ def import_last_bra():
     #             log.debug(e)
 
 
+def _persist_fetched_bra(
+    con,
+    fetched_bra,
+    report: BackfillReport,
+    batch_size: int,
+    days: Optional[BraDayJournal] = None,
+) -> None:
+    """
+    Persist bulletins in the order they were scheduled, by batch. Fetch errors are raised by `future.result()` and
+    handled as any other error. `days` is told the outcome of each bulletin.
+    """
+    days = days or BraDayJournal(None)
+    with BraBatchWriter(con, batch_size, on_result=days.bulletin_done) as writer:
+        for massif, m_date, rows_future in fetched_bra:
+            try:
+                with stage("wait"):
+                    rows = rows_future.result()
+                for name, (wall, cpu) in rows.timings.items():
+                    add_stage(name, wall, cpu)
+                days.downloaded((massif, m_date), rows.size)
+                with stage("fk_resolve"):
+                    entities = process_rows(con, rows)
+                writer.add((massif, m_date), entities)
+                click.echo(f"Processed {massif.capitalize()}")
+            except Exception as e:
+                report.failed += 1
+                days.bulletin_done((massif, m_date), e)
+                log.debug(e, exc_info=sys.exc_info())
+                log.critical(
+                    f"an error occured when processing massif {massif} for date {m_date}"
+                )
+    report.persisted += writer.persisted
+    report.failed += len(writer.failed)
+
+
+jobs_option = click.option(
+    "--jobs",
+    default=8,
+    show_default=True,
+    help="Number of concurrent downloads",
+)
+workers_option = click.option(
+    "--workers",
+    default=0,
+    show_default=True,
+    help="Number of processes parsing the xml. 0 parse them in the main process",
+)
+batch_size_option = click.option(
+    "--batch-size",
+    default=50,
+    show_default=True,
+    help="Number of bulletins written per transaction",
+)
+per_host_option = click.option(
+    "--per-host",
+    default=4,
+    show_default=True,
+    help="Maximum number of concurrent requests to the same host",
+)
+
+
+def _echo_http_stats() -> None:
+    stats = get_http_client().stats
+    click.echo(
+        f"{stats.requests} http requests, {stats.bytes / 1024 ** 2:.1f} MiB downloaded, "
+        f"{stats.latency:.1f}s cumulated latency"
+    )
+
+
 @click.command()
 @click.argument("bra_date", type=click.DateTime(["%Y-%m-%d"]))  # type: ignore
+@jobs_option
+@per_host_option
+@batch_size_option
+@workers_option
+@source_dir_option
+@profile_option
 @time_elapsed()
-def import_bra(bra_date):
+def import_bra(bra_date, jobs, per_host, batch_size, workers, source_dir):
     """
     * setup
     * request https://donneespubliques.meteofrance.fr/donnees_libres/Pdf/BRA/bra.%Y%m%d.json with all the date from december 2016 to today
     * if not 302 (302 means 404 at meteofrance 😭)
-    * for all the date in all the json, download the xml of bra
+    * for all the date in all the json, download the xml of bra (concurrently)
     * process (download + post process)
     * import
     """
+    if source_dir:
+        use_source_dir(source_dir)
+    configure_http_client(per_host=per_host)
     db = create_database_connections().engine
+    report = BackfillReport()
     bra_dates = get_bra_date(bra_date)
-    with connection_scope(db) as con:
-        for massif, m_date in bra_dates.items():
-            try:
-                if not check_bra_record_exist(con, massif, m_date):
-                    xml = get_bra_xml(massif, m_date)
-                    processed_bra = process_xml(con, xml)
-                    persist_bra(con, processed_bra)
-                    click.echo(f"Persist {massif.capitalize()}")
-            except Exception as e:
-                log.debug(e, exc_info=sys.exc_info())
-                log.critical(
-                    f"an error occured when processing massif {massif} for date {m_date}"
-                )
+    with connection_scope(db) as con, BraFetcher(jobs, workers) as fetcher:
+        ingested = BraIngestedIndex(con, start=bra_date.date() - timedelta(days=7))
+        to_fetch = (
+            (massif, m_date)
+            for massif, m_date in bra_dates.items()
+            if (massif, m_date) not in ingested
+        )
+        _persist_fetched_bra(con, fetcher.bulletins(to_fetch), report, batch_size)
+    click.echo(str(report))
+    _echo_http_stats()
 
 
 @click.command()
+@jobs_option
+@per_host_option
+@batch_size_option
+@workers_option
+@retry_failed_option
+@source_dir_option
+@profile_option
 @time_elapsed()
-def import_all_bra():
+def import_all_bra(jobs, per_host, batch_size, workers, retry_failed, source_dir):
     """
-    Same as `import_bra` but we request from March 2016 to now.
+    Same as `import_bra` but we request from March 2016 to now. Days are fetched concurrently, bulletins are persisted
+    in order by a single connection. Each day is recorded in the import journal, an interrupted import resumes where it
+    stopped.
     """
+    if source_dir:
+        use_source_dir(source_dir)
+    configure_http_client(per_host=per_host)
     db = create_database_connections().engine
-    start_date = date(year=2016, month=3, day=10)
+    start_date = BRA_START_DATE
     date_range = [
         date.today() - timedelta(days=x)
         for x in range(0, (date.today() - start_date).days + 1)
     ]
-    for d in date_range:
-        massif = ""
-        try:
-            bra_dates = get_bra_date(d)
-            with connection_scope(db) as con:
+    report = BackfillReport()
+    with connection_scope(db) as con, BraFetcher(
+        jobs, workers
+    ) as fetcher, IngestJournal(db, "import_all_bra", retry_failed) as journal:
+        ingested = BraIngestedIndex(con, start=start_date - timedelta(days=1))
+        click.echo(f"{len(ingested)} bra already imported")
+        days = BraDayJournal(journal)
+
+        def to_fetch():
+            to_index = (
+                d
+                for d in date_range
+                if days.should_fetch(d) and not ingested.is_day_complete(d)
+            )
+            for d, index in fetcher.indexes(to_index):
+                days.start(d)
+                try:
+                    bra_dates = index.result()
+                except Exception as e:
+                    days.index_failed(d, e)
+                    log.debug(e)
+                    log.critical(
+                        f"an error occured when fetching bra list for date {d}"
+                    )
+                    continue
                 for massif, m_date in bra_dates.items():
-                    if not check_bra_record_exist(con, massif, m_date):
-                        xml = get_bra_xml(massif, m_date)
-                        processed_bra = process_xml(con, xml)
-                        persist_bra(con, processed_bra)
-                        click.echo(f"Persist {massif.capitalize()}")
-        except Exception as e:
-            log.debug(e)
-            log.critical(
-                f"an error occured when processing massif {massif} for date {d}"
+                    if (massif, m_date) not in ingested:
+                        ingested.add(massif, m_date)
+                        days.scheduled(d, massif, m_date)
+                        yield massif, m_date
+                days.indexed(d)
+
+        _persist_fetched_bra(
+            con, fetcher.bulletins(to_fetch()), report, batch_size, days
+        )
+    click.echo(str(report))
+    _echo_http_stats()
+
+
+@click.command()
+@click.argument("target_dir", type=click.Path(file_okay=False))
+@click.option(
+    "--only", type=click.Choice(["bra", "nivo"]), help="Only mirror these files"
+)
+@click.option(
+    "--since",
+    type=click.DateTime(["%Y-%m-%d"]),
+    help=f"First day of bra to mirror  [default: {BRA_START_DATE}]",
+)
+@jobs_option
+@per_host_option
+@time_elapsed()
+def mirror(target_dir, only, since, jobs, per_host):
+    """
+    Download the meteofrance files the imports read (bra and nivo) to TARGET_DIR. What is already there and can't
+    change is not downloaded again. Import from it with `--source-dir TARGET_DIR`.
+    """
+    configure_http_client(per_host=per_host)
+    m = Mirror(target_dir, jobs)
+    if only in (None, "bra"):
+        start_date = since.date() if since else BRA_START_DATE
+        m.bra(
+            date.today() - timedelta(days=x)
+            for x in range(0, (date.today() - start_date).days + 1)
+        )
+    if only in (None, "nivo"):
+        m.nivo(get_all_nivo_date())
+    click.echo(str(m.report))
+    _echo_http_stats()
+
+
+@click.command()
+@click.option(
+    "--nivo-interval",
+    default=Config.INGEST_NIVO_INTERVAL,
+    show_default=True,
+    help="Seconds between two polls of lastNivo.js",
+)
+@click.option(
+    "--bra-interval",
+    default=Config.INGEST_BRA_INTERVAL,
+    show_default=True,
+    help="Seconds between two polls of the bra list of the day",
+)
+@click.option(
+    "--jitter",
+    default=Config.INGEST_JITTER,
+    show_default=True,
+    help="Randomize the intervals by this fraction",
+)
+@click.option(
+    "--only", type=click.Choice(["bra", "nivo"]), help="Only poll these files"
+)
+@click.option("--once", is_flag=True, help="Poll once and exit")
+@jobs_option
+@batch_size_option
+def ingest_daemon(nivo_interval, bra_interval, jitter, only, once, jobs, batch_size):
+    """
+    Poll meteofrance and import the new nivo file and bulletins as they are published, until SIGTERM. Replaces cron
+    runs of `import_last_nivo_data` and `import_bra`.
+    """
+    # connections of the pool may outlive a db restart.
+    db = create_engine(Config.DB_URL, pool_pre_ping=True)
+    stop = threading.Event()
+    ingest_daemon_helper.stop_on_signals(stop)
+    pollers = list()
+    if only in (None, "nivo"):
+        pollers.append(
+            (
+                ingest_daemon_helper.NivoPoller(db),
+                ingest_daemon_helper.Schedule(
+                    nivo_interval, jitter, Config.INGEST_MAX_BACKOFF
+                ),
             )
+        )
+    bra_poller = None
+    if only in (None, "bra"):
+        bra_poller = ingest_daemon_helper.BraPoller(db, jobs, batch_size)
+        pollers.append(
+            (
+                bra_poller,
+                ingest_daemon_helper.Schedule(
+                    bra_interval, jitter, Config.INGEST_MAX_BACKOFF
+                ),
+            )
+        )
+    try:
+        ingest_daemon_helper.IngestDaemon(pollers, stop).run(once)
+    finally:
+        if bra_poller:
+            bra_poller.close()
+        db.dispose()
 
 
 @click.command()
-def import_massifs():
-    massif_json = requests.get(Config.BRA_BASE_URL + "/massifs.json").json()
+@source_dir_option
+@profile_option
+def import_massifs(source_dir):
+    if source_dir:
+        use_source_dir(source_dir)
+    with stage("fetch"):
+        massif_json = (
+            get_http_client().get(Config.BRA_BASE_URL + "/massifs.json").json()
+        )
     db = create_database_connections().engine
-    with connection_scope(db) as con:
+    with connection_scope(db) as con, stage("persist"):
         # the 4th element of the massif is useless, and there are no BRA for it.
         for zone in massif_json[:4]:
             for dept in zone["departements"]:
@@ -234,16 +542,105 @@ def import_massifs():
                         )
                     except ValueError:
                         log.warning(f"Do no import massif: {massif}")
+        # other processes (or a running import) may rely on an up to date cache.
+        get_reference_cache(con).refresh(con)
+
+
+@click.command()
+@click.option(
+    "--batch-size",
+    default=500,
+    show_default=True,
+    help="Number of bulletins checked per transaction",
+)
+@click.option(
+    "--vacuum",
+    is_flag=True,
+    help="VACUUM FULL the table at the end to give the space back (locks the table)",
+)
+@time_elapsed()
+def compact_bra_wind(batch_size, vacuum):
+    """
+    Winds at altitude were stored for every forecast of a bulletin instead of only its own. Recompute them from the
+    raw xml and delete the extra rows.
+    """
+    db = create_database_connections().engine
+    with connection_scope(db) as con:
+        report = compact_wind_forecast(con, batch_size, vacuum)
+    click.echo(str(report))
+
+
+@click.command()
+@time_elapsed()
+def dedup_nivo_records():
+    """
+    Records used to be imported again with each import of a file. Keep one record per station and date, then create
+    the unique index the imports rely on.
+    """
+    db = create_database_connections().engine
+    with connection_scope(db) as con:
+        deleted = nivo_record_helper.dedup_nivo_records(con)
+    click.echo(f"{deleted} duplicated nivo records deleted")
 
 
 @click.command()
+@time_elapsed()
+def partition_nivo_records():
+    """
+    Move the nivo records of a database created before the season partitions to a partitioned table. Everything is
+    copied in one transaction, the records can't be written meanwhile.
+    """
+    db = create_database_connections().engine
+    moved = nivo_partition.partition_nivo_records(db)
+    click.echo(f"{moved} nivo records moved to the season partitions")
+
+
+@click.command()
+@time_elapsed()
+def rebuild_nivo_rollups():
+    """
+    Compute the daily and season rollups of all the nivo records. The imports keep them up to date after that.
+    """
+    db = create_database_connections().engine
+    with connection_scope(db) as con:
+        days = nivo_rollup.rebuild_nivo_rollups(con)
+    click.echo(f"{days} daily rollups computed")
+
+
+@click.command()
+@click.argument("season", type=int)
+@click.option(
+    "--tablespace", help="Move the partition of the season to this tablespace"
+)
+@click.option(
+    "--detach",
+    is_flag=True,
+    help="Detach the partition: the season is no longer queried, the table can be dumped and dropped",
+)
+def archive_nivo_season(season, tablespace, detach):
+    """
+    Move the nivo records of SEASON (starting in august of this year) to cheaper storage, or out of the queries.
+    """
+    if not tablespace and not detach:
+        raise click.UsageError("Give --tablespace and/or --detach")
+    db = create_database_connections().engine
+    with connection_scope(db) as con:
+        name = archive_season(con, season, tablespace, detach)
+    click.echo(f"{name} archived")
+
+
+@click.command()
+@profile_option
 def import_flowcapt_station():
     db = create_database_connections().engine
     with connection_scope(db) as con:
         with resource_stream("nivo_api", "cli/data/flowcapt.geojson") as fp:
-            gj = geojson.load(fp)
-            for station in gj.features:
-                persist_flowcapt_station(con, station)
+            with stage("parse"):
+                gj = geojson.load(fp)
+            with stage("persist") as persist:
+                for station in gj.features:
+                    persist_flowcapt_station(con, station)
+                    persist.rows += 1
 
 
 @click.command()
@@ -256,3 +653,37 @@ def init_db(drop):
             "/!\\ Warning /!\\ you specify drop. Your db will be erased before creation"
         )
     create_schema_and_table(drop)
+
+
+@click.group()
+def http_cache():
+    """
+    Inspect and prune the on disk cache of meteofrance responses (enabled with HTTP_CACHE_DIR).
+    """
+    if get_http_cache() is None:
+        click.echo("http cache is disabled, set HTTP_CACHE_DIR to enable it.")
+        sys.exit(1)
+
+
+@http_cache.command("info")
+def http_cache_info():
+    for k, v in get_http_cache().info().items():  # type: ignore
+        click.echo(f"{k}: {v}")
+
+
+@http_cache.command("prune")
+@click.option(
+    "--max-size",
+    type=int,
+    default=None,
+    help="Size (bytes) to prune the cache to. Default to HTTP_CACHE_MAX_SIZE",
+)
+def http_cache_prune(max_size):
+    freed = get_http_cache().prune(max_size)  # type: ignore
+    click.echo(f"{freed} bytes freed")
+
+
+@http_cache.command("clear")
+def http_cache_clear():
+    freed = get_http_cache().clear()  # type: ignore
+    click.echo(f"{freed} bytes freed")
@@ -0,0 +1,204 @@
+"""
+Long running import of the new nivo and bra files, instead of commands spawned by cron.
+
+The daemon keeps its db pool, the http client (keep-alive, cache), the reference caches and the nivo stations in
+memory between two polls. Each poller has its own schedule:
+
+* `NivoPoller` reads `lastNivo.js`, and imports the file of the last date when it changes.
+* `BraPoller` reads the bra list of the day, and imports the bulletins not imported yet.
+
+Intervals are randomized by `jitter` (a fraction of the interval), so polls don't happen in step with other clients. A
+poll that failed is retried after twice the interval, then four times... up to `max_backoff`.
+
+SIGTERM (or SIGINT) stops the daemon between two polls: an import in progress is finished first.
+"""
+import logging
+import random
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy.engine import Engine
+
+from nivo_api.cli.bra_record_helper.backfill import BraFetcher
+from nivo_api.cli.bra_record_helper.miscellaneous import (
+    get_bra_date,
+    BraIngestedIndex,
+    BraListMissing,
+)
+from nivo_api.cli.bra_record_helper.persist import BraBatchWriter
+from nivo_api.cli.bra_record_helper.process import process_rows
+from nivo_api.cli.nivo_partition import create_season_partitions, season_of
+from nivo_api.cli.nivo_record_helper import (
+    check_nivo_doesnt_exist,
+    download_nivo,
+    get_last_nivo_date,
+    get_nivo_sensor_station_ids,
+    import_nivo,
+)
+from nivo_api.core.db.connection import connection_scope
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Schedule:
+    """
+    Delay before the next poll.
+    """
+
+    interval: float
+    jitter: float = 0.1
+    max_backoff: float = 3600.0
+    # consecutive failed polls
+    failures: int = 0
+
+    def next_delay(self, ok: bool, rnd: Any = random) -> float:
+        if ok:
+            self.failures = 0
+            delay = self.interval
+        else:
+            self.failures += 1
+            delay = min(self.interval * 2**self.failures, self.max_backoff)
+        return delay * rnd.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class NivoPoller:
+    name = "nivo"
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+        # last date imported (or found in db)
+        self.last: Optional[date] = None
+        self.season: Optional[int] = None
+        self.stations: Optional[Dict[int, UUID]] = None
+
+    def poll(self) -> int:
+        """
+        Import the last nivo file if it's new. Return the number of records imported.
+        """
+        nivo_date = get_last_nivo_date()
+        if nivo_date.nivo_date == self.last:
+            return 0
+        imported = 0
+        with connection_scope(self.engine) as con:
+            if self.stations is None:
+                self.stations = get_nivo_sensor_station_ids(con)
+            if season_of(nivo_date.nivo_date) != self.season:
+                create_season_partitions(con)
+                self.season = season_of(nivo_date.nivo_date)
+            if check_nivo_doesnt_exist(con, nivo_date.nivo_date):
+                with download_nivo(nivo_date, con, self.stations) as nivo_csv:
+                    imported = import_nivo(con, nivo_csv)
+        self.last = nivo_date.nivo_date
+        return imported
+
+
+class BraPoller:
+    name = "bra"
+
+    def __init__(self, engine: Engine, jobs: int = 4, batch_size: int = 50) -> None:
+        self.engine = engine
+        self.batch_size = batch_size
+        # its download threads live as long as the daemon.
+        self.fetcher = BraFetcher(jobs)
+        self.ingested: Optional[BraIngestedIndex] = None
+
+    def _done(self, bulletin: Tuple[str, Any], error: Optional[Exception]) -> None:
+        # failed bulletins are not marked, the next poll tries them again.
+        if error is None and self.ingested is not None:
+            self.ingested.add(*bulletin)
+
+    def poll(self, day: Optional[date] = None) -> int:
+        """
+        Import the bulletins of the bra list of `day` (today) not imported yet. Return the number of bulletins
+        persisted.
+        """
+        day = day or date.today()
+        try:
+            bra_dates = get_bra_date(day)
+        except BraListMissing:
+            # no list yet today
+            return 0
+        with connection_scope(self.engine) as con:
+            if self.ingested is None:
+                self.ingested = BraIngestedIndex(con, start=day - timedelta(days=1))
+            new = [b for b in bra_dates.items() if b not in self.ingested]
+            if not new:
+                return 0
+            with BraBatchWriter(con, self.batch_size, on_result=self._done) as writer:
+                for massif, m_date, future in self.fetcher.bulletins(new):
+                    try:
+                        writer.add((massif, m_date), process_rows(con, future.result()))
+                    except Exception as e:
+                        log.debug(e)
+                        log.warning(f"Cannot import the bra of {massif} at {m_date}")
+        return writer.persisted
+
+    def close(self) -> None:
+        self.fetcher.__exit__(None, None, None)
+
+
+class IngestDaemon:
+    """
+    Run `pollers` on their schedule until `stop` is set. Every poller runs once at start.
+    """
+
+    def __init__(
+        self,
+        pollers: List[Tuple[Any, Schedule]],
+        stop: Optional[threading.Event] = None,
+    ) -> None:
+        self.pollers = pollers
+        self.stop = stop or threading.Event()
+
+    def _poll(self, poller: Any) -> bool:
+        t1 = time.perf_counter()
+        try:
+            imported = poller.poll()
+        except Exception as e:
+            log.debug(e, exc_info=True)
+            log.error(f"{poller.name} poll failed: {e}")
+            return False
+        if imported:
+            log.info(
+                f"{poller.name}: {imported} imported in {time.perf_counter() - t1:.1f}s"
+            )
+        return True
+
+    def run(self, once: bool = False) -> None:
+        """
+        With `once`, every poller runs once and it returns.
+        """
+        if once:
+            for poller, _ in self.pollers:
+                self._poll(poller)
+            return
+        due = [time.monotonic()] * len(self.pollers)
+        while not self.stop.is_set():
+            i = min(range(len(self.pollers)), key=lambda p: due[p])
+            delay = due[i] - time.monotonic()
+            if delay > 0 and self.stop.wait(delay):
+                break
+            poller, schedule = self.pollers[i]
+            ok = self._poll(poller)
+            due[i] = time.monotonic() + schedule.next_delay(ok)
+            log.debug(f"next {poller.name} poll in {due[i] - time.monotonic():.0f}s")
+        log.info("ingest daemon stopped")
+
+
+def stop_on_signals(stop: threading.Event) -> None:
+    """
+    Set `stop` on SIGTERM and SIGINT. Must be called from the main thread.
+    """
+
+    def handler(signum: int, frame: Any) -> None:
+        log.info(f"{signal.Signals(signum).name} received, stopping")
+        stop.set()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, handler)
@@ -0,0 +1,154 @@
+"""
+Journal of the import commands (`ingest` schema). Each run of a command is an `ingest.run`, each unit of work (a day of
+bra, a nivo file) an `ingest.item` with its status, timing, size and error. It's what lets a command resume: items
+already done are not imported again, failed ones only with `--retry-failed`.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Generator, Any
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Engine
+
+from nivo_api.core.db.models.sql.ingest import (
+    IngestRunTable,
+    IngestItemTable,
+    IngestStatus,
+)
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestItem:
+    """
+    A unit of work being imported. Set `bytes`, `rows` (and `status` if it's not done) before it's recorded.
+    """
+
+    source: str
+    key: str
+    started_at: datetime = field(default_factory=datetime.now)
+    status: IngestStatus = IngestStatus.DONE
+    bytes: Optional[int] = None
+    rows: Optional[int] = None
+    _t1: float = field(default_factory=time.perf_counter, repr=False)
+
+    @property
+    def duration(self) -> float:
+        return time.perf_counter() - self._t1
+
+
+class IngestJournal:
+    """
+    Use it as a context manager: the run is marked done at exit, or crashed if an exception went through.
+
+    The journal has its own connection, what it writes is kept even if the import transaction is rolled back.
+    """
+
+    def __init__(self, engine: Engine, command: str, retry_failed: bool = False):
+        self.command = command
+        self.retry_failed = retry_failed
+        self.done = 0
+        self.failed = 0
+        self._con = engine.connect()
+        self._status: Dict[str, Dict[str, IngestStatus]] = dict()
+        self.run_id = self._con.execute(
+            insert(IngestRunTable)
+            .values(
+                ir_command=command,
+                ir_started_at=datetime.now(),
+                ir_status=IngestStatus.RUNNING,
+            )
+            .returning(IngestRunTable.c.ir_id)
+        ).scalar()
+
+    def __enter__(self) -> "IngestJournal":
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        self.finish(IngestStatus.CRASHED if exc_type else IngestStatus.DONE)
+
+    def status(self, source: str) -> Dict[str, IngestStatus]:
+        """
+        key -> status of all the items of `source`, loaded once.
+        """
+        if source not in self._status:
+            self._status[source] = {
+                r.ii_key: r.ii_status
+                for r in self._con.execute(
+                    select(
+                        [IngestItemTable.c.ii_key, IngestItemTable.c.ii_status]
+                    ).where(IngestItemTable.c.ii_source == source)
+                )
+            }
+        return self._status[source]
+
+    def should_process(self, source: str, key: str) -> bool:
+        status = self.status(source).get(key)
+        if status is None or status in (IngestStatus.RUNNING, IngestStatus.CRASHED):
+            return True
+        if status == IngestStatus.FAILED:
+            return self.retry_failed
+        # done or skipped
+        return False
+
+    def record(self, item: IngestItem, error: Optional[Exception] = None) -> None:
+        status = IngestStatus.FAILED if error else item.status
+        values = {
+            "ii_run": self.run_id,
+            "ii_status": status,
+            "ii_started_at": item.started_at,
+            "ii_duration": item.duration,
+            "ii_bytes": item.bytes,
+            "ii_rows": item.rows,
+            "ii_error_class": type(error).__name__ if error else None,
+            "ii_error": str(error)[:1000] if error else None,
+        }
+        ins = insert(IngestItemTable).values(
+            ii_source=item.source, ii_key=item.key, **values
+        )
+        ins = ins.on_conflict_do_update(
+            index_elements=["ii_source", "ii_key"],
+            set_=dict(values, ii_attempts=IngestItemTable.c.ii_attempts + 1),
+        )
+        self._con.execute(ins)
+        self.status(item.source)[item.key] = status
+        if status == IngestStatus.FAILED:
+            self.failed += 1
+        else:
+            self.done += 1
+
+    @contextmanager
+    def track(self, source: str, key: str) -> Generator[IngestItem, None, None]:
+        """
+        Record the item at the end of the block. An exception marks it failed, and is raised again.
+        """
+        item = IngestItem(source, key)
+        try:
+            yield item
+        except Exception as e:
+            self.record(item, e)
+            raise
+        self.record(item)
+
+    def finish(self, status: IngestStatus = IngestStatus.DONE) -> None:
+        if self._con.closed:
+            return
+        self._con.execute(
+            IngestRunTable.update()
+            .where(IngestRunTable.c.ir_id == self.run_id)
+            .values(
+                ir_ended_at=datetime.now(),
+                ir_status=status,
+                ir_items_done=self.done,
+                ir_items_failed=self.failed,
+            )
+        )
+        self._con.close()
+        log.info(
+            f"{self.command}: {self.done} items done, {self.failed} failed ({status.value})"
+        )
@@ -0,0 +1,187 @@
+"""
+Local mirror of the meteofrance files the imports read, and replay of the imports from it.
+
+`Mirror` downloads them in a directory, with the upstream layout below a `bra` and a `nivo` directory:
+
+    <dir>/bra/massifs.json, <dir>/bra/bra.20200101.json, <dir>/bra/BRA.CHABLAIS.20200101132405.xml
+    <dir>/nivo/postesNivo.json, <dir>/nivo/lastNivo.js, <dir>/nivo/nivo.20200101.csv, <dir>/nivo/Archive/nivo.202001.csv.gz
+
+Historical files already there are not downloaded again: running it again only fetches what is new.
+
+`use_source_dir` points the imports to a mirror (a directory, or a tarball of one). They read it through `file://` urls
+served by the http client. A file missing from the mirror is a 404, so the imports record it as failed: only
+meteofrance's own 302 means there is no data for a date.
+"""
+import atexit
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from nivo_api.cli.bra_record_helper.miscellaneous import parse_bra_list, bra_xml_name
+from nivo_api.cli.nivo_record_helper import NivoDate
+from nivo_api.core.http import get_http_client, is_missing
+from nivo_api.core.http_cache import is_immutable, CHUNK_SIZE
+from nivo_api.settings import Config
+
+log = logging.getLogger(__name__)
+
+BRA_DIR = "bra"
+NIVO_DIR = "nivo"
+
+
+@dataclass
+class MirrorReport:
+    downloaded: int = 0
+    bytes: int = 0
+    # already in the mirror
+    kept: int = 0
+    # not published by meteofrance
+    missing: int = 0
+    failed: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.downloaded} files downloaded ({self.bytes / 1024 ** 2:.1f} MiB), {self.kept} already mirrored, "
+            f"{self.missing} missing upstream, {self.failed} failed"
+        )
+
+
+class Mirror:
+    """
+    Download meteofrance files to `root`, `jobs` at a time.
+    """
+
+    def __init__(self, root: str, jobs: int = 8, today: Optional[date] = None):
+        self.root = root
+        self.jobs = jobs
+        self.today = today or date.today()
+        self.report = MirrorReport()
+        # upstream urls, read now: `use_source_dir` may change them later in the process.
+        self.base_urls = {
+            BRA_DIR: Config.BRA_BASE_URL,
+            NIVO_DIR: Config.METEO_FRANCE_NIVO_BASE_URL,
+        }
+
+    def path(self, directory: str, name: str) -> str:
+        return os.path.join(self.root, directory, *name.split("/"))
+
+    def sync(self, directory: str, name: str) -> Optional[str]:
+        """
+        Mirror one file. Return its path, None if meteofrance doesn't have it (or it failed).
+        """
+        path = self.path(directory, name)
+        url = f"{self.base_urls[directory]}/{name}"
+        if os.path.exists(path) and is_immutable(url, self.today):
+            self.report.add(kept=1)
+            return path
+        try:
+            res = get_http_client().get(url, allow_redirects=False, stream=True)
+            with res:
+                if is_missing(res):
+                    self.report.add(missing=1)
+                    return None
+                res.raise_for_status()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # written aside then renamed, an interrupted mirror never has a truncated file.
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                size = 0
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        for chunk in res.iter_content(CHUNK_SIZE):
+                            f.write(chunk)
+                            size += len(chunk)
+                    os.replace(tmp, path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+        except Exception as e:
+            log.warning(f"Cannot mirror {url}: {e}")
+            self.report.add(failed=1)
+            return None
+        self.report.add(downloaded=1, bytes=size)
+        return path
+
+    def sync_all(
+        self, directory: str, names: Iterable[str]
+    ) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Mirror the files concurrently. Yield (name, path) in order.
+        """
+        with ThreadPoolExecutor(self.jobs) as pool:
+            names = list(names)
+            yield from zip(names, pool.map(lambda n: self.sync(directory, n), names))
+
+    def bra(self, days: Iterable[date]) -> None:
+        """
+        The bra lists of `days`, and the bulletins they reference.
+        """
+        self.sync(BRA_DIR, "massifs.json")
+        bulletins: List[str] = list()
+        lists = (f"bra.{day.strftime('%Y%m%d')}.json" for day in days)
+        for name, path in self.sync_all(BRA_DIR, lists):
+            if path is None:
+                continue
+            try:
+                with open(path) as f:
+                    bra_dates = parse_bra_list(json.load(f))
+            except ValueError as e:
+                log.warning(f"Cannot read {name}: {e}")
+                continue
+            bulletins += [bra_xml_name(m, d) for m, d in bra_dates.items()]
+        for _ in self.sync_all(BRA_DIR, bulletins):
+            pass
+
+    def nivo(self, nivo_dates: Iterable[NivoDate]) -> None:
+        """
+        The stations, the last nivo date and the files of `nivo_dates`.
+        """
+        for name in ("postesNivo.json", "lastNivo.js"):
+            self.sync(NIVO_DIR, name)
+        for _ in self.sync_all(NIVO_DIR, (d.file_path for d in nivo_dates)):
+            pass
+
+
+def _extract(tarball: str) -> str:
+    directory = tempfile.mkdtemp(prefix="nivo-mirror-")
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    with tarfile.open(tarball) as tar:
+        # python >= 3.12 wants to be told members are plain data.
+        kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+        tar.extractall(directory, **kwargs)  # type: ignore
+    # a tarball of the mirror directory itself
+    entries = os.listdir(directory)
+    if len(entries) == 1 and BRA_DIR not in entries and NIVO_DIR not in entries:
+        directory = os.path.join(directory, entries[0])
+    return directory
+
+
+def use_source_dir(source: str) -> str:
+    """
+    Read the meteofrance files from a mirror instead of meteofrance, for the rest of the process. `source` is the mirror
+    directory or a tarball of it. Return the directory read.
+    """
+    if os.path.isfile(source) and tarfile.is_tarfile(source):
+        source = _extract(source)
+    root = Path(source).resolve()
+    Config.BRA_BASE_URL = (root / BRA_DIR).as_uri()
+    Config.METEO_FRANCE_NIVO_BASE_URL = (root / NIVO_DIR).as_uri()
+    Config.METEO_FRANCE_LAST_NIVO_JS_URL = (
+        f"{Config.METEO_FRANCE_NIVO_BASE_URL}/lastNivo.js"
+    )
+    log.info(f"Reading meteofrance files from {root}")
+    return str(root)
@@ -0,0 +1,199 @@
+"""
+Columnar normalization of the nivo csv.
+
+A batch of csv lines is turned into one numpy array per column of `NivoRecordTable`, typed after the column (int,
+float, datetime). Meteofrance null values ("mq", "/", empty cell) become None. A value which can't be parsed becomes
+None too, and is counted in the failures of its column instead of failing the import of the whole file. Lines without
+a valid date or station can't be imported, they are rejected.
+"""
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import DateTime, Integer
+
+from nivo_api.core.db.models.sql.nivo import NivoRecordTable
+
+# data quality is not the best stuff at meteofrance.
+MISSING_VALUES = ["mq", "/", ""]
+# csv column of the station number, it's the `nr_nivo_sensor` foreign key.
+STATION_COLUMN = "numer_sta"
+REQUIRED_COLUMNS = ("nr_date", "nr_nivo_sensor")
+
+_INT = "int"
+_FLOAT = "float"
+_DATE = "date"
+
+
+@dataclass(frozen=True)
+class HeaderMapping:
+    """
+    Where each record column is in the csv lines, and how to parse it.
+    """
+
+    indexes: Tuple[int, ...]
+    columns: Tuple[str, ...]
+    kinds: Tuple[str, ...]
+    # csv columns which are not in the table, they are ignored.
+    unknown: Tuple[str, ...]
+
+
+@lru_cache(maxsize=16)
+def header_mapping(header: Tuple[str, ...]) -> HeaderMapping:
+    indexes, columns, kinds, unknown = list(), list(), list(), list()
+    for i, title in enumerate(header):
+        if not title:
+            continue
+        name = "nr_nivo_sensor" if title == STATION_COLUMN else f"nr_{title}"
+        column = NivoRecordTable.c.get(name)
+        if column is None:
+            unknown.append(title)
+            continue
+        indexes.append(i)
+        columns.append(name)
+        if name == "nr_nivo_sensor" or isinstance(column.type, Integer):
+            kinds.append(_INT)
+        elif isinstance(column.type, DateTime):
+            kinds.append(_DATE)
+        else:
+            kinds.append(_FLOAT)
+    return HeaderMapping(tuple(indexes), tuple(columns), tuple(kinds), tuple(unknown))
+
+
+def parse_numbers(
+    raw: np.ndarray, missing: np.ndarray, integer: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse a column of strings to float64, NaN where `missing`. Return the values and the mask of the cells that failed
+    to parse. With `integer`, a value with decimals is a failure.
+    """
+    filled = np.where(missing, "nan", raw)
+    failed = np.zeros(len(raw), dtype=bool)
+    try:
+        values = np.array(filled, dtype=np.float64)
+    except ValueError:
+        # at least one bad cell, find which.
+        values = np.empty(len(raw), dtype=np.float64)
+        for i, cell in enumerate(filled):
+            try:
+                values[i] = float(cell)
+            except ValueError:
+                values[i] = np.nan
+                failed[i] = True
+    if integer:
+        with np.errstate(invalid="ignore"):
+            decimals = np.isfinite(values) & (values != np.round(values))
+        failed |= decimals
+        values[decimals] = np.nan
+    return values, failed
+
+
+def parse_dates(raw: np.ndarray, missing: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse a column of `%Y%m%d%H%M%S` strings to datetime64. Return the values and the mask of the cells that failed to
+    parse.
+    """
+    well_formed = (np.char.str_len(raw) == 14) & np.char.isdigit(raw)
+    failed = ~missing & ~well_formed
+    digits = np.where(well_formed, raw, "19700101000000").astype(np.int64)
+    year, rest = np.divmod(digits, 10**10)
+    month, rest = np.divmod(rest, 10**8)
+    day, rest = np.divmod(rest, 10**6)
+    hour, rest = np.divmod(rest, 10**4)
+    minute, second = np.divmod(rest, 100)
+    failed |= well_formed & (
+        (month < 1) | (month > 12) | (day < 1) | (day > 31) | (hour > 23)
+    )
+    failed |= well_formed & ((minute > 59) | (second > 59))
+    month = np.where(failed, 1, month)
+    months = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+    seconds = (day - 1) * 86400 + hour * 3600 + minute * 60 + second
+    values = months.astype("datetime64[s]") + seconds.astype("timedelta64[s]")
+    # 31th of a 30 days month
+    failed |= well_formed & (values.astype("datetime64[M]") != months)
+    return values, failed
+
+
+def _to_objects(values: np.ndarray, null: np.ndarray, kind: str) -> np.ndarray:
+    if kind == _INT:
+        values = np.where(null, 0, values).astype(np.int64)
+    objects = values.astype(object)
+    objects[null] = None
+    return objects
+
+
+class NivoNormalizer:
+    """
+    Normalize the lines of one csv file. `failures` count the values which could not be parsed per column, `rejected`
+    the lines without a valid date or station.
+    """
+
+    def __init__(self, header: Sequence[str]) -> None:
+        self.header = list(header)
+        self.mapping = header_mapping(tuple(self.header))
+        if "nr_nivo_sensor" not in self.mapping.columns:
+            raise KeyError("nr_numer_sta")
+        if "nr_date" not in self.mapping.columns:
+            raise KeyError("nr_date")
+        self.failures: Counter = Counter()
+        self.rejected = 0
+
+    def _cells(self, lines: List[Sequence[str]]) -> List[Tuple[str, ...]]:
+        """
+        lines to columns.
+        """
+        width = len(self.header)
+        lines = [
+            line if len(line) == width else (list(line) + [""] * width)[:width]
+            for line in lines
+        ]
+        return list(zip(*lines))
+
+    def columns(
+        self, lines: List[Sequence[str]]
+    ) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], np.ndarray]:
+        """
+        column name -> (values, null mask), and the mask of the lines which can be imported.
+        """
+        cells = self._cells(lines)
+        valid = np.ones(len(lines), dtype=bool)
+        columns = dict()
+        mapping = self.mapping
+        for index, name, kind in zip(mapping.indexes, mapping.columns, mapping.kinds):
+            raw = np.array(cells[index], dtype=str)
+            missing = np.isin(raw, MISSING_VALUES)
+            if kind == _DATE:
+                values, failed = parse_dates(raw, missing)
+            else:
+                values, failed = parse_numbers(raw, missing, integer=kind == _INT)
+            if failed.any():
+                self.failures[name] += int(failed.sum())
+            null = missing | failed
+            if name in REQUIRED_COLUMNS:
+                valid &= ~null
+            columns[name] = (values, null)
+        return columns, valid
+
+    def normalize(self, lines: Sequence[Sequence[str]]) -> List[Dict]:
+        """
+        Typed records of `lines`, ready to be copied (the station is still the meteofrance number).
+        """
+        lines = [line for line in lines if line]
+        if not lines:
+            return list()
+        columns, valid = self.columns(lines)
+        self.rejected += int((~valid).sum())
+        values = [
+            _to_objects(values, null, kind)[valid].tolist()
+            for (values, null), kind in zip(columns.values(), self.mapping.kinds)
+        ]
+        names = list(columns)
+        return [dict(zip(names, record)) for record in zip(*values)]
+
+    def report(self) -> str:
+        failures = ", ".join(f"{k}: {v}" for k, v in sorted(self.failures.items()))
+        return (
+            f"{self.rejected} lines rejected, values set to null ({failures or 'none'})"
+        )
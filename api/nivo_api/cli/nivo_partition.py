@@ -0,0 +1,187 @@
+"""
+Season partitions of `nivo.records`.
+
+A season starts the 1st of August, the partition of the season starting in 2019 is `nivo.records_2019`. Queries with a
+bound on `nr_date` only read the partitions of the seasons they cover. `records_default` gets the records of the
+seasons without a partition, it should stay empty.
+
+An old season can be moved to another tablespace, or detached: it's then a plain table, out of the queries, which can be
+dumped and dropped.
+"""
+import logging
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text, inspect
+from sqlalchemy.engine import Connection, Engine
+
+from nivo_api.core.db.models.sql.nivo import NivoRecordTable
+
+log = logging.getLogger(__name__)
+
+# first nivo archive is december 2010
+FIRST_SEASON = 2010
+SEASON_START_MONTH = 8
+# seasons created in advance
+SEASONS_AHEAD = 1
+
+
+def season_of(day: date) -> int:
+    return day.year if day.month >= SEASON_START_MONTH else day.year - 1
+
+
+def season_bounds(season: int) -> List[datetime]:
+    return [
+        datetime(season, SEASON_START_MONTH, 1),
+        datetime(season + 1, SEASON_START_MONTH, 1),
+    ]
+
+
+def season_partition(season: int) -> str:
+    return f"{NivoRecordTable.name}_{season}"
+
+
+def is_partitioned(con: Connection) -> bool:
+    return bool(
+        con.execute(
+            text(
+                "SELECT c.relkind = 'p' FROM pg_class c "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = :schema AND c.relname = :name"
+            ),
+            schema=NivoRecordTable.schema,
+            name=NivoRecordTable.name,
+        ).scalar()
+    )
+
+
+def get_partitions(con: Connection) -> List[str]:
+    """
+    Name of the partitions attached to `nivo.records`.
+    """
+    return [
+        r.relname
+        for r in con.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = CAST(:parent AS regclass) ORDER BY c.relname"
+            ),
+            parent=NivoRecordTable.fullname,
+        )
+    ]
+
+
+def create_season_partition(con: Connection, season: int) -> None:
+    """
+    Create the partition of `season`. The records of the season already in the default partition are moved to it.
+    """
+    schema = NivoRecordTable.schema
+    name = f"{schema}.{season_partition(season)}"
+    default = f"{NivoRecordTable.fullname}_default"
+    start, end = season_bounds(season)
+    bounds = dict(start=start, end=end)
+    with con.begin():
+        con.execute(
+            text(
+                f"CREATE TABLE {name} (LIKE {NivoRecordTable.fullname} "
+                "INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+        )
+        moved = con.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {default} "
+                "WHERE nr_date >= :start AND nr_date < :end RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ),
+            **bounds,
+        ).rowcount
+        # bounds are literals in a partition definition, they can't be bound.
+        con.execute(
+            text(
+                f"ALTER TABLE {NivoRecordTable.fullname} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        )
+    if moved:
+        log.info(f"{moved} records moved from {default} to {name}")
+
+
+def create_season_partitions(con: Connection, until: Optional[int] = None) -> int:
+    """
+    Create the partitions missing from the first season to `until` (default: the season after the current one). A
+    season detached is not created again. Return the number of partitions created.
+    """
+    if not is_partitioned(con):
+        log.warning(
+            f"{NivoRecordTable.fullname} is not partitioned, run partition_nivo_records."
+        )
+        return 0
+    until = until or season_of(date.today()) + SEASONS_AHEAD
+    # attached or detached
+    existing = set(inspect(con).get_table_names(schema=NivoRecordTable.schema))
+    created = 0
+    for season in range(FIRST_SEASON, until + 1):
+        if season_partition(season) not in existing:
+            create_season_partition(con, season)
+            created += 1
+    return created
+
+
+def partition_nivo_records(engine: Engine) -> int:
+    """
+    Move an unpartitioned `nivo.records` (created before the partitioning) to a partitioned one, in a transaction.
+    Return the number of records moved.
+    """
+    schema = NivoRecordTable.schema
+    old = f"{NivoRecordTable.name}_unpartitioned"
+    with engine.connect() as con:
+        if is_partitioned(con):
+            return 0
+        with con.begin():
+            con.execute(text(f"ALTER TABLE {NivoRecordTable.fullname} RENAME TO {old}"))
+            # the pk and indexes names are unique in the schema, the new table needs them.
+            for index in con.execute(
+                text(
+                    "SELECT indexname FROM pg_indexes WHERE schemaname = :s AND tablename = :t"
+                ),
+                s=schema,
+                t=old,
+            ).fetchall():
+                con.execute(
+                    text(
+                        f"ALTER INDEX {schema}.{index.indexname} "
+                        f"RENAME TO {index.indexname}_unpartitioned"
+                    )
+                )
+            NivoRecordTable.create(con)
+            create_season_partitions(con)
+            columns = ", ".join(c.name for c in NivoRecordTable.columns)
+            moved = con.execute(
+                text(
+                    f"INSERT INTO {NivoRecordTable.fullname} ({columns}) "
+                    f"SELECT {columns} FROM {schema}.{old} ON CONFLICT DO NOTHING"
+                )
+            ).rowcount
+            con.execute(text(f"DROP TABLE {schema}.{old}"))
+    return moved
+
+
+def archive_season(
+    con: Connection,
+    season: int,
+    tablespace: Optional[str] = None,
+    detach: bool = False,
+) -> str:
+    """
+    Move the partition of `season` to `tablespace` and/or detach it. Return its name.
+    """
+    name = f"{NivoRecordTable.schema}.{season_partition(season)}"
+    with con.begin():
+        if tablespace:
+            con.execute(text(f'ALTER TABLE {name} SET TABLESPACE "{tablespace}"'))
+        if detach:
+            con.execute(
+                text(f"ALTER TABLE {NivoRecordTable.fullname} DETACH PARTITION {name}")
+            )
+    return name
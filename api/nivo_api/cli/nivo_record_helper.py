@@ -1,139 +1,302 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import io
+import json
 import logging
 import re
 import gzip
+import itertools
+import tempfile
+import time
 from abc import ABC
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from csv import DictReader
 from datetime import datetime, date, timedelta
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterable, Iterator, Any, IO, Set, Tuple, Deque
+from uuid import UUID, uuid4
 
 import requests
-from sqlalchemy import select, exists, Date, cast
+from sqlalchemy import select, exists, Date, cast, and_, text, Table, MetaData, Column
+from sqlalchemy import literal_column
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.engine import Connection, RowProxy
+from sqlalchemy.exc import ProgrammingError
+from nivo_api.cli.database import create_missing_indexes
+from nivo_api.cli.nivo_normalizer import NivoNormalizer
+from nivo_api.cli.nivo_rollup import update_nivo_rollups
+from nivo_api.core.db.copy import copy_rows
 from nivo_api.core.db.models.sql.nivo import NivoRecordTable, SensorStationTable
+from nivo_api.core.http import get_http_client
+from nivo_api.core.profiling import stage, get_profiler
 from nivo_api.settings import Config
 
 logger = logging.getLogger(__name__)
 
-# data quality is not the best stuff at meteofrance.
-SPECIAL_CHAR_TO_SET_TO_NONE = ["mq", "/"]
+# bytes read at a time from the http body
+CHUNK_SIZE = 64 * 1024
+# records resolved and copied at a time
+BATCH_SIZE = 5000
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Readable stream over an iterator of bytes chunks (an http body), so gzip and csv read it as it's downloaded.
+    """
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self._chunks = chunks
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = chunk
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class _StageReader(io.RawIOBase):
+    """
+    Count the time spent reading `raw` in the profiling stage `name`.
+    """
+
+    def __init__(self, raw: IO[bytes], name: str) -> None:
+        self._raw = raw
+        self._name = name
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        with stage(self._name):
+            return self._raw.readinto(b)  # type: ignore
 
 
 class ANivoCsv(ABC):
     """
     We have two case, the nivo is quite new and available as a csv, or old and archived. behavior vary between this
     two cases enough to justify two separate classes
+
+    The file is streamed: download, decompression, csv parsing, normalization and station resolution are generators,
+    `batches` only hold `batch_size` records at a time. `normalize` and `find_and_replace_foreign_key_value` read the
+    whole file in `cleaned_csv`.
     """
 
     download_url: str
     nivo_date: "NivoDate"
     nivo_csv: DictReader
+    normalizer: NivoNormalizer
     cleaned_csv: List[Dict]
+    # size of the downloaded file, known once it's read.
+    size: int = 0
+    # records imported by `import_nivo`
+    imported: int = 0
 
     def __init__(
-        self, nivo_date: "NivoDate", db_connection: Connection, download_url: str = None
+        self,
+        nivo_date: "NivoDate",
+        db_connection: Connection,
+        download_url: str = None,
+        stations: Optional[Dict[int, UUID]] = None,
     ):
         self.nivo_date = nivo_date
         self.cleaned_csv = list()
         self.db_connection = db_connection
-
-    def fetch_and_parse(self) -> DictReader:
+        # meteofrance id -> nss_id, shared between the files of an import.
+        self.stations = stations
+        # stations created for this file, they disappear if its import is rolled back.
+        self.created_stations: List[int] = list()
+        self._response: Optional[requests.Response] = None
+        self._file: Optional[IO[bytes]] = None
+        self._encoding: Optional[str] = None
+        # seconds spent in each stage: download, parse (decompression, csv, normalization), load (copy).
+        self.timings: Dict[str, float] = dict()
+
+    def _count(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            self.size += len(chunk)
+            yield chunk
+
+    def _get(self) -> requests.Response:
         logger.debug(f"requests : {self.download_url}")
-        res = requests.get(self.download_url, allow_redirects=False)
+        res = get_http_client().get(
+            self.download_url, allow_redirects=False, stream=True
+        )
         if res.status_code == 302:
+            res.close()
             raise requests.HTTPError("Cannot found Nivo record", response=res)
-        res.raise_for_status()
-        raw_csv = res.text
-        if self.nivo_date.is_archive:
-            with gzip.open(io.BytesIO(res.content), 'rt') as gz:
-                raw_csv = gz.read()
-        self.nivo_csv = DictReader(io.StringIO(raw_csv), delimiter=";")
-        return self.nivo_csv
+        try:
+            res.raise_for_status()
+        except requests.HTTPError:
+            res.close()
+            raise
+        self._encoding = res.encoding
+        return res
+
+    def prefetch(self) -> None:
+        """
+        Download the file to a temporary file, `fetch_and_parse` then reads it from there. It doesn't touch the db, it
+        can run in another thread.
+        """
+        t1 = time.perf_counter()
+        with stage("fetch") as fetch:
+            with self._get() as res:
+                f = tempfile.TemporaryFile()
+                try:
+                    for chunk in self._count(res.iter_content(CHUNK_SIZE)):
+                        f.write(chunk)
+                except BaseException:
+                    f.close()
+                    raise
+            fetch.bytes += self.size
+        f.seek(0)
+        self._file = f
+        self.timings["download"] = time.perf_counter() - t1
 
-    def normalize(self) -> List[Dict]:
+    def fetch_and_parse(self) -> DictReader:
         """
-        Before importing to db, change invalid value
+        Open the file for reading. If it fails, the downloaded file (or the http connection) is released.
         """
+        raw: IO[bytes]
+        try:
+            if self._file is not None:
+                raw = self._file
+            else:
+                with stage("fetch"):
+                    self._response = self._get()
+                raw = io.BufferedReader(
+                    _ChunkReader(self._count(self._response.iter_content(CHUNK_SIZE))),
+                    CHUNK_SIZE,
+                )
+            if self.nivo_date.is_archive:
+                raw = gzip.GzipFile(fileobj=raw)  # type: ignore
+                if get_profiler():
+                    raw = io.BufferedReader(_StageReader(raw, "decompress"), CHUNK_SIZE)
+            text = io.TextIOWrapper(
+                raw, encoding=self._encoding or "utf-8", errors="replace", newline=""
+            )
+            self.nivo_csv = DictReader(text, delimiter=";")
+        except BaseException:
+            self.close()
+            raise
+        return self.nivo_csv
 
-        def remove_empty_column(line: Dict) -> Dict:
-            return {k: v for k, v in line.items() if k != ""}
+    def close(self) -> None:
+        """
+        Give the http connection back, remove the downloaded file.
+        """
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
-        def remove_unvalid_int(line: Dict) -> Dict:
-            # change invalid value that should be int but are string.
-            for title, value in line.items():
-                if value in SPECIAL_CHAR_TO_SET_TO_NONE:
-                    line[title] = None
-            return line
+    def __enter__(self) -> "ANivoCsv":
+        return self
 
-        def change_column_name(line: Dict) -> Dict:
-            new_line = dict()
-            for title, _ in line.items():
-                new_line[f"nr_{title}"] = line[title]
-            # special case : the foreign key
-            new_line["nr_nivo_sensor"] = new_line.pop("nr_numer_sta")
-            return new_line
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
 
-        def parse_date(line: Dict) -> Dict:
-            line["nr_date"] = datetime.strptime(line["nr_date"], "%Y%m%d%H%M%S")
-            return line
+    def iter_normalized(self, batch_size: int = BATCH_SIZE) -> Iterator[List[Dict]]:
+        """
+        Typed records of the file, by batch of `batch_size` lines. Parse failures are counted in `normalizer`.
+        """
+        # the raw lines, the header is parsed once.
+        self.normalizer = NivoNormalizer(self.nivo_csv.fieldnames or [])
+        lines = self.nivo_csv.reader
+        while True:
+            # stages can't be left open across a yield.
+            with stage("parse"):
+                batch = list(itertools.islice(lines, batch_size))
+            if not batch:
+                return
+            with stage("transform") as transform:
+                records = self.normalizer.normalize(batch)
+                transform.rows += len(records)
+            yield records
 
-        filtered_csv = map(remove_empty_column, self.nivo_csv)
-        filtered_csv = map(remove_unvalid_int, filtered_csv)
-        filtered_csv = map(change_column_name, filtered_csv)
-        filtered_csv = map(parse_date, filtered_csv)
-        self.cleaned_csv = list(filtered_csv)
+    def normalize(self) -> List[Dict]:
+        self.cleaned_csv = [
+            record for batch in self.iter_normalized() for record in batch
+        ]
         return self.cleaned_csv
 
-    def find_and_replace_foreign_key_value(self) -> List[Dict]:
-        def replace_num_sta_by_column_name(line: Dict, con: Connection) -> Dict:
-            """
-            You have to know that some station have no id (yes...)
-            """
-            nivo_sensor = int(line["nr_nivo_sensor"])
-            s = select([SensorStationTable.c.nss_id]).where(
-                SensorStationTable.c.nss_meteofrance_id == nivo_sensor
-            )
-            res = con.execute(s).first()
-            if res is None:
+    def resolve_foreign_keys(self, lines: List[Dict]) -> List[Dict]:
+        """
+        Replace the meteofrance station number of `lines` by the id of the station. The stations are loaded once (or
+        given with `stations`), the unknown ones are created all at once and added to the map.
+        """
+        with stage("fk_resolve"):
+            if self.stations is None:
+                self.stations = get_nivo_sensor_station_ids(self.db_connection)
+            unknown = {
+                int(line["nr_nivo_sensor"]) for line in lines
+            } - self.stations.keys()
+            if unknown:
+                # You have to know that some station have no id (yes...)
                 logger.warning(
-                    f"No station have been found for id {nivo_sensor} creating an empty one."
+                    f"No station have been found for ids {sorted(unknown)} creating empty ones."
                 )
-                res = create_new_unknown_nivo_sensor_station(nivo_sensor, con)
-            line["nr_nivo_sensor"] = res.nss_id
-            return line
-
-        replaced_csv = list()
-        for line in self.cleaned_csv:
-            replaced_csv.append(
-                replace_num_sta_by_column_name(line, self.db_connection)
-            )
-        self.cleaned_csv = replaced_csv
+                self.stations.update(
+                    create_unknown_nivo_sensor_stations(unknown, self.db_connection)
+                )
+                self.created_stations += unknown
+            for line in lines:
+                line["nr_nivo_sensor"] = self.stations[int(line["nr_nivo_sensor"])]
+        return lines
+
+    def find_and_replace_foreign_key_value(self) -> List[Dict]:
+        self.cleaned_csv = self.resolve_foreign_keys(self.cleaned_csv)
         return self.cleaned_csv
 
+    def forget_created_stations(self) -> None:
+        if self.stations is not None:
+            for nivo_id in self.created_stations:
+                self.stations.pop(nivo_id, None)
+        self.created_stations = list()
+
+    def batches(self, batch_size: int = BATCH_SIZE) -> Iterator[List[Dict]]:
+        """
+        Records of the file, normalized and with their station id, `batch_size` lines at a time.
+        """
+        for batch in self.iter_normalized(batch_size):
+            if batch:
+                yield self.resolve_foreign_keys(batch)
+
 
 class NivoCsv(ANivoCsv):
     def __init__(
-        self, nivo_date: "NivoDate", db_connection: Connection, download_url: str = None
+        self,
+        nivo_date: "NivoDate",
+        db_connection: Connection,
+        download_url: str = None,
+        stations: Optional[Dict[int, UUID]] = None,
     ):
-        super().__init__(nivo_date, db_connection, download_url)
-        download_date = date.strftime(nivo_date.nivo_date, "%Y%m%d")
+        super().__init__(nivo_date, db_connection, download_url, stations)
         self.download_url = (
-            download_url
-            or f"{Config.METEO_FRANCE_NIVO_BASE_URL}/nivo.{download_date}.csv"
+            download_url or f"{Config.METEO_FRANCE_NIVO_BASE_URL}/{nivo_date.file_path}"
         )
 
 
 class ArchiveNivoCss(ANivoCsv):
     def __init__(
-        self, nivo_date: "NivoDate", db_connection: Connection, download_url: str = None
+        self,
+        nivo_date: "NivoDate",
+        db_connection: Connection,
+        download_url: str = None,
+        stations: Optional[Dict[int, UUID]] = None,
     ):
-        super().__init__(nivo_date, db_connection, download_url)
-        download_date = date.strftime(nivo_date.nivo_date, "%Y%m")
+        super().__init__(nivo_date, db_connection, download_url, stations)
         self.download_url = (
-            download_url
-            or f"{Config.METEO_FRANCE_NIVO_BASE_URL}/Archive/nivo.{download_date}.csv.gz"
+            download_url or f"{Config.METEO_FRANCE_NIVO_BASE_URL}/{nivo_date.file_path}"
         )
 
 
@@ -152,9 +315,137 @@ def create_new_unknown_nivo_sensor_station(
     return connection.execute(ins).first()
 
 
+def get_nivo_sensor_station_ids(con: Connection) -> Dict[int, UUID]:
+    """
+    meteofrance id -> nss_id of all the stations having a meteofrance id.
+    """
+    s = select(
+        [SensorStationTable.c.nss_meteofrance_id, SensorStationTable.c.nss_id]
+    ).where(SensorStationTable.c.nss_meteofrance_id.isnot(None))
+    return {r.nss_meteofrance_id: r.nss_id for r in con.execute(s)}
+
+
+def create_unknown_nivo_sensor_stations(
+    nivo_ids: Iterable[int], con: Connection
+) -> Dict[int, UUID]:
+    """
+    Create the stations at once (same as `create_new_unknown_nivo_sensor_station`), the ones that already exist are
+    kept. Return meteofrance id -> nss_id of all `nivo_ids`.
+    """
+    nivo_ids = sorted(set(nivo_ids))
+    if not nivo_ids:
+        return dict()
+    ins = (
+        insert(SensorStationTable)
+        .values(
+            [
+                {
+                    "nss_name": f"UNKNOWN_{nivo_id}",
+                    "nss_meteofrance_id": nivo_id,
+                    "the_geom": "SRID=4326;POINT(0 0 0)",
+                }
+                for nivo_id in nivo_ids
+            ]
+        )
+        .on_conflict_do_nothing()
+    )
+    con.execute(ins)
+    s = select(
+        [SensorStationTable.c.nss_meteofrance_id, SensorStationTable.c.nss_id]
+    ).where(SensorStationTable.c.nss_meteofrance_id.in_(nivo_ids))
+    return {r.nss_meteofrance_id: r.nss_id for r in con.execute(s)}
+
+
+@dataclass
+class SensorStationUpsertReport:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.inserted} sensor stations inserted, {self.updated} updated, "
+            f"{self.unchanged} unchanged"
+        )
+
+
+# A station is matched on its meteofrance id, or its name. Only the stations whose name, id or geometry changed are
+# updated (the `UNKNOWN_<id>` placeholders get their real name and position). All the CTE see the same snapshot.
+_UPSERT_SENSOR_STATIONS = f"""
+WITH incoming AS (
+    SELECT s.id, s.name, s.meteofrance_id,
+        ST_SetSRID(ST_GeomFromGeoJSON(s.geom), 4326) AS geom
+    FROM json_to_recordset(CAST(:stations AS json))
+        AS s(id uuid, name text, meteofrance_id integer, geom text)
+), matched AS (
+    SELECT i.*, st.nss_id
+    FROM incoming i
+    LEFT JOIN LATERAL (
+        SELECT nss_id FROM {SensorStationTable.fullname}
+        WHERE nss_meteofrance_id = i.meteofrance_id OR nss_name = i.name
+        ORDER BY nss_meteofrance_id = i.meteofrance_id DESC NULLS LAST
+        LIMIT 1
+    ) st ON true
+), updated AS (
+    UPDATE {SensorStationTable.fullname} st
+    SET nss_name = m.name, nss_meteofrance_id = m.meteofrance_id, the_geom = m.geom
+    FROM matched m
+    WHERE st.nss_id = m.nss_id AND (
+        st.nss_name IS DISTINCT FROM m.name
+        OR st.nss_meteofrance_id IS DISTINCT FROM m.meteofrance_id
+        OR ST_AsEWKB(st.the_geom) IS DISTINCT FROM ST_AsEWKB(m.geom)
+    )
+    RETURNING st.nss_id
+), inserted AS (
+    INSERT INTO {SensorStationTable.fullname} (nss_id, nss_name, nss_meteofrance_id, the_geom)
+    SELECT id, name, meteofrance_id, geom FROM matched WHERE nss_id IS NULL
+    ON CONFLICT DO NOTHING
+    RETURNING nss_id
+)
+SELECT
+    (SELECT count(*) FROM inserted) AS inserted,
+    (SELECT count(*) FROM updated) AS updated,
+    (SELECT count(*) FROM incoming) AS total
+"""
+
+
+def upsert_nivo_sensor_stations(
+    con: Connection, features: Iterable[Dict]
+) -> SensorStationUpsertReport:
+    """
+    Insert or update the stations of `postesNivo.json` features, in one statement.
+    """
+    stations = list()
+    for feature in features:
+        properties = feature["properties"]
+        pointz = dict(feature["geometry"])
+        pointz["coordinates"] = list(pointz["coordinates"]) + [
+            int(properties["Altitude"])
+        ]
+        stations.append(
+            {
+                "id": str(uuid4()),
+                "name": properties["Nom"],
+                "meteofrance_id": int(properties["ID"]) if properties["ID"] else None,
+                "geom": json.dumps(pointz),
+            }
+        )
+    if not stations:
+        return SensorStationUpsertReport()
+    with con.begin():
+        res = con.execute(
+            text(_UPSERT_SENSOR_STATIONS), stations=json.dumps(stations)
+        ).first()
+    return SensorStationUpsertReport(
+        inserted=res.inserted,
+        updated=res.updated,
+        unchanged=res.total - res.inserted - res.updated,
+    )
+
+
 def get_last_nivo_date() -> "NivoDate":
     url = Config.METEO_FRANCE_LAST_NIVO_JS_URL
-    res = requests.get(url, allow_redirects=False)
+    res = get_http_client().get(url, allow_redirects=False)
     if res.status_code != 200:
         raise AssertionError("Impossible to fetch last nivo data from meteofrance url")
     date_str = re.search("jour=(.*);", res.text).group(1)  # type: ignore
@@ -164,8 +455,13 @@ def get_last_nivo_date() -> "NivoDate":
 
 
 def check_nivo_doesnt_exist(con: Connection, nivo_date: date) -> bool:
+    # a range on nr_date (not a cast) so the index is used.
+    start = datetime.combine(nivo_date, datetime.min.time())
     s = exists([NivoRecordTable.c.nr_date]).where(
-        cast(NivoRecordTable.c.nr_date, Date) == nivo_date
+        and_(
+            NivoRecordTable.c.nr_date >= start,
+            NivoRecordTable.c.nr_date < start + timedelta(days=1),
+        )
     )
     s = select([s.label("exists")])
     does_nivo_already_exist = con.execute(s).first().exists
@@ -175,32 +471,311 @@ def check_nivo_doesnt_exist(con: Connection, nivo_date: date) -> bool:
     return not does_nivo_already_exist
 
 
-def download_nivo(nivo_date: "NivoDate", db_connection: Connection) -> "ANivoCsv":
+class NivoIngestedIndex:
+    """
+    Days which already have records, loaded with one query. It replaces a `check_nivo_doesnt_exist` call (one query)
+    per file during big imports. As with `check_nivo_doesnt_exist`, an archive is there if the first day of its month
+    is.
+    """
+
+    def __init__(self, con: Connection, start: Optional[date] = None) -> None:
+        day = cast(NivoRecordTable.c.nr_date, Date).label("day")
+        s = select([day]).distinct()
+        if start:
+            s = s.where(
+                NivoRecordTable.c.nr_date
+                >= datetime.combine(start, datetime.min.time())
+            )
+        self._days: Set[date] = {r.day for r in con.execute(s)}
+        logger.debug(f"{len(self._days)} days of nivo already in db")
+
+    def __contains__(self, day: date) -> bool:
+        return day in self._days
+
+    def __len__(self) -> int:
+        return len(self._days)
+
+
+def download_nivo(
+    nivo_date: "NivoDate",
+    db_connection: Connection,
+    stations: Optional[Dict[int, UUID]] = None,
+) -> "ANivoCsv":
     nivo_csv: ANivoCsv
     if nivo_date.is_archive:
-        nivo_csv = ArchiveNivoCss(nivo_date, db_connection)
+        nivo_csv = ArchiveNivoCss(nivo_date, db_connection, stations=stations)
     else:
-        nivo_csv = NivoCsv(nivo_date, db_connection)
+        nivo_csv = NivoCsv(nivo_date, db_connection, stations=stations)
 
     nivo_csv.fetch_and_parse()
     return nivo_csv
 
 
-def import_nivo(con: Connection, csv_file: ANivoCsv) -> None:
-    csv_file.normalize()
-    csv_file.find_and_replace_foreign_key_value()
+# where records are copied before being upserted in nivo.records. It only lives in the transaction.
+_STAGING = Table(
+    "nivo_records_staging",
+    MetaData(),
+    Column("nr_id", NivoRecordTable.c.nr_id.type, default=uuid4),
+    *[Column(c.name, c.type) for c in NivoRecordTable.columns if c.name != "nr_id"],
+)
+# an observation is identified by its station and its date.
+_NATURAL_KEY = ["nr_nivo_sensor", "nr_date"]
+
+
+def copy_nivo_records(con: Connection, records: Iterable[Dict]) -> int:
+    """
+    Stream `records` to a staging table with COPY (they are never all in memory), then upsert them in nivo.records: an
+    observation already there (same station and date) is updated. The columns are the ones of the first record, all
+    the lines of a csv have the same. Fail until `dedup_nivo_records` has been run on a database with duplicates.
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return 0
     with con.begin():
-        ins = insert(NivoRecordTable).values(
-            csv_file.cleaned_csv
-        )  # .on_conflict_do_nothing(index_elements=['nss_name'])
-        con.execute(ins)
+        con.execute(
+            text(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {_STAGING.name} "
+                f"(LIKE {NivoRecordTable.fullname}) ON COMMIT DROP"
+            )
+        )
+        con.execute(text(f"TRUNCATE {_STAGING.name}"))
+        copied = copy_rows(
+            con, _STAGING, itertools.chain([first], records), columns=list(first)
+        )
+        columns = [
+            c.name
+            for c in NivoRecordTable.columns
+            if c.name in first or c.name == "nr_id"
+        ]
+        # a file can have the same observation twice, keep the last one.
+        rows = (
+            select([_STAGING.c[c] for c in columns])
+            .distinct(*[_STAGING.c[k] for k in _NATURAL_KEY])
+            .order_by(
+                *[_STAGING.c[k] for k in _NATURAL_KEY], literal_column("ctid").desc()
+            )
+        )
+        ins = insert(NivoRecordTable).from_select(columns, rows)
+        values = [c for c in columns if c not in _NATURAL_KEY + ["nr_id"]]
+        if values:
+            ins = ins.on_conflict_do_update(
+                index_elements=_NATURAL_KEY,
+                set_={c: ins.excluded[c] for c in values},
+            )
+        else:
+            ins = ins.on_conflict_do_nothing(index_elements=_NATURAL_KEY)
+        try:
+            con.execute(ins)
+        except ProgrammingError as e:
+            # 42P10: no unique index for the ON CONFLICT, the db has duplicates from before the natural key.
+            if getattr(e.orig, "pgcode", None) != "42P10":
+                raise
+            raise RuntimeError(
+                f"{NivoRecordTable.fullname} has no unique index on {', '.join(_NATURAL_KEY)}. "
+                f"Run dedup_nivo_records once to delete the duplicated records and create it."
+            ) from e
+    return copied
+
+
+def dedup_nivo_records(con: Connection) -> int:
+    """
+    Delete the duplicated observations (same station and date) imported before the natural key existed, one is kept.
+    Then create the unique index. Return the number of records deleted.
+    """
+    with con.begin():
+        deleted = con.execute(
+            text(
+                f"""
+                DELETE FROM {NivoRecordTable.fullname} r
+                USING (
+                    SELECT nr_id, nr_date, row_number() OVER (
+                        PARTITION BY nr_nivo_sensor, nr_date ORDER BY nr_id
+                    ) AS position
+                    FROM {NivoRecordTable.fullname}
+                ) d
+                WHERE r.nr_id = d.nr_id AND r.nr_date = d.nr_date AND d.position > 1
+                """
+            )
+        ).rowcount
+    create_missing_indexes(con.engine)
+    return deleted
+
+
+def _prefetch(
+    nivo_date: "NivoDate", con: Connection, stations: Optional[Dict[int, UUID]]
+) -> ANivoCsv:
+    nivo_csv: ANivoCsv
+    if nivo_date.is_archive:
+        nivo_csv = ArchiveNivoCss(nivo_date, con, stations=stations)
+    else:
+        nivo_csv = NivoCsv(nivo_date, con, stations=stations)
+    nivo_csv.prefetch()
+    return nivo_csv
+
+
+def _close_prefetched(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class NivoFetcher:
+    """
+    Download nivo files concurrently, to temporary files. They are handed back in order, the caller parses and loads
+    them one by one on its connection while the next ones are downloaded. Use it as a context manager.
+
+    `jobs` files are downloaded at the same time, at most `jobs * 2` are waiting on disk.
+    """
+
+    def __init__(self, jobs: int = 4) -> None:
+        self.jobs = max(jobs, 1)
+        self.window = self.jobs * 2
+        # time the caller waited for a download.
+        self.waited = 0.0
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.jobs, thread_name_prefix="nivo-fetch"
+        )
+
+    def __enter__(self) -> "NivoFetcher":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._executor.shutdown(wait=True)
+
+    def files(
+        self,
+        nivo_dates: Iterable["NivoDate"],
+        con: Connection,
+        stations: Optional[Dict[int, UUID]] = None,
+    ) -> Iterator[Tuple["NivoDate", Future]]:
+        """
+        yield, in order, the date and the future of the downloaded file (`ANivoCsv`, `fetch_and_parse` not called yet).
+        The caller closes the files it gets, the ones it never got (it stopped early) are closed here.
+        """
+        pending: Deque[Tuple[NivoDate, Future]] = deque()
+        try:
+            for nivo_date in nivo_dates:
+                pending.append(
+                    (
+                        nivo_date,
+                        self._executor.submit(_prefetch, nivo_date, con, stations),
+                    )
+                )
+                if len(pending) >= self.window:
+                    yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+        finally:
+            for _, future in pending:
+                future.add_done_callback(_close_prefetched)
+
+    def result(self, future: Future) -> ANivoCsv:
+        t1 = time.perf_counter()
+        try:
+            with stage("wait"):
+                return future.result()
+        finally:
+            self.waited += time.perf_counter() - t1
+
+
+@dataclass
+class NivoImportReport:
+    """
+    What happened during a nivo import, with the time spent in each stage. Download time is cumulated over the
+    download threads, wait is the time the loader had nothing to do.
+    """
+
+    files: int = 0
+    failed: int = 0
+    records: int = 0
+    bytes: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def add(self, nivo_csv: ANivoCsv) -> None:
+        self.files += 1
+        self.records += nivo_csv.imported
+        self.bytes += nivo_csv.size
+        for stage, seconds in nivo_csv.timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def __str__(self) -> str:
+        elapsed = time.perf_counter() - self.started_at
+        stages = ", ".join(f"{k} {v:.1f}s" for k, v in self.timings.items())
+        return (
+            f"{self.files} nivo files imported ({self.records} records, "
+            f"{self.bytes / 1024 ** 2:.1f} MiB), {self.failed} failed, in {elapsed:.1f}s. "
+            f"{stages}"
+        )
+
+
+def import_nivo(
+    con: Connection, csv_file: ANivoCsv, batch_size: int = BATCH_SIZE
+) -> int:
+    """
+    Copy the records of the file as it's downloaded, `batch_size` records at a time (stations are resolved between two
+    batches), and refresh the rollups of the days of the file, in one transaction. Return the number of records
+    imported.
+    """
+    parse, load = 0.0, 0.0
+    days: Set[date] = set()
+    try:
+        with con.begin():
+            batches = csv_file.batches(batch_size)
+            while True:
+                t1 = time.perf_counter()
+                batch = next(batches, None)
+                t2 = time.perf_counter()
+                parse += t2 - t1
+                if batch is None:
+                    break
+                days.update(r["nr_date"].date() for r in batch)
+                with stage("persist") as persist:
+                    copied = copy_nivo_records(con, batch)
+                    persist.rows += copied
+                csv_file.imported += copied
+                load += time.perf_counter() - t2
+            t1 = time.perf_counter()
+            with stage("rollup"):
+                update_nivo_rollups(con, days)
+            load += time.perf_counter() - t1
+    except Exception:
+        # the stations created for the file were rolled back with it.
+        csv_file.forget_created_stations()
+        raise
+    finally:
+        csv_file.close()
+    csv_file.timings.update(parse=parse, load=load)
+    normalizer = getattr(csv_file, "normalizer", None)
+    if normalizer and (normalizer.failures or normalizer.rejected):
+        logger.warning(f"{csv_file.download_url}: {normalizer.report()}")
+    return csv_file.imported
 
 
 @dataclass
 class NivoDate:
+    # source of the nivo files in the import journal
+    SOURCE = "nivo"
+
     is_archive: bool
     nivo_date: date
 
+    @property
+    def journal_key(self) -> str:
+        """
+        archives are monthly files, the others daily.
+        """
+        return self.nivo_date.strftime("%Y-%m" if self.is_archive else "%Y-%m-%d")
+
+    @property
+    def file_path(self) -> str:
+        """
+        path of the file, from `METEO_FRANCE_NIVO_BASE_URL`.
+        """
+        if self.is_archive:
+            return f"Archive/nivo.{self.nivo_date.strftime('%Y%m')}.csv.gz"
+        return f"nivo.{self.nivo_date.strftime('%Y%m%d')}.csv"
+
 
 def get_all_nivo_date() -> List["NivoDate"]:
     """
@@ -0,0 +1,139 @@
+"""
+Daily and season rollups of the nivo records: min, max and mean of `ROLLUP_FIELDS` per station.
+
+They are computed by postgres from the records. An import only refreshes the days it wrote and their seasons, the
+whole history is recomputed with `rebuild_nivo_rollups`.
+"""
+import logging
+from datetime import date, timedelta
+from typing import Callable, Iterable, List, Set
+
+from sqlalchemy import Column, Date, Integer, Table, cast, func, literal, select, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import Select
+
+from nivo_api.cli.nivo_partition import season_of, season_bounds, FIRST_SEASON
+from nivo_api.core.db.models.sql.nivo import (
+    NivoRecordTable,
+    NivoDailyRollupTable,
+    NivoSeasonRollupTable,
+    ROLLUP_FIELDS,
+    ROLLUP_AGGREGATES,
+)
+
+log = logging.getLogger(__name__)
+
+_SQL_AGGREGATES = {"min": func.min, "max": func.max, "mean": func.avg}
+
+
+def _aggregates(prefix: str, column_of: Callable[[str, str], Column]) -> List:
+    """
+    Every rollup column, `column_of(field, aggregate)` gives the column aggregated.
+    """
+    return [
+        _SQL_AGGREGATES[aggregate](column_of(field, aggregate)).label(
+            f"{prefix}_{field}_{aggregate}"
+        )
+        for field in ROLLUP_FIELDS
+        for aggregate in ROLLUP_AGGREGATES
+    ]
+
+
+def _upsert(con: Connection, table: Table, query: Select, keys: List[str]) -> int:
+    columns = [c.name for c in query.c]
+    ins = insert(table).from_select(columns, query)
+    ins = ins.on_conflict_do_update(
+        index_elements=keys,
+        set_={c: ins.excluded[c] for c in columns if c not in keys},
+    )
+    return con.execute(ins).rowcount
+
+
+def update_daily_rollups(con: Connection, days: Iterable[date]) -> int:
+    """
+    Recompute the daily rollups of `days` for every station. Return the number of rows written.
+    """
+    days = sorted(set(days))
+    if not days:
+        return 0
+    day = cast(NivoRecordTable.c.nr_date, Date)
+    query = (
+        select(
+            [
+                NivoRecordTable.c.nr_nivo_sensor.label("ndr_nivo_sensor"),
+                day.label("ndr_date"),
+                func.count().label("ndr_records"),
+                *_aggregates("ndr", lambda f, _: NivoRecordTable.c[f"nr_{f}"]),
+            ]
+        )
+        .where(
+            and_(
+                # a range on nr_date: only the partitions of these days are read.
+                NivoRecordTable.c.nr_date >= days[0],
+                NivoRecordTable.c.nr_date < days[-1] + timedelta(days=1),
+                day.in_(days),
+            )
+        )
+        .group_by(NivoRecordTable.c.nr_nivo_sensor, day)
+    )
+    return _upsert(con, NivoDailyRollupTable, query, ["ndr_nivo_sensor", "ndr_date"])
+
+
+def update_season_rollups(con: Connection, seasons: Iterable[int]) -> int:
+    """
+    Recompute the season rollups of `seasons` from the daily rollups. Return the number of rows written.
+    """
+    written = 0
+    for season in sorted(set(seasons)):
+        start, end = season_bounds(season)
+        query = (
+            select(
+                [
+                    NivoDailyRollupTable.c.ndr_nivo_sensor.label("nsr_nivo_sensor"),
+                    literal(season, Integer).label("nsr_season"),
+                    func.count().label("nsr_days"),
+                    func.sum(NivoDailyRollupTable.c.ndr_records).label("nsr_records"),
+                    *_aggregates(
+                        "nsr", lambda f, a: NivoDailyRollupTable.c[f"ndr_{f}_{a}"]
+                    ),
+                ]
+            )
+            .where(
+                and_(
+                    NivoDailyRollupTable.c.ndr_date >= start.date(),
+                    NivoDailyRollupTable.c.ndr_date < end.date(),
+                )
+            )
+            .group_by(NivoDailyRollupTable.c.ndr_nivo_sensor)
+        )
+        written += _upsert(
+            con, NivoSeasonRollupTable, query, ["nsr_nivo_sensor", "nsr_season"]
+        )
+    return written
+
+
+def update_nivo_rollups(con: Connection, days: Set[date]) -> None:
+    """
+    Refresh the rollups after records of `days` were written.
+    """
+    update_daily_rollups(con, days)
+    update_season_rollups(con, {season_of(d) for d in days})
+
+
+def rebuild_nivo_rollups(con: Connection) -> int:
+    """
+    Recompute all the rollups, one transaction per season. Return the number of daily rollups.
+    """
+    last = con.execute(select([func.max(NivoRecordTable.c.nr_date)])).scalar()
+    if last is None:
+        return 0
+    written = 0
+    for season in range(FIRST_SEASON, season_of(last) + 1):
+        start, end = season_bounds(season)
+        days = [start.date() + timedelta(days=i) for i in range((end - start).days)]
+        with con.begin():
+            written += update_daily_rollups(con, days)
+            update_season_rollups(con, [season])
+        log.info(f"Rollups of season {season} done")
+    return written
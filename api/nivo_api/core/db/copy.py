@@ -0,0 +1,157 @@
+"""
+Bulk load rows with postgres `COPY ... FROM STDIN`.
+
+Rows are the same dicts you would give to `con.execute(insert(table), rows)`: values are converted by the bind
+processor of the column type (enum, uuid, xml...) and python side defaults (`default=uuid.uuid4`) are applied. Types
+which only work with a sql expression (geoalchemy `Geometry`, they need `ST_GeomFromEWKT`) cannot be copied.
+
+The copy runs on the connection of `con`, so it's part of the current transaction.
+"""
+from datetime import date, datetime, time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from sqlalchemy import Table, Column
+from sqlalchemy.engine import Connection
+
+from nivo_api.core.profiling import round_trip
+
+NULL = "\\N"
+# bytes sent to postgres at a time
+COPY_SIZE = 64 * 1024
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _array_element(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (list, tuple)):
+        return _array(value)
+    value = _scalar(value)
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _array(value: Iterable) -> str:
+    return "{" + ",".join(_array_element(v) for v in value) + "}"
+
+
+def _scalar(value: Any) -> str:
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+def format_copy_value(value: Any) -> str:
+    """
+    Format a (bind processed) value for the COPY text format.
+    """
+    if value is None:
+        return NULL
+    kind = type(value)
+    # most of the values, nothing to escape.
+    if kind is int or kind is float:
+        return str(value)
+    if kind is str:
+        return value.translate(_ESCAPES)
+    if isinstance(value, (list, tuple)):
+        return _array(value).translate(_ESCAPES)
+    return _scalar(value).translate(_ESCAPES)
+
+
+def _default(column: Column) -> Optional[Callable[[], Any]]:
+    default = column.default
+    if default is None or not (default.is_scalar or default.is_callable):
+        return None
+    if default.is_callable:
+        # sqlalchemy wraps the callable so it takes the execution context.
+        return lambda: default.arg(None)
+    return lambda: default.arg
+
+
+class _CopyReader:
+    """
+    File like object over the lines of a COPY, built as postgres reads them: only one chunk is in memory at a time.
+    """
+
+    def __init__(self, lines: Iterator[str]) -> None:
+        self._lines = lines
+        self._buffer = ""
+        self.rows = 0
+
+    def read(self, size: int = -1) -> str:
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+            self.rows += 1
+        data = "".join(chunks)
+        if size < 0:
+            self._buffer = ""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(
+    con: Connection,
+    table: Table,
+    rows: Iterable[Dict[str, Any]],
+    columns: Optional[List[str]] = None,
+) -> int:
+    """
+    COPY `rows` in `table`. Only columns present in the rows (or in `columns`), or with a python side default, are
+    copied, the others get their server default. Return the number of rows copied.
+
+    Without `columns`, the rows are read in a list to find the columns. With `columns`, they are streamed to postgres
+    as they are produced: memory stays flat whatever the number of rows.
+    """
+    if columns is None:
+        rows = list(rows)
+        keys: Set[str] = set()
+        for row in rows:
+            keys.update(row.keys())
+    else:
+        keys = set(columns)
+    if not keys:
+        return 0
+    dialect = con.dialect
+    spec = list()
+    for c in table.columns:
+        default = _default(c)
+        if c.key in keys or default:
+            processor = c.type.dialect_impl(dialect).bind_processor(dialect)
+            spec.append((c, default, processor))
+
+    def lines() -> Iterator[str]:
+        for row in rows:
+            values = list()
+            for c, default, processor in spec:
+                if c.key in row:
+                    value = row[c.key]
+                else:
+                    value = default() if default else None
+                if processor and value is not None:
+                    value = processor(value)
+                values.append(format_copy_value(value))
+            yield "\t".join(values) + "\n"
+
+    column_names = ", ".join(
+        dialect.identifier_preparer.quote(c.name) for c, _, _ in spec
+    )
+    table_name = dialect.identifier_preparer.format_table(table)
+    reader = _CopyReader(lines())
+    cursor = con.connection.cursor()
+    # a COPY isn't seen by the sqlalchemy events.
+    round_trip()
+    try:
+        cursor.copy_expert(
+            f"COPY {table_name} ({column_names}) FROM STDIN", reader, size=COPY_SIZE
+        )
+    finally:
+        cursor.close()
+    return reader.rows
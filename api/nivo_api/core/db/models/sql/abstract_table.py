@@ -11,9 +11,8 @@ from nivo_api.core.db.helpers import to_geojson
 
 class AbstractTable(Table):
     def _get_pk(self) -> Column:
-        """assume only one PK !"""
-        pk = list(self.primary_key.columns)
-        return pk.pop()
+        """assume only one PK ! (a partitioned table adds its partition key after it)"""
+        return list(self.primary_key.columns)[0]
 
     def get(
         self,
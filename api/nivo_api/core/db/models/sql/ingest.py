@@ -0,0 +1,68 @@
+import uuid
+from enum import Enum
+
+from sqlalchemy import (
+    Column,
+    TEXT,
+    Integer,
+    BigInteger,
+    DateTime,
+    Float,
+    ForeignKey,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import UUID, ENUM
+
+from nivo_api.core.db.connection import metadata
+from nivo_api.core.db.models import AbstractTable
+
+
+class IngestStatus(Enum):
+    RUNNING = "running"
+    DONE = "done"
+    # nothing to import upstream (e.g. no bulletin that day)
+    SKIPPED = "skipped"
+    FAILED = "failed"
+    # the command died before the end of the run
+    CRASHED = "crashed"
+
+
+_PGIngestStatus = ENUM(
+    IngestStatus, name="ingest_status_t", metadata=metadata, schema="ingest"
+)
+
+# One execution of an import command.
+IngestRunTable = AbstractTable(
+    "run",
+    metadata,
+    Column("ir_id", UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+    Column("ir_command", TEXT, nullable=False),
+    Column("ir_started_at", DateTime, nullable=False),
+    Column("ir_ended_at", DateTime),
+    Column("ir_status", _PGIngestStatus, nullable=False),
+    Column("ir_items_done", Integer, nullable=False, default=0),
+    Column("ir_items_failed", Integer, nullable=False, default=0),
+    schema="ingest",
+)
+
+# Last known state of a unit of import (a day of bra, a nivo file...). `ii_key` is unique for a given `ii_source`.
+IngestItemTable = AbstractTable(
+    "item",
+    metadata,
+    Column("ii_id", UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+    Column("ii_source", TEXT, nullable=False),
+    Column("ii_key", TEXT, nullable=False),
+    Column(
+        "ii_run", UUID(as_uuid=True), ForeignKey("ingest.run.ir_id"), nullable=False
+    ),
+    Column("ii_status", _PGIngestStatus, nullable=False),
+    Column("ii_attempts", Integer, nullable=False, default=1),
+    Column("ii_started_at", DateTime, nullable=False),
+    Column("ii_duration", Float),
+    Column("ii_bytes", BigInteger),
+    Column("ii_rows", Integer),
+    Column("ii_error_class", TEXT),
+    Column("ii_error", TEXT),
+    UniqueConstraint("ii_source", "ii_key"),
+    schema="ingest",
+)
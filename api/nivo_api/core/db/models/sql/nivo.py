@@ -1,7 +1,9 @@
 import uuid
+from typing import List
 
 from geoalchemy2 import Geometry
-from sqlalchemy import Column, TEXT, Integer, DateTime, Float, ForeignKey
+from sqlalchemy import Column, TEXT, Integer, DateTime, Float, ForeignKey, Index, Date
+from sqlalchemy import event, DDL
 from sqlalchemy.dialects.postgresql import UUID
 
 from nivo_api.core.db.connection import metadata
@@ -19,12 +21,14 @@ SensorStationTable = AbstractSpatialTable(
     schema="nivo",
 )
 
-# Snow data from a sensor station.
+# Snow data from a sensor station. Partitioned by season (`records_<year>` from the 1st of August of <year>), the
+# partitions are created by `init_db` (see `nivo_api.cli.nivo_partition`). Rows outside of them go to `records_default`.
 NivoRecordTable = AbstractTable(
     "records",
     metadata,
     Column("nr_id", UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
-    Column("nr_date", DateTime, nullable=False),
+    # indexed: imports look for the days already there. Part of the pk, postgres wants the partition key in it.
+    Column("nr_date", DateTime, primary_key=True, index=True),
     Column("nr_haut_sta", Float),
     Column("nr_dd", Integer),
     Column("nr_ff", Float),
@@ -77,7 +81,17 @@ NivoRecordTable = AbstractTable(
         ForeignKey("nivo.sensor_stations.nss_id"),
         nullable=False,
     ),
+    # a station gives one observation at a given time. Imports upsert on it.
+    Index("uq_nivo_records_sensor_date", "nr_nivo_sensor", "nr_date", unique=True),
     schema="nivo",
+    postgresql_partition_by="RANGE (nr_date)",
+)
+event.listen(
+    NivoRecordTable,
+    "after_create",
+    DDL(
+        "CREATE TABLE %(fullname)s_default PARTITION OF %(fullname)s DEFAULT"
+    ).execute_if(dialect="postgresql"),
 )
 
 # Since all the field are not quite obvious. Document the field
@@ -91,3 +105,50 @@ NivoRecordDescriptionTable = AbstractTable(
     Column("nrd_type", TEXT, nullable=True),
     schema="nivo",
 )
+
+# fields of the records summed up (min, max, mean) in the rollups.
+ROLLUP_FIELDS = ("ht_neige", "t", "ssfrai", "rr24", "ff")
+ROLLUP_AGGREGATES = ("min", "max", "mean")
+
+
+def _rollup_columns(prefix: str) -> List[Column]:
+    return [
+        Column(f"{prefix}_{field}_{aggregate}", Float)
+        for field in ROLLUP_FIELDS
+        for aggregate in ROLLUP_AGGREGATES
+    ]
+
+
+# One row per station per day, computed from the records. Kept up to date by the imports.
+NivoDailyRollupTable = AbstractTable(
+    "daily_rollups",
+    metadata,
+    Column(
+        "ndr_nivo_sensor",
+        UUID(as_uuid=True),
+        ForeignKey("nivo.sensor_stations.nss_id"),
+        primary_key=True,
+    ),
+    Column("ndr_date", Date, primary_key=True),
+    Column("ndr_records", Integer, nullable=False),
+    *_rollup_columns("ndr"),
+    schema="nivo",
+)
+
+# One row per station per season (from the 1st of August), computed from the daily rollups. The means are the mean of
+# the daily means.
+NivoSeasonRollupTable = AbstractTable(
+    "season_rollups",
+    metadata,
+    Column(
+        "nsr_nivo_sensor",
+        UUID(as_uuid=True),
+        ForeignKey("nivo.sensor_stations.nss_id"),
+        primary_key=True,
+    ),
+    Column("nsr_season", Integer, primary_key=True),
+    Column("nsr_days", Integer, nullable=False),
+    Column("nsr_records", Integer, nullable=False),
+    *_rollup_columns("nsr"),
+    schema="nivo",
+)
@@ -0,0 +1,351 @@
+"""
+Shared HTTP client used by everything that talks to upstream providers (meteofrance, isaw).
+
+It gives connection reuse (keep-alive), a bounded connection pool per host, connect/read timeouts and retries with
+exponential backoff. If `HTTP_CACHE_DIR` is set, GET responses go through an on-disk cache (see `http_cache`).
+Meteofrance way of saying 404 is a 302 redirect to an html page served with a 200, so a 302 is never retried nor
+followed when `allow_redirects=False` is used: callers keep checking the status code as before.
+
+`file://` urls are read from the disk, it's how the imports replay a mirror of meteofrance (see `nivo_api.cli.mirror`).
+"""
+import io
+import logging
+import mimetypes
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, Mapping, Optional, Tuple, Any, Union
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import requests
+from requests.adapters import HTTPAdapter, BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+
+from nivo_api.core.http_cache import HttpCache, CACHEABLE_STATUS
+from nivo_api.settings import Config
+
+log = logging.getLogger(__name__)
+
+# status that means "not found" at meteofrance.
+MISSING_STATUS = (302, 404)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    errors: int = 0
+    bytes: int = 0
+    latency: float = 0.0
+    cache_hits: int = 0
+
+
+@dataclass
+class HttpStats:
+    """
+    Thread safe counters of what went through the client.
+    """
+
+    hosts: Dict[str, HostStats] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(
+        self,
+        url: str,
+        nb_bytes: int,
+        latency: float,
+        error: bool = False,
+        cache_hit: bool = False,
+    ) -> None:
+        host = urlparse(url).netloc
+        with self._lock:
+            stats = self.hosts.setdefault(host, HostStats())
+            stats.cache_hits += int(cache_hit)
+            if cache_hit:
+                return
+            stats.requests += 1
+            stats.bytes += nb_bytes
+            stats.latency += latency
+            stats.errors += int(error)
+
+    def add_bytes(self, url: str, nb_bytes: int) -> None:
+        """
+        Body of a streamed response, counted as it's read.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            self.hosts.setdefault(host, HostStats()).bytes += nb_bytes
+
+    @property
+    def requests(self) -> int:
+        return sum(h.requests for h in self.hosts.values())
+
+    @property
+    def bytes(self) -> int:
+        return sum(h.bytes for h in self.hosts.values())
+
+    @property
+    def latency(self) -> float:
+        return sum(h.latency for h in self.hosts.values())
+
+    @property
+    def cache_hits(self) -> int:
+        return sum(h.cache_hits for h in self.hosts.values())
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                host: {
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "cache_hits": s.cache_hits,
+                    "bytes": s.bytes,
+                    "latency": round(s.latency, 3),
+                    "mean_latency": (
+                        round(s.latency / s.requests, 3) if s.requests else 0.0
+                    ),
+                }
+                for host, s in self.hosts.items()
+            }
+
+
+class _CountingRaw:
+    """
+    Wrap the `raw` of a streamed response to count the bytes of its body as the caller reads them.
+    """
+
+    def __init__(self, raw: Any, count: Callable[[int], None]) -> None:
+        self._raw = raw
+        self._count = count
+
+    def read(self, *args: Any, **kwargs: Any) -> bytes:
+        data = self._raw.read(*args, **kwargs)
+        self._count(len(data))
+        return data
+
+    def _stream(self, *args: Any, **kwargs: Any) -> Iterator[bytes]:
+        for chunk in self._raw.stream(*args, **kwargs):
+            self._count(len(chunk))
+            yield chunk
+
+    def __getattr__(self, name: str) -> Any:
+        # `stream` only exists on urllib3 responses, requests falls back to `read` without it.
+        attr = getattr(self._raw, name)
+        return self._stream if name == "stream" else attr
+
+
+class FileAdapter(BaseAdapter):
+    """
+    Serve `file://` urls from the disk, to replay the imports from a mirror of meteofrance files. A missing file is a
+    404, not the 302 of meteofrance: a gap in the mirror doesn't mean meteofrance has nothing for that date, the
+    imports record it as failed rather than skipped.
+    """
+
+    def send(
+        self,
+        request: requests.PreparedRequest,
+        stream: bool = False,
+        timeout: Union[None, float, Tuple[Optional[float], Optional[float]]] = None,
+        verify: Union[bool, str] = True,
+        cert: Union[
+            None, bytes, str, Tuple[Union[bytes, str], Union[bytes, str]]
+        ] = None,
+        proxies: Optional[Mapping[str, str]] = None,
+    ) -> requests.Response:
+        # timeout, verify, cert and proxies mean nothing for a local file.
+        url = str(request.url)
+        path = url2pathname(urlparse(url).path)
+        response = requests.Response()
+        response.url = url
+        response.request = request
+        if not os.path.isfile(path):
+            response.status_code = 404
+            response.reason = "Not Found"
+            response.raw = io.BytesIO(b"")
+            return response
+        content_type, encoding = mimetypes.guess_type(path)
+        if encoding or not content_type:
+            # a .csv.gz is served as is, not decoded.
+            content_type = "application/octet-stream"
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(
+            {"Content-Type": content_type, "Content-Length": str(os.path.getsize(path))}
+        )
+        response.encoding = get_encoding_from_headers(response.headers)
+        f = open(path, "rb")
+        if stream:
+            response.raw = f
+        else:
+            with f:
+                response.raw = io.BytesIO(f.read())
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+class HttpClient:
+    """
+    Thin wrapper around a `requests.Session`. Methods mirror `requests` ones so the callers don't change much.
+    """
+
+    def __init__(
+        self,
+        per_host: int = Config.HTTP_POOL_PER_HOST,
+        timeout: Tuple[float, float] = (
+            Config.HTTP_CONNECT_TIMEOUT,
+            Config.HTTP_READ_TIMEOUT,
+        ),
+        retries: int = Config.HTTP_RETRIES,
+        backoff_factor: float = Config.HTTP_BACKOFF_FACTOR,
+        cache: Optional[HttpCache] = None,
+    ) -> None:
+        self.timeout = timeout
+        self.cache = cache
+        self.per_host = per_host
+        self.stats = HttpStats()
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            # redirects are handled by requests, not urllib3. A 302 is a legit (and final) answer.
+            redirect=0,
+            status_forcelist=RETRY_STATUS,
+            backoff_factor=backoff_factor,
+            raise_on_redirect=False,
+            raise_on_status=False,
+        )
+        # pool_block: a thread waits for a free connection instead of opening a new one. It's what caps the number of
+        # concurrent requests on a host.
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=per_host,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.mount("file://", FileAdapter())
+
+    def get(
+        self,
+        url: str,
+        allow_redirects: bool = True,
+        timeout: Optional[Tuple[float, float]] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        stream = kwargs.get("stream", False)
+        # local files (a mirror) are not worth caching.
+        cache = self.cache if not url.startswith("file:") else None
+        entry = cache.lookup(url) if cache else None
+        # entries written before negatives were revalidated can be immutable 302s, they are not trusted.
+        if entry and entry.immutable and entry.status == 200:
+            self.stats.record(url, 0, 0.0, cache_hit=True)
+            return cache.to_response(entry, stream=stream)  # type: ignore
+        if entry:
+            headers = dict(kwargs.pop("headers", None) or {})
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+            kwargs["headers"] = headers
+        t1 = time.perf_counter()
+        try:
+            res = self.session.get(
+                url,
+                allow_redirects=allow_redirects,
+                timeout=timeout or self.timeout,
+                **kwargs,
+            )
+        except requests.RequestException:
+            self.stats.record(url, 0, time.perf_counter() - t1, error=True)
+            raise
+        if entry and res.status_code == 304:
+            # not modified, what we have on disk is still good.
+            self.stats.record(url, 0, time.perf_counter() - t1)
+            self.stats.record(url, 0, 0.0, cache_hit=True)
+            cache.touch(url)  # type: ignore
+            return cache.to_response(entry, stream=stream)  # type: ignore
+        if stream:
+            # counted as the body is read
+            res.raw = _CountingRaw(res.raw, lambda n: self.stats.add_bytes(url, n))
+            nb_bytes = 0
+        else:
+            nb_bytes = len(res.content)
+        self.stats.record(url, nb_bytes, time.perf_counter() - t1)
+        if cache and res.status_code in CACHEABLE_STATUS:
+            stored = cache.store(url, res)
+            if stream:
+                return cache.to_response(stored, stream=True)
+        return res
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def is_missing(res: requests.Response) -> bool:
+    """
+    302 means 404 at meteofrance 😭
+    """
+    return res.status_code in MISSING_STATUS
+
+
+_client: Optional[HttpClient] = None
+_api_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_cache() -> Optional[HttpCache]:
+    """
+    The cache configured by `HTTP_CACHE_DIR`, None if caching is disabled.
+    """
+    if not Config.HTTP_CACHE_DIR:
+        return None
+    return HttpCache(Config.HTTP_CACHE_DIR, Config.HTTP_CACHE_MAX_SIZE)
+
+
+def get_http_client() -> HttpClient:
+    """
+    Return the process wide client, creating it at first call.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(cache=get_http_cache())
+        return _client
+
+
+def get_api_http_client() -> HttpClient:
+    """
+    Return the process wide client of the api routes. Unlike the importers one, it has short timeouts, no backoff and
+    no cache: a slow upstream must not hold an api worker.
+    """
+    global _api_client
+    with _client_lock:
+        if _api_client is None:
+            _api_client = HttpClient(
+                per_host=Config.API_HTTP_POOL_PER_HOST,
+                timeout=(Config.API_HTTP_CONNECT_TIMEOUT, Config.API_HTTP_READ_TIMEOUT),
+                retries=Config.API_HTTP_RETRIES,
+                backoff_factor=0,
+            )
+        return _api_client
+
+
+def configure_http_client(**kwargs: Any) -> HttpClient:
+    """
+    Replace the process wide client with a new one (e.g. with a different `per_host` from the cli).
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        kwargs.setdefault("cache", get_http_cache())
+        _client = HttpClient(**kwargs)
+        return _client
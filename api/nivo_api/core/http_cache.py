@@ -0,0 +1,274 @@
+"""
+Persistent cache for upstream http responses.
+
+Bodies are stored once, addressed by their sha256 (`objects/ab/abcdef...`). Each url has a small json entry in
+`index/` pointing to its body, with the headers needed for revalidation (ETag, Last-Modified).
+
+Meteofrance historical files (an archived nivo month, a BRA xml, the bra list of a past day) never change: they are
+served from disk without any network call. The others (`lastNivo.js`, today bra list, ...) are revalidated with
+If-None-Match/If-Modified-Since. So are the "missing" answers (302/404): a file not published yet may be tomorrow.
+
+The cache is bounded in size. Least recently used entries are evicted first.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, asdict, field
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, Optional, Iterable
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+log = logging.getLogger(__name__)
+
+# headers kept with the body. Content-Encoding is not kept: bodies are stored decoded.
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Location")
+# status worth caching. A 302 is how meteofrance says 404. Only a 200 can be immutable.
+CACHEABLE_STATUS = (200, 302, 404)
+# bytes read at a time from a streamed body
+CHUNK_SIZE = 64 * 1024
+
+_BRA_XML_RE = re.compile(r"/BRA\.[^/]+\.\d{14}\.xml$")
+_BRA_LIST_RE = re.compile(r"/bra\.(\d{8})\.json$")
+_NIVO_ARCHIVE_RE = re.compile(r"/Archive/nivo\.(\d{6})\.csv\.gz$")
+_NIVO_DAY_RE = re.compile(r"/nivo\.(\d{8})\.csv$")
+
+
+def is_immutable(url: str, today: Optional[date] = None) -> bool:
+    """
+    Tell if the file behind this url can change in the future. Files of the current (and previous) day may still be
+    published or amended, so they are not considered immutable.
+    """
+    today = today or date.today()
+    path = url.split("?", 1)[0]
+    if _BRA_XML_RE.search(path):
+        # timestamp is in the name. An amended BRA is another file.
+        return True
+    for regex, fmt in ((_BRA_LIST_RE, "%Y%m%d"), (_NIVO_DAY_RE, "%Y%m%d")):
+        m = regex.search(path)
+        if m:
+            return datetime.strptime(m.group(1), fmt).date() < today - timedelta(days=1)
+    m = _NIVO_ARCHIVE_RE.search(path)
+    if m:
+        month = datetime.strptime(m.group(1), "%Y%m").date()
+        return month < today.replace(day=1)
+    return False
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    status: int
+    headers: Dict[str, str]
+    body_hash: str
+    size: int
+    immutable: bool
+    fetched_at: float = field(default_factory=time.time)
+
+    @property
+    def etag(self) -> Optional[str]:
+        return CaseInsensitiveDict(self.headers).get("ETag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return CaseInsensitiveDict(self.headers).get("Last-Modified")
+
+
+def _hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class HttpCache:
+    def __init__(self, directory: str, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.RLock()
+        self._size: Optional[int] = None
+        os.makedirs(self._index_dir, exist_ok=True)
+        os.makedirs(self._objects_dir, exist_ok=True)
+
+    @property
+    def _index_dir(self) -> str:
+        return os.path.join(self.directory, "index")
+
+    @property
+    def _objects_dir(self) -> str:
+        return os.path.join(self.directory, "objects")
+
+    def _index_path(self, url: str) -> str:
+        return os.path.join(self._index_dir, f"{_hash(url.encode())}.json")
+
+    def object_path(self, body_hash: str) -> str:
+        return os.path.join(self._objects_dir, body_hash[:2], body_hash)
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        path = self._index_path(url)
+        try:
+            with open(path) as f:
+                entry = CacheEntry(**json.load(f))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+        if not os.path.exists(self.object_path(entry.body_hash)):
+            return None
+        # mtime of the index file is the last access time, used for eviction.
+        os.utime(path)
+        return entry
+
+    def store(self, url: str, res: requests.Response) -> CacheEntry:
+        """
+        Write the body of `res` to the cache. A streamed response is written to disk as it's read, it's never fully in
+        memory.
+        """
+        headers = {h: res.headers[h] for h in KEPT_HEADERS if h in res.headers}
+        os.makedirs(self._objects_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self._objects_dir, suffix=".tmp")
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in res.iter_content(CHUNK_SIZE):
+                    sha.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            entry = CacheEntry(
+                url=url,
+                status=res.status_code,
+                headers=headers,
+                body_hash=sha.hexdigest(),
+                size=size,
+                immutable=res.status_code == 200 and is_immutable(url),
+            )
+            with self._lock:
+                object_path = self.object_path(entry.body_hash)
+                if not os.path.exists(object_path):
+                    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                    os.replace(tmp, object_path)
+                    if self._size is not None:
+                        self._size += entry.size
+                self._write_atomic(
+                    self._index_path(url), json.dumps(asdict(entry)).encode()
+                )
+                if self.size() > self.max_size:
+                    self.prune(int(self.max_size * 0.9))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return entry
+
+    def touch(self, url: str) -> None:
+        """
+        The entry was revalidated (304), reset its fetch date.
+        """
+        entry = self.lookup(url)
+        if entry:
+            entry.fetched_at = time.time()
+            self._write_atomic(
+                self._index_path(url), json.dumps(asdict(entry)).encode()
+            )
+
+    def to_response(self, entry: CacheEntry, stream: bool = False) -> requests.Response:
+        res = requests.Response()
+        res.status_code = entry.status
+        res.headers = CaseInsensitiveDict(entry.headers)
+        res.headers["X-Nivo-Cache"] = "HIT"
+        res.url = entry.url
+        res.reason = "OK" if entry.status == 200 else ""
+        res.encoding = get_encoding_from_headers(res.headers)
+        res.request = requests.Request("GET", entry.url).prepare()
+        f = open(self.object_path(entry.body_hash), "rb")
+        if stream:
+            res.raw = f
+        else:
+            with f:
+                res._content = f.read()
+        return res
+
+    def entries(self) -> Iterator[CacheEntry]:
+        for name in os.listdir(self._index_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self._index_dir, name)) as f:
+                    yield CacheEntry(**json.load(f))
+            except (FileNotFoundError, ValueError, TypeError):
+                continue
+
+    def _objects(self) -> Iterable[str]:
+        for root, _, files in os.walk(self._objects_dir):
+            for name in files:
+                if not name.endswith(".tmp"):
+                    yield os.path.join(root, name)
+
+    def size(self) -> int:
+        with self._lock:
+            if self._size is None:
+                self._size = sum(os.path.getsize(p) for p in self._objects())
+            return self._size
+
+    def prune(self, max_size: Optional[int] = None) -> int:
+        """
+        Evict least recently used entries until the cache is under `max_size`. Return the number of bytes freed.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        with self._lock:
+            before = size = self.size()
+            index_files = sorted(
+                (os.path.join(self._index_dir, n) for n in os.listdir(self._index_dir)),
+                key=os.path.getmtime,
+            )
+            entries = dict()
+            for path in index_files:
+                try:
+                    with open(path) as f:
+                        entries[path] = CacheEntry(**json.load(f))
+                except (ValueError, TypeError):
+                    os.remove(path)
+            refcount: Dict[str, int] = dict()
+            for e in entries.values():
+                refcount[e.body_hash] = refcount.get(e.body_hash, 0) + 1
+            # objects no one points to anymore
+            for path in self._objects():
+                if os.path.basename(path) not in refcount:
+                    size -= os.path.getsize(path)
+                    os.remove(path)
+            for path, e in entries.items():
+                if size <= max_size:
+                    break
+                os.remove(path)
+                refcount[e.body_hash] -= 1
+                if refcount[e.body_hash] == 0:
+                    object_path = self.object_path(e.body_hash)
+                    if os.path.exists(object_path):
+                        size -= os.path.getsize(object_path)
+                        os.remove(object_path)
+            self._size = size
+            freed = before - size
+        log.info(f"http cache pruned, {freed} bytes freed")
+        return freed
+
+    def clear(self) -> int:
+        return self.prune(0)
+
+    def info(self) -> Dict:
+        entries = list(self.entries())
+        return {
+            "directory": self.directory,
+            "entries": len(entries),
+            "immutable_entries": sum(1 for e in entries if e.immutable),
+            "size": self.size(),
+            "max_size": self.max_size,
+        }
@@ -0,0 +1,213 @@
+"""
+Per stage profiling of the cli commands, enabled by their `--profile` option.
+
+The import code marks its stages (`fetch`, `decompress`, `parse`, `transform`, `fk_resolve`, `persist`...) with
+`stage(name)`. While `profile` is running, each stage gets its wall and cpu time, number of calls, bytes and rows, and
+the db round trips (statements sent by SQLAlchemy, and COPY) made in it. Otherwise `stage` does nothing.
+
+Stages nest: the time of a stage doesn't include the stages run inside it, so the stages of a thread add up to its
+time. Stages run in threads (downloads) are summed over the threads, they can add up to more than the command took.
+
+The summary is written as json at the end of the command, to compare runs over time. cProfile stats of the main thread
+can be written too (`python -m pstats` reads them).
+"""
+import cProfile
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from nivo_api.core.http import get_http_client
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    bytes: int = 0
+    rows: int = 0
+    db_round_trips: int = 0
+
+
+class Frame:
+    """
+    A running stage. Bytes and rows moved in it are added to `bytes` and `rows`.
+    """
+
+    __slots__ = ("name", "bytes", "rows", "db_round_trips", "child_wall", "child_cpu")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.bytes = 0
+        self.rows = 0
+        self.db_round_trips = 0
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+
+
+class Profiler:
+    def __init__(self, command: str) -> None:
+        self.command = command
+        self.stages: Dict[str, StageStats] = dict()
+        self.db_round_trips = 0
+        self.started_at = datetime.now()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> List[Frame]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = list()
+        return stack
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Frame]:
+        stack = self._stack()
+        frame = Frame(name)
+        stack.append(frame)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield frame
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            stack.pop()
+            if stack:
+                stack[-1].child_wall += wall
+                stack[-1].child_cpu += cpu
+            self.add(
+                name,
+                wall - frame.child_wall,
+                cpu - frame.child_cpu,
+                frame.bytes,
+                frame.rows,
+                frame.db_round_trips,
+            )
+
+    def add(
+        self,
+        name: str,
+        wall: float,
+        cpu: float,
+        bytes: int = 0,
+        rows: int = 0,
+        db_round_trips: int = 0,
+    ) -> None:
+        """
+        Add a stage measured elsewhere (e.g. in a worker process).
+        """
+        with self._lock:
+            stats = self.stages.setdefault(name, StageStats())
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.bytes += bytes
+            stats.rows += rows
+            stats.db_round_trips += db_round_trips
+
+    def round_trip(self) -> None:
+        stack = self._stack()
+        if stack:
+            stack[-1].db_round_trips += 1
+        with self._lock:
+            self.db_round_trips += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: asdict(stats) for name, stats in self.stages.items()}
+        return {
+            "command": self.command,
+            "started_at": self.started_at.isoformat(),
+            "wall": time.perf_counter() - self._wall,
+            "cpu": time.process_time() - self._cpu,
+            "db_round_trips": self.db_round_trips,
+            "stages": stages,
+            "http": get_http_client().stats.as_dict(),
+        }
+
+
+_profiler: Optional[Profiler] = None
+# yielded by `stage` when nothing is profiled
+_NO_FRAME = Frame("")
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Frame]:
+    profiler = _profiler
+    if profiler is None:
+        yield _NO_FRAME
+        return
+    with profiler.stage(name) as frame:
+        yield frame
+
+
+def add_stage(name: str, wall: float, cpu: float, **counts: int) -> None:
+    if _profiler is not None:
+        _profiler.add(name, wall, cpu, **counts)
+
+
+def round_trip() -> None:
+    """
+    Count a round trip SQLAlchemy doesn't see (a COPY on the raw connection).
+    """
+    if _profiler is not None:
+        _profiler.round_trip()
+
+
+def _on_execute(*args: Any) -> None:
+    round_trip()
+
+
+def _write(summary: Dict, path: str) -> None:
+    if path == "-":
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    log.info(f"Profile written to {path}")
+
+
+@contextmanager
+def profile(
+    command: str, path: Optional[str] = None, pstats_path: Optional[str] = None
+) -> Iterator[Optional[Profiler]]:
+    """
+    Profile what runs inside, write the json summary to `path` ("-" for stdout) and the cProfile stats to
+    `pstats_path`. Without `path` nor `pstats_path` nothing is profiled.
+    """
+    global _profiler
+    if not path and not pstats_path:
+        yield None
+        return
+    _profiler = profiler = Profiler(command)
+    event.listen(Engine, "before_cursor_execute", _on_execute)
+    cprofile = cProfile.Profile() if pstats_path else None
+    if cprofile:
+        cprofile.enable()
+    try:
+        yield profiler
+    finally:
+        if cprofile and pstats_path:
+            cprofile.disable()
+            cprofile.dump_stats(pstats_path)
+        event.remove(Engine, "before_cursor_execute", _on_execute)
+        _profiler = None
+        if path:
+            _write(profiler.as_dict(), path)
@@ -1,8 +1,10 @@
 from typing import List, Union
 
 import feedparser
+import requests
 
 from nivo_api.core.api_schema.geojson import FeatureCollection
+from nivo_api.core.http import get_api_http_client
 from nivo_api.namespaces.flowcapt import flowcapt_api
 
 flowcapt_api.add_model("FeatureCollection", FeatureCollection)
@@ -17,7 +19,12 @@ class FlowCaptRssToJSON:
         self.url = url
 
     def __call__(self, *args, **kwargs) -> dict:
-        req = feedparser.parse(self.url)
+        try:
+            res = get_api_http_client().get(self.url)
+            res.raise_for_status()
+        except requests.RequestException:
+            raise AssertionError(f"Fail to query {self.url}")
+        req = feedparser.parse(res.content)
         try:
             data = self._parse_headers(req["feed"])
             measures = self._parse_measures(req["entries"])
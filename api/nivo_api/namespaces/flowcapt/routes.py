@@ -2,13 +2,13 @@ from datetime import timedelta, datetime
 from json import JSONDecodeError
 from urllib.parse import urlencode
 
-import requests
 from flask import jsonify
 from flask_restx import Resource, abort
 
 from nivo_api.core.api_schema.geojson import FeatureCollection
 from nivo_api.core.db.connection import connection_scope
 from nivo_api.core.db.models.sql.flowcapt import FlowCaptStationTable
+from nivo_api.core.http import get_api_http_client
 from nivo_api.namespaces.flowcapt import flowcapt_api
 from nivo_api.namespaces.flowcapt.models import FlowCaptRssToJSON
 from nivo_api.settings import Config
@@ -48,7 +48,7 @@ class FlowCaptMeasureWithTimestamp(Resource):
     def get(self, station_id: str) -> dict:
         url = _build_query(station_id, 168)
         try:
-            res = requests.get(url).json()
+            res = get_api_http_client().get(url).json()
             lastdata = datetime.strptime(res["lastdata"], "%Y-%m-%d %H:%M:%S")
             for k, values in res["measures"].items():
                 res["measures"][k] = [
@@ -2,7 +2,9 @@ from nivo_api.core.api_schema.geojson import Feature, FeatureCollection
 from nivo_api.namespaces.nivo_meteo import nivo_meteo
 
 from nivo_api.namespaces.utils import UUIDField
-from flask_restx import fields, reqparse
+from flask_restx import fields, reqparse, inputs
+
+from nivo_api.core.db.models.sql.nivo import ROLLUP_FIELDS, ROLLUP_AGGREGATES
 
 nivo_meteo.add_model("Feature", Feature)
 nivo_meteo.add_model("FeatureCollection", FeatureCollection)
@@ -13,6 +15,20 @@ record_limit_parser.add_argument(
     "day_limit", type=int, help="Number of day from last record to return"
 )
 
+rollup_date_parser = reqparse.RequestParser()
+rollup_date_parser.add_argument(
+    "from", type=inputs.date, help="First day to return (YYYY-MM-DD)"
+)
+rollup_date_parser.add_argument("to", type=inputs.date, help="Last day to return")
+
+
+def _rollup_fields(prefix: str) -> dict:
+    return {
+        f"{field}_{aggregate}": fields.Float(attribute=f"{prefix}_{field}_{aggregate}")
+        for field in ROLLUP_FIELDS
+        for aggregate in ROLLUP_AGGREGATES
+    }
+
 
 records_model = nivo_meteo.model(
     "RecordsModel",
@@ -67,3 +83,22 @@ records_model = nivo_meteo.model(
         "m_vol_neige": fields.Float(attribute="nr_m_vol_neige"),
     },
 )
+
+daily_rollup_model = nivo_meteo.model(
+    "DailyRollupModel",
+    {
+        "date": fields.Date(attribute="ndr_date"),
+        "records": fields.Integer(attribute="ndr_records"),
+        **_rollup_fields("ndr"),
+    },
+)
+
+season_rollup_model = nivo_meteo.model(
+    "SeasonRollupModel",
+    {
+        "season": fields.Integer(attribute="nsr_season"),
+        "days": fields.Integer(attribute="nsr_days"),
+        "records": fields.Integer(attribute="nsr_records"),
+        **_rollup_fields("nsr"),
+    },
+)
@@ -3,13 +3,24 @@ from uuid import UUID
 
 from flask import jsonify
 from flask_restx import Resource
-from sqlalchemy import func
+from sqlalchemy import func, select
 
 from nivo_api.core.api_schema.geojson import Feature, FeatureCollection
 from nivo_api.core.db.connection import connection_scope, session_scope
 from nivo_api.core.db.models.orm.nivo import NivoRecord, SensorStation
-from nivo_api.core.db.models.sql.nivo import SensorStationTable, NivoRecordTable
-from .models import records_model, record_limit_parser
+from nivo_api.core.db.models.sql.nivo import (
+    SensorStationTable,
+    NivoRecordTable,
+    NivoDailyRollupTable,
+    NivoSeasonRollupTable,
+)
+from .models import (
+    records_model,
+    record_limit_parser,
+    daily_rollup_model,
+    season_rollup_model,
+    rollup_date_parser,
+)
 
 from .namespace import nivo_meteo
 
@@ -52,14 +63,15 @@ class NivoRecordsBySensorStationResource(Resource):
             )
             if limit_by_day:
                 last_date = (
-                    sess.query(func.max(NivoRecord.nr_date).label("max"))
+                    sess.query(func.max(NivoRecord.nr_date))
                     .filter(NivoRecord.nr_nivo_sensor == station_id)
-                    .subquery("last_date")
-                )
-                req = req.filter(
-                    func.age(last_date.c.max, NivoRecord.nr_date)
-                    < timedelta(days=limit_by_day)
+                    .scalar()
                 )
+                if last_date:
+                    # a bound on nr_date: only the partitions of these days are read.
+                    req = req.filter(
+                        NivoRecord.nr_date > last_date - timedelta(days=limit_by_day)
+                    )
             if limit:
                 req = req.limit(limit)
             return req.all()
@@ -82,6 +94,45 @@ class LastNivoRecordsBySensorStationResource(Resource):
             )
 
 
+@nivo_meteo.route("/stations/<uuid:station_id>/records/daily")
+class DailyRollupsBySensorStationResource(Resource):
+    @nivo_meteo.response(200, "OK", daily_rollup_model)
+    @nivo_meteo.marshal_with(daily_rollup_model)
+    @nivo_meteo.expect(rollup_date_parser)
+    def get(self, station_id: UUID):
+        """
+        min, max and mean of the main fields of the station, one row per day.
+        """
+        args = rollup_date_parser.parse_args()
+        req = (
+            select([NivoDailyRollupTable])
+            .where(NivoDailyRollupTable.c.ndr_nivo_sensor == station_id)
+            .order_by(NivoDailyRollupTable.c.ndr_date)
+        )
+        if args.get("from"):
+            req = req.where(NivoDailyRollupTable.c.ndr_date >= args["from"])
+        if args.get("to"):
+            req = req.where(NivoDailyRollupTable.c.ndr_date <= args["to"])
+        with connection_scope() as con:
+            return con.execute(req).fetchall()
+
+
+@nivo_meteo.route("/stations/<uuid:station_id>/records/seasons")
+class SeasonRollupsBySensorStationResource(Resource):
+    @nivo_meteo.response(200, "OK", season_rollup_model)
+    @nivo_meteo.marshal_with(season_rollup_model)
+    def get(self, station_id: UUID):
+        """
+        min, max and mean of the main fields of the station, one row per season (from the 1st of August).
+        """
+        with connection_scope() as con:
+            return con.execute(
+                select([NivoSeasonRollupTable])
+                .where(NivoSeasonRollupTable.c.nsr_nivo_sensor == station_id)
+                .order_by(NivoSeasonRollupTable.c.nsr_season)
+            ).fetchall()
+
+
 @nivo_meteo.route("/records/<uuid:record_id>")
 class OneNivoRecordResource(Resource):
     @nivo_meteo.response(200, "OK", records_model)
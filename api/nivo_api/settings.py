@@ -25,3 +25,22 @@ class Config(dict):
     FLOWCAPT_MEASURE_URL = os.getenv(
         "FLOWCAPT_MEASURE_URL", "http://www.isaw.ch/idod/idod.php"
     )
+    # upstream http client. Timeouts are in seconds.
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+    HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", 0.5))
+    HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", 4))
+    # upstream calls made while serving an api request (flowcapt proxy): fail fast rather than hold a worker.
+    API_HTTP_CONNECT_TIMEOUT = float(os.getenv("API_HTTP_CONNECT_TIMEOUT", 3))
+    API_HTTP_READ_TIMEOUT = float(os.getenv("API_HTTP_READ_TIMEOUT", 5))
+    API_HTTP_RETRIES = int(os.getenv("API_HTTP_RETRIES", 0))
+    API_HTTP_POOL_PER_HOST = int(os.getenv("API_HTTP_POOL_PER_HOST", 10))
+    # on disk cache of upstream responses. Disabled if no directory is set. Size is in bytes.
+    HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR")
+    HTTP_CACHE_MAX_SIZE = int(os.getenv("HTTP_CACHE_MAX_SIZE", 2 * 1024**3))
+    # ingest_daemon polling. Intervals are in seconds, jitter is a fraction of the interval.
+    INGEST_NIVO_INTERVAL = float(os.getenv("INGEST_NIVO_INTERVAL", 15 * 60))
+    INGEST_BRA_INTERVAL = float(os.getenv("INGEST_BRA_INTERVAL", 10 * 60))
+    INGEST_JITTER = float(os.getenv("INGEST_JITTER", 0.1))
+    INGEST_MAX_BACKOFF = float(os.getenv("INGEST_MAX_BACKOFF", 60 * 60))
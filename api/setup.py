@@ -10,7 +10,7 @@ setup(
     author="Remi Desgrange",
     author_email="remi+nivo@desgran.ge",
     url="https://nivo.desgran.ge",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmark", "benchmark.*"]),
     install_requires=REQUIREMENTS,
     package_data={"nivo_api.cli.data": ["*.geojson"], "nivo_api.static": ["*"]},
     include_package_data=True,
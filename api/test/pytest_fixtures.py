@@ -2,7 +2,7 @@ import pytest
 
 from nivo_api.core.db.connection import create_database_connections, metadata
 
-schema = ["bra", "nivo", "flowcapt"]
+schema = ["bra", "nivo", "flowcapt", "ingest"]
 
 
 @pytest.fixture
@@ -0,0 +1,118 @@
+import gzip
+import io
+from datetime import date
+
+import lxml.etree as ET
+import pytest
+import requests
+
+from benchmark.stub_server import StubServer
+from benchmark.synthetic import SyntheticSource
+from nivo_api.cli.bra_record_helper.extract import extract_bra
+from nivo_api.cli.bra_record_helper.miscellaneous import (
+    get_bra_date,
+    parse_bra_list,
+    bra_xml_name,
+)
+from nivo_api.cli.nivo_normalizer import NivoNormalizer
+from nivo_api.cli.nivo_record_helper import (
+    NivoDate,
+    ArchiveNivoCss,
+    NivoCsv,
+    get_last_nivo_date,
+)
+from nivo_api.core.http import get_http_client, is_missing
+from nivo_api.namespaces.flowcapt.models import FlowCaptRssToJSON
+from nivo_api.settings import Config
+
+TODAY = date(2020, 1, 15)
+
+
+@pytest.fixture
+def source():
+    return SyntheticSource(seasons=1, massifs=3, stations=5, today=TODAY)
+
+
+@pytest.fixture
+def stub(source, monkeypatch):
+    with StubServer(source) as server:
+        for name, value in server.env().items():
+            monkeypatch.setattr(Config, name, value)
+        yield server
+
+
+class TestSyntheticSource:
+    def test_deterministic(self, source):
+        other = SyntheticSource(seasons=1, massifs=3, stations=5, today=TODAY)
+        name = "Archive/nivo.201912.csv.gz"
+        assert source.nivo_file(name) == other.nivo_file(name)
+        assert source.bra_file("bra.20200101.json") == other.bra_file(
+            "bra.20200101.json"
+        )
+
+    def test_bra(self, source):
+        bra_dates = parse_bra_list(source.bra_list(date(2020, 1, 1)))
+        assert list(bra_dates) == source.massifs
+        massif, diffusion = next(iter(bra_dates.items()))
+        raw = source.bra_file(bra_xml_name(massif, diffusion))
+        rows = extract_bra(ET.parse(io.BytesIO(raw)))
+        assert rows.massif == massif
+        assert rows.record["br_production_date"] == diffusion.isoformat()
+        assert rows.record["br_expiration_date"] == "2020-01-02T18:00:00"
+        assert rows.risks
+
+    def test_not_published(self, source):
+        # summer, before the first season, in the future
+        for day in ("20190901", "20190101", "20200116"):
+            assert source.bra_file(f"bra.{day}.json") is None
+        assert source.bra_file("BRA.CHABLAIS.20200101000000.xml") is None
+        assert source.nivo_file("Archive/nivo.201901.csv.gz") is None
+        assert source.nivo_file("nivo.20191201.csv") is None
+
+    def test_nivo_csv(self, source):
+        raw = gzip.decompress(source.nivo_file("Archive/nivo.201912.csv.gz"))
+        lines = [line.split(";") for line in raw.decode().splitlines()]
+        normalizer = NivoNormalizer(lines[0])
+        records = normalizer.normalize(lines[1:])
+        assert len(records) == 31 * 5
+        assert not normalizer.failures
+        assert not normalizer.rejected
+
+    def test_files(self, source):
+        files = list(source.files())
+        assert ("nivo", "nivo.20200115.csv") in files
+        assert ("nivo", "Archive/nivo.201908.csv.gz") in files
+        assert all(source.get(d, n) is not None for d, n in files[:20])
+
+    def test_write(self, source, tmp_path):
+        assert source.write(str(tmp_path)) == len(list(source.files()))
+        assert (tmp_path / "bra" / "massifs.json").exists()
+
+
+class TestStubServer:
+    def test_bra(self, stub, source):
+        bra_dates = get_bra_date(date(2020, 1, 1))
+        assert list(bra_dates) == source.massifs
+        with pytest.raises(AssertionError):
+            get_bra_date(date(2020, 6, 1))
+
+    def test_missing_is_a_302(self, stub):
+        res = get_http_client().get(
+            f"{Config.BRA_BASE_URL}/bra.20200601.json", allow_redirects=False
+        )
+        assert is_missing(res)
+
+    def test_nivo(self, stub):
+        assert get_last_nivo_date().nivo_date == TODAY
+        archive = ArchiveNivoCss(NivoDate(True, date(2019, 12, 1)), None)
+        archive.fetch_and_parse()
+        assert len(archive.normalize()) == 31 * 5
+        archive.close()
+        with pytest.raises(requests.HTTPError):
+            NivoCsv(NivoDate(False, date(2019, 12, 1)), None).fetch_and_parse()
+
+    def test_flowcapt(self, stub):
+        res = FlowCaptRssToJSON(f"{Config.FLOWCAPT_MEASURE_URL}?d=24&s=FGIE1&f=rss")()
+        assert res["station"] == "FGIE1"
+        assert res["lastdata"] == "2020-01-15 00:00:00"
+        assert len(res["measures"]["Snow drift"]) == 24
@@ -0,0 +1,156 @@
+import os
+import time
+from datetime import datetime, date
+
+import pytest
+import responses
+
+from nivo_api.cli.bra_record_helper.backfill import (
+    BraFetcher,
+    BackfillReport,
+    BraDayJournal,
+)
+from nivo_api.cli.bra_record_helper.extract import BraRows
+from nivo_api.cli.bra_record_helper.miscellaneous import BraListMissing
+from nivo_api.core.db.models.sql.ingest import IngestStatus
+from nivo_api.settings import Config
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestBraFetcher:
+    @responses.activate
+    def test_bulletins_are_yield_in_order(self):
+        with open(
+            os.path.join(CURRENT_DIR, "test_data/BRA.CHABLAIS.20190101142328.xml"), "rb"
+        ) as f:
+            xml = f.read()
+        massifs = ["CHABLAIS", "ARAVIS", "MONT-BLANC", "BEAUFORTAIN"]
+        for m in massifs:
+            responses.add(
+                responses.GET,
+                Config.BRA_BASE_URL + f"/BRA.{m}.20190101142328.xml",
+                body=xml,
+            )
+        bra_date = datetime(2019, 1, 1, 14, 23, 28)
+        with BraFetcher(jobs=3) as fetcher:
+            res = list(fetcher.bulletins((m, bra_date) for m in massifs))
+        assert [r[0] for r in res] == massifs
+        for _, d, future in res:
+            assert d == bra_date
+            assert isinstance(future.result(), BraRows)
+            assert future.result().massif == "CHABLAIS"
+
+    @responses.activate
+    def test_missing_index_is_raised_by_the_future(self):
+        responses.add(
+            responses.GET, Config.BRA_BASE_URL + "/bra.20190101.json", status=302
+        )
+        with BraFetcher(jobs=2) as fetcher:
+            ((d, future),) = list(fetcher.indexes([date(2019, 1, 1)]))
+        assert d == date(2019, 1, 1)
+        with pytest.raises(AssertionError):
+            future.result()
+
+    @responses.activate
+    def test_bulletins_are_parsed_by_workers(self):
+        with open(
+            os.path.join(CURRENT_DIR, "test_data/BRA.CHABLAIS.20190101142328.xml"), "rb"
+        ) as f:
+            xml = f.read()
+        responses.add(
+            responses.GET,
+            Config.BRA_BASE_URL + "/BRA.CHABLAIS.20190101142328.xml",
+            body=xml,
+        )
+        responses.add(
+            responses.GET,
+            Config.BRA_BASE_URL + "/BRA.ARAVIS.20190101142328.xml",
+            status=302,
+        )
+        bra_date = datetime(2019, 1, 1, 14, 23, 28)
+        with BraFetcher(jobs=2, workers=1) as fetcher:
+            (chablais, aravis) = list(
+                fetcher.bulletins([("CHABLAIS", bra_date), ("ARAVIS", bra_date)])
+            )
+            rows = chablais[2].result()
+            assert isinstance(rows, BraRows)
+            assert rows.massif == "CHABLAIS"
+            assert isinstance(rows.record["br_raw_xml"], str)
+            assert len(rows.weather_forecasts) == 3
+            # download errors go through the parse stage
+            with pytest.raises(AssertionError):
+                aravis[2].result()
+
+
+def test_report_throughput():
+    report = BackfillReport(persisted=10, started_at=time.perf_counter() - 5)
+    assert 1.5 < report.throughput <= 2
+    assert "10 bulletins persisted, 0 failed" in str(report)
+
+
+class FakeJournal:
+    def __init__(self):
+        self.recorded = dict()
+
+    def should_process(self, source, key):
+        return key not in self.recorded
+
+    def record(self, item, error=None):
+        self.recorded[item.key] = (
+            IngestStatus.FAILED if error else item.status,
+            item.rows,
+            item.bytes,
+        )
+
+
+class TestBraDayJournal:
+    day = date(2019, 1, 1)
+    bra_date = datetime(2019, 1, 1, 14, 23, 28)
+
+    def test_day_is_done_when_all_bulletins_are(self):
+        journal = FakeJournal()
+        days = BraDayJournal(journal)
+        days.start(self.day)
+        days.scheduled(self.day, "CHABLAIS", self.bra_date)
+        days.scheduled(self.day, "ARAVIS", self.bra_date)
+        days.downloaded(("CHABLAIS", self.bra_date), 100)
+        days.bulletin_done(("CHABLAIS", self.bra_date))
+        days.indexed(self.day)
+        assert journal.recorded == dict()
+        days.bulletin_done(("ARAVIS", self.bra_date))
+        assert journal.recorded == {"2019-01-01": (IngestStatus.DONE, 2, 100)}
+        assert not days.should_fetch(self.day)
+
+    def test_day_fails_with_a_bulletin(self):
+        journal = FakeJournal()
+        days = BraDayJournal(journal)
+        days.start(self.day)
+        days.scheduled(self.day, "CHABLAIS", self.bra_date)
+        days.bulletin_done(("CHABLAIS", self.bra_date), ValueError())
+        days.indexed(self.day)
+        assert journal.recorded["2019-01-01"][0] == IngestStatus.FAILED
+
+    def test_day_without_bra_is_skipped(self):
+        journal = FakeJournal()
+        days = BraDayJournal(journal)
+        days.start(self.day)
+        days.index_failed(self.day, BraListMissing())
+        assert journal.recorded["2019-01-01"][0] == IngestStatus.SKIPPED
+
+    def test_day_with_upstream_error_fails(self):
+        journal = FakeJournal()
+        days = BraDayJournal(journal)
+        days.start(self.day)
+        # e.g. a 503 after the retries
+        days.index_failed(self.day, AssertionError())
+        assert journal.recorded["2019-01-01"][0] == IngestStatus.FAILED
+
+    def test_recent_days_are_not_recorded(self):
+        journal = FakeJournal()
+        days = BraDayJournal(journal)
+        today = date.today()
+        days.start(today)
+        days.index_failed(today, AssertionError())
+        assert journal.recorded == dict()
+        assert days.should_fetch(today)
@@ -0,0 +1,120 @@
+"""
+The single pass extractor must give the same rows as the per field XPath `_get_*` functions of `xpath_reference`.
+"""
+import os
+import pickle
+from copy import deepcopy
+from typing import Dict, List
+from unittest.mock import patch
+from uuid import uuid4
+
+import lxml.etree as ET
+import pytest
+
+from nivo_api.cli.bra_record_helper.extract import extract_bra, extract_bra_bytes
+from test.test_cli.test_bra_record_helper.xpath_reference import (
+    _get_bra_record,
+    _get_risk,
+    _get_bra_snow_records,
+    _get_fresh_snow_record,
+    _get_weather_forecast,
+    _get_risk_forecast,
+)
+from nivo_api.core.db.models.sql.bra import BraRecordTable
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load() -> ET._ElementTree:
+    with open(
+        os.path.join(CURRENT_DIR, "test_data/BRA.CHABLAIS.20190101142328.xml"), "rb"
+    ) as xmlfile:
+        return ET.parse(xmlfile)
+
+
+def _no_risk(xml):
+    xml.find("//RISQUE").attrib["RISQUE1"] = "-1"
+    xml.find("//RISQUE").attrib["ALTITUDE"] = "-1"
+
+
+def _empty_forecast(xml):
+    for attr in ("ISO0", "ISO-10", "PLUIENEIGE", "MERNUAGES", "TEMPSSENSIBLE"):
+        xml.find("//METEO/ECHEANCE").attrib[attr] = "-1"
+    xml.find("//METEO/ECHEANCE").attrib["DD1"] = ""
+
+
+def _no_snow_altitude(xml):
+    xml.find("//ENNEIGEMENT/NIVEAU").attrib["ALTI"] = "-1"
+
+
+def _without_wf_id(forecasts: List[Dict], winds: List[Dict]):
+    # wf_id are random uuid, compare the position of the forecast instead.
+    position = {wf["wf_id"]: i for i, wf in enumerate(forecasts)}
+    return (
+        [{k: v for k, v in wf.items() if k != "wf_id"} for wf in forecasts],
+        [dict(w, wfaa_wf_id=position[w["wfaa_wf_id"]]) for w in winds],
+    )
+
+
+@pytest.mark.parametrize("alter", [None, _no_risk, _empty_forecast, _no_snow_altitude])
+def test_parity_with_xpath(alter):
+    xml = _load()
+    if alter:
+        alter(xml)
+    bra_id = uuid4()
+    massif_id = uuid4()
+    with patch(
+        "test.test_cli.test_bra_record_helper.xpath_reference._get_massif_id",
+        return_value=massif_id,
+    ):
+        expected_record = _get_bra_record(xml, bra_id, None)
+    expected_forecast = _get_weather_forecast(xml, bra_id)
+
+    rows = extract_bra(deepcopy(xml), bra_id)
+    record = dict(rows.record, br_massif=massif_id)
+    assert rows.massif == "CHABLAIS"
+    assert record.keys() == expected_record.keys()
+    for k, v in expected_record.items():
+        if k != "br_raw_xml":
+            assert record[k] == v, k
+    assert rows.risks == [r for r in _get_risk(xml.find("//RISQUE"), bra_id) if r]
+    assert rows.snow_records == list(_get_bra_snow_records(xml, bra_id))
+    assert rows.fresh_snow_records == list(_get_fresh_snow_record(xml, bra_id))
+    assert rows.risk_forecasts == list(_get_risk_forecast(xml, bra_id))
+    assert _without_wf_id(
+        rows.weather_forecasts, rows.weather_forecasts_at_altitude
+    ) == _without_wf_id(
+        expected_forecast["weather_forecast"],
+        expected_forecast["weather_forecast_at_altitude"],
+    )
+
+
+def test_as_entities_resolve_massif():
+    rows = extract_bra(_load())
+    massif_id = uuid4()
+    entities = rows.as_entities(massif_id)
+    assert len(entities) == 7
+    ((table, record),) = entities[0].items()
+    assert table is BraRecordTable
+    assert record["br_massif"] == massif_id
+    assert "br_massif" not in rows.record
+
+
+def test_extract_bra_bytes_is_picklable():
+    with open(
+        os.path.join(CURRENT_DIR, "test_data/BRA.CHABLAIS.20190101142328.xml"), "rb"
+    ) as f:
+        rows = extract_bra_bytes(f.read())
+    copy = pickle.loads(pickle.dumps(rows))
+    assert copy.massif == "CHABLAIS"
+    assert copy.record["br_dangerous_slopes"] == rows.record["br_dangerous_slopes"]
+    assert ET.fromstring(copy.record["br_raw_xml"].encode()).tag == "Bulletins"
+
+
+def test_missing_section():
+    xml = _load()
+    tendances = xml.find("//TENDANCES")
+    tendances.getparent().remove(tendances)
+    with pytest.raises(ValueError) as e:
+        extract_bra(xml)
+    assert e.value.args[0] == "TENDANCES is missing from the bulletin"
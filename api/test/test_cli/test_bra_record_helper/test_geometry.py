@@ -0,0 +1,28 @@
+from shapely.geometry import Point, Polygon
+
+from nivo_api.cli.bra_record_helper.geometry import (
+    MassifGeometryIndex,
+    get_massif_geometry_index,
+)
+
+
+class TestMassifGeometryIndex:
+    def test_first_massif_wins(self):
+        index = MassifGeometryIndex()
+        first = Polygon([(1, 1), (1, 2), (2, 2), (2, 1)])
+        index.add("Renoso", first)
+        index.add("RENOSO", Polygon([(2, 2), (2, 3), (3, 3), (3, 2)]))
+        assert len(index) == 1
+        assert index.get("renoso") is first
+        assert list(index) == ["Renoso"]
+
+    def test_find_massif_of_a_point(self):
+        index = MassifGeometryIndex()
+        index.add("Renoso", Polygon([(1, 1), (1, 2), (2, 2), (2, 1)]))
+        assert index.find(Point(1.5, 1.5)) == "Renoso"
+        assert index.find(Point(5, 5)) is None
+
+    def test_shipped_geojson_is_parsed_once(self):
+        index = get_massif_geometry_index()
+        assert "chablais" in index
+        assert get_massif_geometry_index() is index
@@ -0,0 +1,84 @@
+import os
+
+import lxml.etree as ET
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+
+from nivo_api.cli.bra_record_helper.maintenance import compact_wind_forecast
+from nivo_api.cli.bra_record_helper.persist import persist_bra, persist_massif
+from nivo_api.cli.bra_record_helper.process import process_xml
+from nivo_api.core.db.connection import connection_scope
+from nivo_api.core.db.models.sql.bra import (
+    WeatherForecastTable,
+    WeatherForecastAtAltitudeTable,
+)
+from test.pytest_fixtures import database
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _wind_count(con) -> int:
+    return con.execute(
+        select([func.count()]).select_from(WeatherForecastAtAltitudeTable)
+    ).scalar()
+
+
+class TestCompactWindForecast:
+    def _import_inflated_bra(self, con) -> None:
+        persist_massif(
+            con,
+            "CHABLAIS",
+            {"name": "Haute-savoie", "number": "74"},
+            "Alpes du Nord",
+        )
+        with open(
+            os.path.join(CURRENT_DIR, "test_data/BRA.CHABLAIS.20190101142328.xml"),
+            "rb",
+        ) as f:
+            persist_bra(con, process_xml(con, ET.parse(f)))
+        # what was stored before: each forecast got the winds of all the forecasts.
+        winds = con.execute(select([WeatherForecastAtAltitudeTable])).fetchall()
+        with con.begin():
+            for wf_id in con.execute(select([WeatherForecastTable.c.wf_id])):
+                con.execute(
+                    insert(WeatherForecastAtAltitudeTable),
+                    [
+                        {
+                            "wfaa_wf_id": wf_id.wf_id,
+                            "wfaa_wind_altitude": w.wfaa_wind_altitude,
+                            "wfaa_wind_direction": w.wfaa_wind_direction,
+                            "wfaa_wind_force": w.wfaa_wind_force,
+                        }
+                        for w in winds
+                        if w.wfaa_wf_id != wf_id.wf_id
+                    ],
+                )
+
+    def test_compact(self, database):
+        with connection_scope(database.engine) as con:
+            self._import_inflated_bra(con)
+            assert _wind_count(con) == 18
+            report = compact_wind_forecast(con, batch_size=1)
+            assert report.records == 1
+            assert report.forecasts_fixed == 3
+            assert report.rows_deleted == 18
+            assert report.rows_inserted == 6
+            assert _wind_count(con) == 6
+            assert report.size_before is None
+            assert "only freed by a vacuum" in str(report)
+
+    def test_compact_vacuum(self, database):
+        with connection_scope(database.engine) as con:
+            self._import_inflated_bra(con)
+            report = compact_wind_forecast(con, vacuum=True)
+            assert report.size_after <= report.size_before
+            assert "MiB" in str(report)
+
+    def test_compact_twice_is_a_noop(self, database):
+        with connection_scope(database.engine) as con:
+            self._import_inflated_bra(con)
+            compact_wind_forecast(con)
+            report = compact_wind_forecast(con)
+            assert report.forecasts_fixed == 0
+            assert report.rows_deleted == 0
+            assert _wind_count(con) == 6
@@ -1,6 +1,7 @@
+import io
 import json
 import os
-from datetime import datetime
+from datetime import datetime, date, timedelta
 
 from geoalchemy2 import WKBElement
 from geoalchemy2.shape import to_shape
@@ -8,15 +9,18 @@ from lxml import etree
 import pytest
 import responses
 from freezegun import freeze_time
-from unittest.mock import patch, mock_open
 from sqlalchemy.engine import Connection
 from test.pytest_fixtures import database
 
+from nivo_api.cli.bra_record_helper.geometry import MassifGeometryIndex
 from nivo_api.cli.bra_record_helper.miscellaneous import (
     get_last_bra_date,
+    get_bra_date,
     get_bra_xml,
+    BraListMissing,
     get_massif_geom,
     check_bra_record_exist,
+    BraIngestedIndex,
 )
 from nivo_api.core.db.connection import connection_scope
 from nivo_api.core.db.models.sql.bra import (
@@ -56,6 +60,20 @@ class TestGetBraDate:
         assert res["ASPE-OSSAU"] == datetime.strptime("20190101135359", "%Y%m%d%H%M%S")
         assert len(res.keys()) == 36
 
+    @responses.activate
+    def test_missing_and_failing_list(self):
+        responses.add(
+            responses.GET, Config.BRA_BASE_URL + "/bra.20190101.json", status=302
+        )
+        responses.add(
+            responses.GET, Config.BRA_BASE_URL + "/bra.20190102.json", status=503
+        )
+        with pytest.raises(BraListMissing):
+            get_bra_date(date(2019, 1, 1))
+        with pytest.raises(AssertionError) as e:
+            get_bra_date(date(2019, 1, 2))
+        assert not isinstance(e.value, BraListMissing)
+
     @responses.activate
     @freeze_time("2019-01-01")
     def test_get_last_date_malformed_json(self):
@@ -145,9 +163,9 @@ class TestGetMassifGeom:
             "type": "FeatureCollection"
         }
         """
-        with patch("builtins.open", mock_open(read_data=data)):
-            ret = get_massif_geom("ReNoSo")
-            assert to_shape(ret).wkt == "POLYGON ((1 1, 1 2, 2 2, 2 1, 1 1))"
+        index = MassifGeometryIndex.from_geojson(io.StringIO(data))
+        ret = get_massif_geom("ReNoSo", index)
+        assert to_shape(ret).wkt == "POLYGON ((1 1, 1 2, 2 2, 2 1, 1 1))"
 
     def test_massif_have_same_name(self):
         data = """
@@ -189,9 +207,9 @@ class TestGetMassifGeom:
             "type": "FeatureCollection"
         }
         """
-        with patch("builtins.open", mock_open(read_data=data)):
-            ret = get_massif_geom("ReNoSo")
-            assert to_shape(ret).wkt == "POLYGON ((1 1, 1 2, 2 2, 2 1, 1 1))"
+        index = MassifGeometryIndex.from_geojson(io.StringIO(data))
+        ret = get_massif_geom("ReNoSo", index)
+        assert to_shape(ret).wkt == "POLYGON ((1 1, 1 2, 2 2, 2 1, 1 1))"
 
 
 class TestFetchDepartmentGeomFromOpendata:
@@ -241,3 +259,43 @@ class TestCheckBraRecordExist:
             self.load_data(con, datetime.now())
             r = check_bra_record_exist(con, "test", datetime.now())
         assert r is True
+
+
+class TestBraIngestedIndex(TestCheckBraRecordExist):
+    def test_empty_db(self, database):
+        with connection_scope(database.engine) as con:
+            index = BraIngestedIndex(con)
+        assert len(index) == 0
+        assert ("CHABLAIS", datetime.now()) not in index
+        assert index.is_day_complete(date(2019, 1, 1)) is False
+
+    def test_already_exist_record(self, database):
+        bra_date = datetime(2019, 1, 1, 16, 0, 0)
+        with connection_scope(database.engine) as con:
+            self.load_data(con, bra_date)
+            index = BraIngestedIndex(con)
+        assert ("test", bra_date) in index
+        assert ("test", bra_date + timedelta(hours=1)) not in index
+        assert index.is_day_complete(date(2019, 1, 1)) is True
+        assert index.is_day_complete(date(2019, 1, 2)) is False
+
+    def test_start_date(self, database):
+        bra_date = datetime(2019, 1, 1, 16, 0, 0)
+        with connection_scope(database.engine) as con:
+            self.load_data(con, bra_date)
+            index = BraIngestedIndex(con, start=date(2019, 1, 2))
+        assert ("test", bra_date) not in index
+
+    def test_scheduled_bulletin_is_marked(self, database):
+        with connection_scope(database.engine) as con:
+            index = BraIngestedIndex(con)
+        index.add("CHABLAIS", datetime(2019, 1, 1, 16, 0, 0))
+        assert ("CHABLAIS", datetime(2019, 1, 1, 16, 0, 0)) in index
+
+    @freeze_time("2019-01-02")
+    def test_recent_day_is_never_complete(self, database):
+        bra_date = datetime(2019, 1, 1, 16, 0, 0)
+        with connection_scope(database.engine) as con:
+            self.load_data(con, bra_date)
+            index = BraIngestedIndex(con)
+        assert index.is_day_complete(date(2019, 1, 1)) is False
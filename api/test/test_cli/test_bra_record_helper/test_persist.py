@@ -1,14 +1,28 @@
+import os
 from uuid import UUID
 
+import lxml.etree as ET
+from sqlalchemy import select, bindparam, func
 
-from sqlalchemy import select, bindparam
-
-from nivo_api.cli.bra_record_helper.persist import persist_zone, persist_massif
+from nivo_api.cli.bra_record_helper.persist import (
+    persist_zone,
+    persist_massif,
+    BraBatchWriter,
+)
+from nivo_api.cli.bra_record_helper.process import process_xml
 from nivo_api.core.db.connection import connection_scope
-from nivo_api.core.db.models.sql.bra import ZoneTable, DepartmentTable, MassifTable
+from nivo_api.core.db.models.sql.bra import (
+    ZoneTable,
+    DepartmentTable,
+    MassifTable,
+    BraRecordTable,
+    WeatherForecastAtAltitudeTable,
+)
 
 from test.pytest_fixtures import database
 
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 class TestPersistZone:
     def test_insert_zone(self, database):
@@ -67,3 +81,48 @@ class TestPersistMassif:
 class TestPersistBra:
     def test_persist_bra(self):
         raise NotImplementedError()
+
+
+class TestBraBatchWriter:
+    def _processed_bra(self, con):
+        with open(
+            os.path.join(CURRENT_DIR, "test_data/BRA.CHABLAIS.20190101142328.xml"),
+            "rb",
+        ) as f:
+            return process_xml(con, ET.parse(f))
+
+    def _count(self, con, table) -> int:
+        return con.execute(select([func.count()]).select_from(table)).scalar()
+
+    def _setup(self, con):
+        persist_massif(
+            con,
+            "CHABLAIS",
+            {"name": "Haute-savoie", "number": "74"},
+            "Alpes du Nord",
+        )
+
+    def test_batch(self, database):
+        with connection_scope(database.engine) as con:
+            self._setup(con)
+            with BraBatchWriter(con, batch_size=2) as writer:
+                for i in range(3):
+                    writer.add(f"bra {i}", self._processed_bra(con))
+                # the first batch is already written
+                assert writer.persisted == 2
+            assert writer.persisted == 3
+            assert writer.failed == []
+            assert self._count(con, BraRecordTable) == 3
+            assert self._count(con, WeatherForecastAtAltitudeTable) == 18
+
+    def test_bad_bulletin_does_not_sink_the_batch(self, database):
+        with connection_scope(database.engine) as con:
+            self._setup(con)
+            bad = self._processed_bra(con)
+            bad[0][BraRecordTable]["br_max_risk"] = 42
+            with BraBatchWriter(con, batch_size=10) as writer:
+                writer.add("good", self._processed_bra(con))
+                writer.add("bad", bad)
+            assert writer.persisted == 1
+            assert writer.failed == ["bad"]
+            assert self._count(con, BraRecordTable) == 1
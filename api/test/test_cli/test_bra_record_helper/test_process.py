@@ -8,9 +8,7 @@ import lxml.etree as ET
 import pytest
 from test.pytest_fixtures import database
 
-from nivo_api.cli.bra_record_helper.process import (
-    process_xml,
-    _get_massif_id,
+from test.test_cli.test_bra_record_helper.xpath_reference import (
     _get_dangerous_slopes,
     _get_bra_snow_records,
     _get_fresh_snow_record,
@@ -18,6 +16,7 @@ from nivo_api.cli.bra_record_helper.process import (
     _get_weather_forecast,
     _get_risk,
 )
+from nivo_api.cli.bra_record_helper.process import process_xml, _get_massif_id
 from nivo_api.core.db.connection import connection_scope
 from nivo_api.core.db.models.sql.bra import DangerousSlopes, WindDirection, WeatherType
 
@@ -187,21 +186,36 @@ def test_get_fresh_snow_record(bra_xml_parsed):
 
 class TestGetWeatherForecastAtAltitude:
     def test_get_weather_forecast_at_altitude_work(self, bra_xml_parsed):
-        wf_id = uuid4()
-        res = _get_weather_forecast_at_altitude(bra_xml_parsed, wf_id)
-        assert isinstance(res, list)
-        for i, data in enumerate(res):
-            assert data["wfaa_wind_altitude"] == (2000, 2500)[i % 2]
-            assert data["wfaa_wf_id"] == wf_id
-            assert data["wfaa_wind_direction"] == (
-                WindDirection.NE,
-                WindDirection.N,
-                WindDirection.NE,
-                WindDirection.N,
-                WindDirection.NE,
-                WindDirection.NE,
-            )[i]
-            assert data["wfaa_wind_force"] == (20, 50, 40, 60, 60, 70)[i]
+        expected = [
+            ((WindDirection.NE, 20), (WindDirection.N, 50)),
+            ((WindDirection.NE, 40), (WindDirection.N, 60)),
+            ((WindDirection.NE, 60), (WindDirection.NE, 70)),
+        ]
+        echeances = bra_xml_parsed.find("//METEO").findall("ECHEANCE")
+        assert len(echeances) == len(expected)
+        for echeance, expected_winds in zip(echeances, expected):
+            wf_id = uuid4()
+            res = _get_weather_forecast_at_altitude(echeance, [2000, 2500], wf_id)
+            assert isinstance(res, list)
+            assert len(res) == 2
+            for i, data in enumerate(res):
+                assert data["wfaa_wind_altitude"] == (2000, 2500)[i]
+                assert data["wfaa_wf_id"] == wf_id
+                assert data["wfaa_wind_direction"] == expected_winds[i][0]
+                assert data["wfaa_wind_force"] == expected_winds[i][1]
+
+    def test_one_wind_per_altitude_and_forecast(self, bra_xml_parsed):
+        res = _get_weather_forecast(bra_xml_parsed, uuid4())
+        assert len(res["weather_forecast_at_altitude"]) == 2 * len(
+            res["weather_forecast"]
+        )
+        for wf in res["weather_forecast"]:
+            winds = [
+                w
+                for w in res["weather_forecast_at_altitude"]
+                if w["wfaa_wf_id"] == wf["wf_id"]
+            ]
+            assert [w["wfaa_wind_altitude"] for w in winds] == [2000, 2500]
 
 
 class TestGetWeatherForecast:
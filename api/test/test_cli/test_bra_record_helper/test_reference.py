@@ -0,0 +1,92 @@
+from uuid import UUID
+
+import pytest
+from sqlalchemy import delete
+
+from nivo_api.cli.bra_record_helper.persist import persist_massif
+from nivo_api.cli.bra_record_helper.reference import (
+    massif_name_variants,
+    get_reference_cache,
+)
+from nivo_api.core.db.connection import connection_scope
+from nivo_api.core.db.models.sql.bra import MassifTable
+
+from test.pytest_fixtures import database
+
+
+def test_massif_name_variants():
+    assert list(massif_name_variants("ORLU  ST BARTHELEMY"))[1] == "ORLU__ST_BARTHELEMY"
+    assert "HAUT-VAR/HAUT-VERDON" in massif_name_variants("HAUT-VAR_HAUT-VERDON")
+
+
+class TestBraReferenceCache:
+    def test_massif_id_is_cached(self, database):
+        with connection_scope(database.engine) as con:
+            m_id = persist_massif(
+                con,
+                "CHABLAIS",
+                {"name": "Haute-savoie", "number": "74"},
+                "Alpes du Nord",
+            )
+            cache = get_reference_cache(con)
+            assert cache.massif_id(con, "CHABLAIS") == m_id
+            # served from memory, not from the db anymore.
+            con.execute(delete(MassifTable))
+            assert cache.massif_id(con, "CHABLAIS") == m_id
+
+    def test_massif_name_variant_is_found(self, database):
+        with connection_scope(database.engine) as con:
+            m_id = persist_massif(
+                con,
+                "ORLU__ST_BARTHELEMY",
+                {"name": "Ariege", "number": "09"},
+                "Pyrenees",
+            )
+            cache = get_reference_cache(con)
+            assert isinstance(m_id, UUID)
+            assert cache.massif_id(con, "ORLU  ST BARTHELEMY") == m_id
+
+    def test_unknown_massif(self, database):
+        with connection_scope(database.engine) as con:
+            with pytest.raises(ValueError) as e:
+                get_reference_cache(con).massif_id(con, "CHABLAIS")
+            assert str(e.value) == "Cannot found massif CHABLAIS in the db"
+
+    def test_unknown_massif_reloads_once(self, database, monkeypatch):
+        with connection_scope(database.engine) as con:
+            cache = get_reference_cache(con)
+            refresh = cache.refresh
+            calls = list()
+
+            def _refresh(con):
+                calls.append(con)
+                refresh(con)
+
+            monkeypatch.setattr(cache, "refresh", _refresh)
+            for _ in range(3):
+                with pytest.raises(ValueError):
+                    cache.massif_id(con, "CHABLAIS")
+            # first load, then one reload for the miss
+            assert len(calls) == 2
+            m_id = persist_massif(
+                con,
+                "CHABLAIS",
+                {"name": "Haute-savoie", "number": "74"},
+                "Alpes du Nord",
+            )
+            refresh(con)
+            assert cache.massif_id(con, "CHABLAIS") == m_id
+
+    def test_massif_inserted_elsewhere_is_found_after_refresh(self, database):
+        with connection_scope(database.engine) as con:
+            cache = get_reference_cache(con)
+            cache.refresh(con)
+            assert cache.massifs == dict()
+            m_id = persist_massif(
+                con,
+                "CHABLAIS",
+                {"name": "Haute-savoie", "number": "74"},
+                "Alpes du Nord",
+            )
+            cache.massifs.clear()
+            assert cache.massif_id(con, "CHABLAIS") == m_id
@@ -1,13 +1,20 @@
+import json
+
+import responses
 from click.testing import CliRunner
 from uuid import UUID
+from sqlalchemy import inspect
 from sqlalchemy.engine import RowProxy
 
 from nivo_api.cli import init_db
+from nivo_api.cli.exposed_cmd import import_nivo_sensor_station
+from nivo_api.cli.database import create_missing_indexes
 from nivo_api.cli.nivo_record_helper import create_new_unknown_nivo_sensor_station
 from nivo_api.core.db.connection import connection_scope, create_database_connections
 
 # populate metadata
-from nivo_api.core.db.models.sql.nivo import metadata
+from nivo_api.core.db.models.sql.nivo import metadata, NivoRecordTable
+from nivo_api.settings import Config
 from test.pytest_fixtures import database
 
 
@@ -43,3 +50,42 @@ def test_create_new_unkown_nivo_sensor_station(database):
         res = create_new_unknown_nivo_sensor_station(123456, con)
         assert isinstance(res, RowProxy)
         assert isinstance(res.nss_id, UUID)
+
+
+class TestCreateMissingIndexes:
+    def test_index_added_to_existing_table(self, database):
+        index = next(iter(NivoRecordTable.indexes))
+        index.drop(database.engine)
+        create_missing_indexes(database.engine)
+        names = {
+            i["name"]
+            for i in inspect(database.engine).get_indexes(
+                NivoRecordTable.name, schema=NivoRecordTable.schema
+            )
+        }
+        assert index.name in names
+
+
+class TestProfileOption:
+    @responses.activate
+    def test_profile(self, database, tmp_path):
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [6.0, 45.0]},
+            "properties": {"Nom": "Tignes", "ID": "7589", "Altitude": "2000"},
+        }
+        responses.add(
+            responses.GET,
+            f"{Config.METEO_FRANCE_NIVO_BASE_URL}/postesNivo.json",
+            json={"features": [feature]},
+        )
+        path = tmp_path / "profile.json"
+        result = CliRunner().invoke(
+            import_nivo_sensor_station, ["--profile", str(path)]
+        )
+        assert result.exit_code == 0, result.output
+        summary = json.loads(path.read_text())
+        assert summary["command"] == "import_nivo_sensor_station"
+        assert summary["stages"]["fetch"]["bytes"] > 0
+        assert summary["stages"]["persist"]["rows"] == 1
+        assert summary["stages"]["persist"]["db_round_trips"] >= 1
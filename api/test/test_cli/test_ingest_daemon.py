@@ -0,0 +1,136 @@
+import os
+import random
+import signal
+import threading
+from datetime import date
+
+import responses
+from sqlalchemy import select, func
+
+from nivo_api.cli.ingest_daemon import (
+    Schedule,
+    IngestDaemon,
+    NivoPoller,
+    BraPoller,
+    stop_on_signals,
+)
+from nivo_api.core.db.connection import connection_scope
+from nivo_api.core.db.models.sql.nivo import NivoRecordTable
+from nivo_api.settings import Config
+from test.pytest_fixtures import database
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class FakePoller:
+    def __init__(self, name, results, stop=None):
+        self.name = name
+        self.results = list(results)
+        self.stop = stop
+        self.polls = 0
+
+    def poll(self):
+        self.polls += 1
+        result = self.results.pop(0)
+        if not self.results and self.stop:
+            self.stop.set()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TestSchedule:
+    def test_jitter(self):
+        schedule = Schedule(100, jitter=0.1)
+        rnd = random.Random(0)
+        delays = [schedule.next_delay(True, rnd) for _ in range(100)]
+        assert all(90 <= d <= 110 for d in delays)
+        assert len(set(delays)) > 1
+
+    def test_backoff(self):
+        schedule = Schedule(100, jitter=0, max_backoff=1000)
+        assert schedule.next_delay(False) == 200
+        assert schedule.next_delay(False) == 400
+        assert schedule.next_delay(False) == 800
+        assert schedule.next_delay(False) == 1000
+        assert schedule.failures == 4
+        assert schedule.next_delay(True) == 100
+        assert schedule.failures == 0
+
+
+class TestIngestDaemon:
+    def test_once(self):
+        pollers = [FakePoller("a", [1]), FakePoller("b", [ValueError("boom")])]
+        IngestDaemon([(p, Schedule(3600)) for p in pollers]).run(once=True)
+        assert [p.polls for p in pollers] == [1, 1]
+
+    def test_run_until_stop(self):
+        stop = threading.Event()
+        failing = FakePoller("a", [ValueError("boom")] * 3, stop)
+        schedule = Schedule(0.001, jitter=0)
+        IngestDaemon([(failing, schedule)], stop).run()
+        assert failing.polls == 3
+        assert schedule.failures == 3
+
+    def test_stop_while_waiting(self):
+        stop = threading.Event()
+        poller = FakePoller("a", [0, 0])
+        threading.Timer(0.05, stop.set).start()
+        IngestDaemon([(poller, Schedule(3600))], stop).run()
+        assert poller.polls == 1
+
+
+class TestStopOnSignals:
+    def test_sigterm(self):
+        handlers = {s: signal.getsignal(s) for s in (signal.SIGTERM, signal.SIGINT)}
+        stop = threading.Event()
+        try:
+            stop_on_signals(stop)
+            os.kill(os.getpid(), signal.SIGTERM)
+            assert stop.wait(1)
+        finally:
+            for s, handler in handlers.items():
+                signal.signal(s, handler)
+
+
+class TestNivoPoller:
+    @responses.activate
+    def test_poll(self, database):
+        responses.add(
+            responses.GET, Config.METEO_FRANCE_LAST_NIVO_JS_URL, body="jour=20190812;"
+        )
+        csv_url = f"{Config.METEO_FRANCE_NIVO_BASE_URL}/nivo.20190812.csv"
+        with open(
+            os.path.join(
+                CURRENT_DIR, "test_nivo_record_helper/test_data/nivo.20190812.csv"
+            )
+        ) as f:
+            responses.add(
+                responses.GET, csv_url, body=f.read(), content_type="text/plain"
+            )
+        poller = NivoPoller(database.engine)
+        assert poller.poll() > 0
+        assert poller.last == date(2019, 8, 12)
+        # same date: the file isn't downloaded again
+        assert poller.poll() == 0
+        assert len([c for c in responses.calls if c.request.url == csv_url]) == 1
+        with connection_scope(database.engine) as con:
+            assert (
+                con.execute(
+                    select([func.count()]).select_from(NivoRecordTable)
+                ).scalar()
+                > 0
+            )
+
+
+class TestBraPoller:
+    @responses.activate
+    def test_no_list_yet(self, database):
+        responses.add(
+            responses.GET, f"{Config.BRA_BASE_URL}/bra.20200101.json", status=302
+        )
+        poller = BraPoller(database.engine, jobs=1)
+        try:
+            assert poller.poll(date(2020, 1, 1)) == 0
+        finally:
+            poller.close()
@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import select
+
+from nivo_api.cli.ingest_journal import IngestJournal, IngestItem
+from nivo_api.core.db.models.sql.ingest import (
+    IngestItemTable,
+    IngestRunTable,
+    IngestStatus,
+)
+from test.pytest_fixtures import database
+
+
+def _item(con, key):
+    return con.execute(
+        select([IngestItemTable]).where(IngestItemTable.c.ii_key == key)
+    ).first()
+
+
+class TestIngestJournal:
+    def test_run_is_recorded(self, database):
+        with IngestJournal(database.engine, "import_test") as journal:
+            journal.record(IngestItem("bra", "2019-01-01", bytes=10, rows=2))
+        with database.engine.connect() as con:
+            run = con.execute(select([IngestRunTable])).first()
+            item = _item(con, "2019-01-01")
+        assert run.ir_id == journal.run_id
+        assert run.ir_command == "import_test"
+        assert run.ir_status == IngestStatus.DONE
+        assert run.ir_items_done == 1
+        assert run.ir_ended_at is not None
+        assert item.ii_status == IngestStatus.DONE
+        assert item.ii_bytes == 10
+        assert item.ii_rows == 2
+        assert item.ii_attempts == 1
+
+    def test_run_crash(self, database):
+        with pytest.raises(KeyboardInterrupt):
+            with IngestJournal(database.engine, "import_test"):
+                raise KeyboardInterrupt()
+        with database.engine.connect() as con:
+            run = con.execute(select([IngestRunTable])).first()
+        assert run.ir_status == IngestStatus.CRASHED
+
+    def test_track_failure(self, database):
+        with IngestJournal(database.engine, "import_test") as journal:
+            with pytest.raises(ValueError):
+                with journal.track("nivo", "2019-01"):
+                    raise ValueError("bad csv")
+        with database.engine.connect() as con:
+            item = _item(con, "2019-01")
+            run = con.execute(select([IngestRunTable])).first()
+        assert item.ii_status == IngestStatus.FAILED
+        assert item.ii_error_class == "ValueError"
+        assert item.ii_error == "bad csv"
+        assert run.ir_items_failed == 1
+
+    def test_resume(self, database):
+        with IngestJournal(database.engine, "import_test") as journal:
+            journal.record(IngestItem("nivo", "done"))
+            journal.record(IngestItem("nivo", "skipped", status=IngestStatus.SKIPPED))
+            journal.record(IngestItem("nivo", "failed"), ValueError())
+        with IngestJournal(database.engine, "import_test") as journal:
+            assert not journal.should_process("nivo", "done")
+            assert not journal.should_process("nivo", "skipped")
+            assert not journal.should_process("nivo", "failed")
+            assert journal.should_process("nivo", "new")
+            # keys are by source
+            assert journal.should_process("bra", "done")
+        with IngestJournal(
+            database.engine, "import_test", retry_failed=True
+        ) as journal:
+            assert journal.should_process("nivo", "failed")
+            assert not journal.should_process("nivo", "done")
+            journal.record(IngestItem("nivo", "failed"))
+        with database.engine.connect() as con:
+            item = _item(con, "failed")
+        assert item.ii_status == IngestStatus.DONE
+        assert item.ii_attempts == 2
+        assert item.ii_error_class is None
+        assert item.ii_run == journal.run_id
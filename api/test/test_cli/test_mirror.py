@@ -0,0 +1,114 @@
+import io
+import json
+import tarfile
+from datetime import date, datetime
+
+import pytest
+import responses
+
+from requests import HTTPError
+
+from nivo_api.cli.bra_record_helper.miscellaneous import get_bra_date, BraListMissing
+from nivo_api.cli.mirror import Mirror, use_source_dir
+from nivo_api.cli.nivo_record_helper import NivoDate, NivoCsv
+from nivo_api.settings import Config
+
+BRA = "http://upstream/bra"
+NIVO = "http://upstream/nivo"
+BRA_LIST = [{"massif": "CHABLAIS", "heures": ["20200101132405"]}]
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    for name in ("BRA_BASE_URL", "METEO_FRANCE_NIVO_BASE_URL"):
+        monkeypatch.setattr(Config, name, getattr(Config, name))
+    monkeypatch.setattr(
+        Config, "METEO_FRANCE_LAST_NIVO_JS_URL", Config.METEO_FRANCE_LAST_NIVO_JS_URL
+    )
+    Config.BRA_BASE_URL = BRA
+    Config.METEO_FRANCE_NIVO_BASE_URL = NIVO
+
+
+class TestMirror:
+    @responses.activate
+    def test_sync(self, upstream, tmp_path):
+        responses.add(responses.GET, f"{NIVO}/Archive/nivo.202001.csv.gz", body=b"abc")
+        m = Mirror(str(tmp_path), today=date(2020, 3, 1))
+        path = m.sync("nivo", "Archive/nivo.202001.csv.gz")
+        assert path == str(tmp_path / "nivo" / "Archive" / "nivo.202001.csv.gz")
+        assert open(path, "rb").read() == b"abc"
+        # immutable, not downloaded again
+        assert m.sync("nivo", "Archive/nivo.202001.csv.gz") == path
+        assert len(responses.calls) == 1
+        assert (m.report.downloaded, m.report.kept, m.report.bytes) == (1, 1, 3)
+
+    @responses.activate
+    def test_mutable_file_is_downloaded_again(self, upstream, tmp_path):
+        responses.add(responses.GET, f"{NIVO}/lastNivo.js", body="a")
+        m = Mirror(str(tmp_path))
+        m.sync("nivo", "lastNivo.js")
+        m.sync("nivo", "lastNivo.js")
+        assert m.report.downloaded == 2
+
+    @responses.activate
+    def test_missing_upstream(self, upstream, tmp_path):
+        responses.add(responses.GET, f"{NIVO}/nivo.20200101.csv", status=302)
+        responses.add(responses.GET, f"{NIVO}/nivo.20200102.csv", status=500)
+        m = Mirror(str(tmp_path), jobs=2)
+        paths = dict(m.sync_all("nivo", ["nivo.20200101.csv", "nivo.20200102.csv"]))
+        assert paths == {"nivo.20200101.csv": None, "nivo.20200102.csv": None}
+        assert (m.report.missing, m.report.failed) == (1, 1)
+        assert not (tmp_path / "nivo").exists() or not list(
+            (tmp_path / "nivo").iterdir()
+        )
+
+    @responses.activate
+    def test_bra(self, upstream, tmp_path):
+        responses.add(responses.GET, f"{BRA}/massifs.json", json=[])
+        responses.add(responses.GET, f"{BRA}/bra.20200101.json", json=BRA_LIST)
+        responses.add(
+            responses.GET, f"{BRA}/BRA.CHABLAIS.20200101132405.xml", body="<xml/>"
+        )
+        m = Mirror(str(tmp_path))
+        m.bra([date(2020, 1, 1)])
+        assert (tmp_path / "bra" / "BRA.CHABLAIS.20200101132405.xml").exists()
+        assert m.report.downloaded == 3
+
+    @responses.activate
+    def test_nivo(self, upstream, tmp_path):
+        for name in ("postesNivo.json", "lastNivo.js", "nivo.20200101.csv"):
+            responses.add(responses.GET, f"{NIVO}/{name}", body="x")
+        m = Mirror(str(tmp_path))
+        m.nivo([NivoDate(False, date(2020, 1, 1))])
+        assert (tmp_path / "nivo" / "nivo.20200101.csv").exists()
+        assert m.report.downloaded == 3
+
+
+class TestUseSourceDir:
+    def test_imports_read_the_mirror(self, upstream, tmp_path):
+        (tmp_path / "bra").mkdir()
+        (tmp_path / "bra" / "bra.20200101.json").write_text(json.dumps(BRA_LIST))
+        use_source_dir(str(tmp_path))
+        assert Config.BRA_BASE_URL == (tmp_path / "bra").as_uri()
+        assert Config.METEO_FRANCE_LAST_NIVO_JS_URL.endswith("/nivo/lastNivo.js")
+        assert get_bra_date(date(2020, 1, 1)) == {
+            "CHABLAIS": datetime(2020, 1, 1, 13, 24, 5)
+        }
+        # missing from the mirror is not "no bra that day"
+        with pytest.raises(AssertionError) as e:
+            get_bra_date(date(2020, 1, 2))
+        assert not isinstance(e.value, BraListMissing)
+        with pytest.raises(HTTPError) as e:
+            NivoCsv(NivoDate(False, date(2020, 1, 2)), None).fetch_and_parse()
+        assert e.value.response.status_code == 404
+
+    def test_tarball(self, upstream, tmp_path):
+        tarball = tmp_path / "mirror.tar.gz"
+        with tarfile.open(tarball, "w:gz") as tar:
+            data = json.dumps(BRA_LIST).encode()
+            info = tarfile.TarInfo("mirror/bra/bra.20200101.json")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        root = use_source_dir(str(tarball))
+        assert root.endswith("mirror")
+        assert get_bra_date(date(2020, 1, 1))
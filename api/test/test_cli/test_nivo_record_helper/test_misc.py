@@ -1,20 +1,28 @@
 import os
 from csv import DictReader
-from datetime import date
+from datetime import date, datetime
 from uuid import uuid4, UUID
 
 import pytest
 import responses
 from requests import HTTPError
+from sqlalchemy import select, inspect
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import IntegrityError
 
+from nivo_api.cli.database import create_missing_indexes
 from nivo_api.cli import get_last_nivo_date, check_nivo_doesnt_exist, download_nivo
 from nivo_api.cli.nivo_record_helper import (
     ArchiveNivoCss,
     NivoCsv,
     create_new_unknown_nivo_sensor_station,
+    create_unknown_nivo_sensor_stations,
+    copy_nivo_records,
+    dedup_nivo_records,
+    import_nivo,
+    get_nivo_sensor_station_ids,
     NivoDate,
+    NivoIngestedIndex,
 )
 from nivo_api.core.db.connection import connection_scope
 from nivo_api.core.db.models.sql.nivo import SensorStationTable, NivoRecordTable
@@ -97,6 +105,22 @@ class TestCheckNivoDoesntExist:
             r = check_nivo_doesnt_exist(con, date(2019, 1, 1))
         assert r is False
 
+    def test_check_nivo_next_day(self, database):
+        self._inject_test_data(database.engine)
+        with connection_scope(database.engine) as con:
+            assert check_nivo_doesnt_exist(con, date(2019, 1, 2))
+
+
+class TestNivoIngestedIndex:
+    def test_ingested_days(self, database):
+        TestCheckNivoDoesntExist()._inject_test_data(database.engine)
+        with connection_scope(database.engine) as con:
+            ingested = NivoIngestedIndex(con)
+            assert date(2019, 1, 1) in ingested
+            assert date(2019, 1, 2) not in ingested
+            assert len(ingested) == 1
+            assert len(NivoIngestedIndex(con, start=date(2019, 1, 2))) == 0
+
 
 class TestDownloadNivo:
     @responses.activate
@@ -147,6 +171,103 @@ class TestImportNivo:
                 )
                 n.nivo_csv = nivo_csv
 
+    def test_import_nivo_copy_records(self, database):
+        with open(os.path.join(CURRENT_DIR, "test_data/nivo.20190812.csv")) as f:
+            with connection_scope(database.engine) as con:
+                n = NivoCsv(
+                    NivoDate(is_archive=False, nivo_date=date(2019, 8, 12)), con
+                )
+                n.nivo_csv = DictReader(f, delimiter=";")
+                imported = import_nivo(con, n, batch_size=2)
+                records = con.execute(
+                    select([NivoRecordTable]).order_by(NivoRecordTable.c.nr_date)
+                ).fetchall()
+        assert imported > 2
+        assert len(records) == imported
+        assert isinstance(records[0].nr_id, UUID)
+        assert records[0].nr_date.date() == date(2019, 8, 12)
+
+    def test_copy_nivo_records_nothing(self, database):
+        with connection_scope(database.engine) as con:
+            assert copy_nivo_records(con, iter([])) == 0
+
+    def test_import_twice_does_not_duplicate(self, database):
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            record = {"nr_date": datetime(2019, 8, 12), "nr_nivo_sensor": station}
+            copy_nivo_records(con, [dict(record, nr_t=280.0)])
+            copy_nivo_records(con, [dict(record, nr_t=281.0)])
+            records = con.execute(select([NivoRecordTable])).fetchall()
+        assert len(records) == 1
+        assert records[0].nr_t == 281.0
+
+    def test_duplicates_in_a_batch(self, database):
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            record = {"nr_date": datetime(2019, 8, 12), "nr_nivo_sensor": station}
+            copied = copy_nivo_records(
+                con, [dict(record, nr_t=280.0), dict(record, nr_t=281.0)]
+            )
+            records = con.execute(select([NivoRecordTable])).fetchall()
+        assert copied == 2
+        assert len(records) == 1
+        assert records[0].nr_t == 281.0
+
+    def test_foreign_key_are_resolved_with_the_station_map(self, database):
+        with open(os.path.join(CURRENT_DIR, "test_data/nivo.20190812.csv")) as f:
+            with connection_scope(database.engine) as con:
+                known = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+                n = NivoCsv(
+                    NivoDate(is_archive=False, nivo_date=date(2019, 8, 12)), con
+                )
+                n.nivo_csv = DictReader(f, delimiter=";")
+                n.normalize()
+                n.find_and_replace_foreign_key_value()
+                stations = get_nivo_sensor_station_ids(con)
+        assert n.stations == stations
+        assert n.cleaned_csv[0]["nr_nivo_sensor"] == known
+        assert {line["nr_nivo_sensor"] for line in n.cleaned_csv} <= set(
+            stations.values()
+        )
+
+
+class TestDedupNivoRecords:
+    def test_dedup(self, database):
+        database.engine.execute("DROP INDEX nivo.uq_nivo_records_sensor_date")
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            record = {"nr_date": datetime(2019, 8, 12), "nr_nivo_sensor": station}
+            con.execute(
+                NivoRecordTable.insert(),
+                [record, record, dict(record, nr_date=datetime(2019, 8, 13))],
+            )
+            deleted = dedup_nivo_records(con)
+            records = con.execute(select([NivoRecordTable])).fetchall()
+        assert deleted == 1
+        assert len(records) == 2
+        indexes = inspect(database.engine).get_indexes("records", schema="nivo")
+        assert "uq_nivo_records_sensor_date" in {i["name"] for i in indexes}
+
+    def test_index_not_created_with_duplicates(self, database):
+        database.engine.execute("DROP INDEX nivo.uq_nivo_records_sensor_date")
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            record = {"nr_date": datetime(2019, 8, 12), "nr_nivo_sensor": station}
+            con.execute(NivoRecordTable.insert(), [record, record])
+        create_missing_indexes(database.engine)
+        indexes = inspect(database.engine).get_indexes("records", schema="nivo")
+        assert "uq_nivo_records_sensor_date" not in {i["name"] for i in indexes}
+
+    def test_import_without_index_points_to_dedup(self, database):
+        database.engine.execute("DROP INDEX nivo.uq_nivo_records_sensor_date")
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            record = {"nr_date": datetime(2019, 8, 12), "nr_nivo_sensor": station}
+            with pytest.raises(RuntimeError, match="dedup_nivo_records"):
+                copy_nivo_records(con, [record])
+            assert dedup_nivo_records(con) == 0
+            assert copy_nivo_records(con, [record]) == 1
+
 
 class TestCreateNewUnknownNivoSensorStation:
     def test_create_new_unknown_nivo_sensor_station(self, database):
@@ -163,3 +284,17 @@ class TestCreateNewUnknownNivoSensorStation:
                 r = create_new_unknown_nivo_sensor_station(10, con)
                 assert isinstance(r.nss_id, UUID)
                 create_new_unknown_nivo_sensor_station(10, con)
+
+
+class TestCreateUnknownNivoSensorStations:
+    def test_create_unknown_nivo_sensor_stations(self, database):
+        with connection_scope(database.engine) as con:
+            existing = create_new_unknown_nivo_sensor_station(10, con).nss_id
+            r = create_unknown_nivo_sensor_stations([10, 11, 12, 11], con)
+            assert r[10] == existing
+            assert set(r) == {10, 11, 12}
+            assert get_nivo_sensor_station_ids(con) == r
+
+    def test_nothing_to_create(self, database):
+        with connection_scope(database.engine) as con:
+            assert create_unknown_nivo_sensor_stations([], con) == dict()
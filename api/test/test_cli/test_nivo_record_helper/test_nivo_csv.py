@@ -1,6 +1,9 @@
+import gzip
 import io
+import os
+import tracemalloc
 from csv import DictReader
-from datetime import datetime
+from datetime import datetime, date
 
 import pytest
 import responses
@@ -8,9 +11,19 @@ from nivo_api.core.db.connection import connection_scope
 from pkg_resources import resource_stream, resource_filename
 from requests import HTTPError
 
-from nivo_api.cli.nivo_record_helper import NivoCsv, NivoDate
+from nivo_api.cli import nivo_record_helper
+from nivo_api.cli.nivo_record_helper import (
+    NivoCsv,
+    NivoDate,
+    ArchiveNivoCss,
+    NivoFetcher,
+    NivoImportReport,
+)
+from nivo_api.settings import Config
 from test.pytest_fixtures import database
 
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 class TestNivoCsv:
     @responses.activate
@@ -55,15 +68,168 @@ class TestNivoCsv:
             assert str(e.value) == "'nr_numer_sta'"
 
 
+def _archive(url, body, **kwargs):
+    responses.add(
+        responses.GET, url, body=body, content_type="application/x-gzip", **kwargs
+    )
+    return ArchiveNivoCss(NivoDate(True, date(2017, 1, 1)), None, url, stations={})
+
+
+def _synthetic_csv(lines: int) -> bytes:
+    with open(os.path.join(CURRENT_DIR, "test_data/nivo.20190812.csv"), "rb") as f:
+        header, line = f.readline(), f.readline()
+    return header + line * lines
+
+
 class TestArchiveNicoCsv:
+    @responses.activate
     def test_decompress_gzip(self):
-        raise NotImplementedError()
+        with open(os.path.join(CURRENT_DIR, "test_data/nivo.201701.csv.gz"), "rb") as f:
+            body = f.read()
+        a = _archive("http://test/nivo.201701.csv.gz", body)
+        a.fetch_and_parse()
+        lines = a.normalize()
+        assert len(lines) == len(gzip.decompress(body).splitlines()) - 1
+        assert a.size == len(body)
+        assert lines[0]["nr_date"].date() == date(2017, 1, 1)
 
+    @responses.activate
     def test_wrong_zip(self):
-        raise NotImplementedError()
+        a = _archive("http://test/nivo.201701.csv.gz", b"not a gzip file")
+        a.fetch_and_parse()
+        with pytest.raises(OSError):
+            a.normalize()
 
     def test_wrong_data(self):
         raise NotImplementedError()
 
+    @responses.activate
     def test_multiple_files_in_gzip(self):
-        raise NotImplementedError()
+        body = _synthetic_csv(2)
+        a = _archive(
+            "http://test/nivo.201701.csv.gz",
+            gzip.compress(body) + gzip.compress(body.split(b"\n", 1)[1]),
+        )
+        a.fetch_and_parse()
+        assert len(a.normalize()) == 4
+
+    @responses.activate
+    def test_batches(self):
+        a = _archive("http://test/nivo.201701.csv.gz", gzip.compress(_synthetic_csv(5)))
+        a.stations = {7589: "station"}
+        a.fetch_and_parse()
+        batches = list(a.batches(2))
+        assert [len(b) for b in batches] == [2, 2, 1]
+        assert batches[0][0]["nr_nivo_sensor"] == "station"
+
+
+def _peak_memory(lines: int) -> int:
+    """
+    Peak python memory used to stream an archive of `lines` records through the pipeline.
+    """
+    a = _archive(
+        f"http://test/{lines}/nivo.201701.csv.gz",
+        gzip.compress(_synthetic_csv(lines)),
+    )
+    a.stations = {7589: "station"}
+    tracemalloc.start()
+    try:
+        a.fetch_and_parse()
+        for _ in a.batches(500):
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@responses.activate
+def test_pipeline_memory_does_not_depend_on_file_size():
+    small = _peak_memory(2_000)
+    big = _peak_memory(20_000)
+    # a full read of the big file would take ~10 times the memory of the small one.
+    assert big < small * 2
+
+
+class TestNivoFetcher:
+    @responses.activate
+    def test_files_are_yield_in_order(self):
+        body = gzip.compress(_synthetic_csv(3))
+        months = [date(2017, m, 1) for m in range(1, 6)]
+        for d in months:
+            responses.add(
+                responses.GET,
+                f"{Config.METEO_FRANCE_NIVO_BASE_URL}/Archive/nivo.{d:%Y%m}.csv.gz",
+                body=body,
+            )
+        responses.add(
+            responses.GET,
+            f"{Config.METEO_FRANCE_NIVO_BASE_URL}/Archive/nivo.201706.csv.gz",
+            status=302,
+        )
+        nivo_dates = [NivoDate(True, d) for d in months + [date(2017, 6, 1)]]
+        with NivoFetcher(jobs=2) as fetcher:
+            files = list(fetcher.files(nivo_dates, None, stations={}))
+            assert [f[0] for f in files] == nivo_dates
+            for _, future in files[:-1]:
+                nivo_csv = fetcher.result(future)
+                assert nivo_csv.size == len(body)
+                assert nivo_csv.timings["download"] >= 0
+                nivo_csv.fetch_and_parse()
+                assert len(nivo_csv.normalize()) == 3
+                nivo_csv.close()
+            with pytest.raises(HTTPError):
+                fetcher.result(files[-1][1])
+
+    @responses.activate
+    def test_files_not_handed_out_are_closed(self, monkeypatch):
+        body = gzip.compress(_synthetic_csv(3))
+        months = [date(2017, m, 1) for m in range(1, 6)]
+        for d in months:
+            responses.add(
+                responses.GET,
+                f"{Config.METEO_FRANCE_NIVO_BASE_URL}/Archive/nivo.{d:%Y%m}.csv.gz",
+                body=body,
+            )
+        prefetched = list()
+        prefetch = nivo_record_helper._prefetch
+
+        def _prefetch(*args):
+            prefetched.append(prefetch(*args))
+            return prefetched[-1]
+
+        monkeypatch.setattr(nivo_record_helper, "_prefetch", _prefetch)
+        with NivoFetcher(jobs=2) as fetcher:
+            files = fetcher.files([NivoDate(True, d) for d in months], None, {})
+            _, future = next(files)
+            first = fetcher.result(future)
+            # the import stops after the first file
+            files.close()
+        assert len(prefetched) == 4
+        assert first._file is not None
+        assert all(f._file is None for f in prefetched if f is not first)
+        first.close()
+
+
+@responses.activate
+def test_failed_parse_releases_the_file():
+    a = _archive("http://test/nivo.201701.csv.gz", gzip.compress(_synthetic_csv(3)))
+    a.prefetch()
+    f = a._file
+    a._encoding = "not-an-encoding"
+    with pytest.raises(LookupError):
+        a.fetch_and_parse()
+    assert f.closed
+    assert a._file is None
+
+
+def test_import_report():
+    report = NivoImportReport()
+    nivo_csv = ArchiveNivoCss(NivoDate(True, date(2017, 1, 1)), None)
+    nivo_csv.imported = 10
+    nivo_csv.size = 1024
+    nivo_csv.timings = {"download": 1.0, "parse": 2.0, "load": 3.0}
+    report.add(nivo_csv)
+    report.add(nivo_csv)
+    assert report.records == 20
+    assert report.timings == {"download": 2.0, "parse": 4.0, "load": 6.0}
+    assert "2 nivo files imported (20 records" in str(report)
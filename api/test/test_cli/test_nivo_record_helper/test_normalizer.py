@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from nivo_api.cli.nivo_normalizer import (
+    NivoNormalizer,
+    header_mapping,
+    parse_dates,
+    parse_numbers,
+)
+
+HEADER = ["numer_sta", "date", "haut_sta", "dd", "unknown_column", ""]
+
+
+class TestHeaderMapping:
+    def test_mapping(self):
+        mapping = header_mapping(tuple(HEADER))
+        assert mapping.columns == ("nr_nivo_sensor", "nr_date", "nr_haut_sta", "nr_dd")
+        assert mapping.kinds == ("int", "date", "float", "int")
+        assert mapping.indexes == (0, 1, 2, 3)
+        assert mapping.unknown == ("unknown_column",)
+
+    def test_missing_station(self):
+        with pytest.raises(KeyError) as e:
+            NivoNormalizer(["date", "dd"])
+        assert str(e.value) == "'nr_numer_sta'"
+
+
+class TestParse:
+    def test_parse_numbers(self):
+        raw = np.array(["1.5", "mq", "abc", "2"])
+        values, failed = parse_numbers(raw, np.array([False, True, False, False]))
+        assert values[0] == 1.5
+        assert np.isnan(values[1]) and np.isnan(values[2])
+        assert failed.tolist() == [False, False, True, False]
+
+    def test_parse_integers(self):
+        raw = np.array(["360", "1570.000000", "1.5"])
+        values, failed = parse_numbers(raw, np.zeros(3, dtype=bool), integer=True)
+        assert values[:2].tolist() == [360, 1570]
+        assert failed.tolist() == [False, False, True]
+
+    def test_parse_dates(self):
+        raw = np.array(["20190812070000", "20190231000000", "2019", ""])
+        values, failed = parse_dates(raw, np.array([False, False, False, True]))
+        assert values[0].astype(datetime) == datetime(2019, 8, 12, 7)
+        assert failed.tolist() == [False, True, True, False]
+
+
+class TestNivoNormalizer:
+    def test_normalize(self):
+        normalizer = NivoNormalizer(HEADER)
+        records = normalizer.normalize(
+            [
+                ["07589", "20190812070000", "1570.000000", "360", "x", ""],
+                ["07608", "20190812063000", "mq", "/"],
+                [],
+                ["07608", "bad date", "1", "1", "x", ""],
+                ["07608", "20190812063000", "1", "bad", "x", ""],
+            ]
+        )
+        assert records[0] == {
+            "nr_nivo_sensor": 7589,
+            "nr_date": datetime(2019, 8, 12, 7),
+            "nr_haut_sta": 1570.0,
+            "nr_dd": 360,
+        }
+        assert isinstance(records[0]["nr_dd"], int)
+        assert records[1]["nr_haut_sta"] is None and records[1]["nr_dd"] is None
+        assert records[2]["nr_dd"] is None
+        assert len(records) == 3
+        assert normalizer.rejected == 1
+        assert normalizer.failures == {"nr_date": 1, "nr_dd": 1}
+        assert "1 lines rejected" in normalizer.report()
@@ -0,0 +1,115 @@
+from datetime import date, datetime
+
+from sqlalchemy import select, text, inspect
+
+from nivo_api.cli.nivo_partition import (
+    season_of,
+    season_bounds,
+    create_season_partitions,
+    get_partitions,
+    archive_season,
+    partition_nivo_records,
+    is_partitioned,
+)
+from nivo_api.cli.nivo_record_helper import (
+    create_new_unknown_nivo_sensor_station,
+    copy_nivo_records,
+)
+from nivo_api.core.db.connection import connection_scope
+from nivo_api.core.db.models.sql.nivo import NivoRecordTable
+from test.pytest_fixtures import database
+
+
+def _count(con, table):
+    return con.execute(text(f"SELECT count(*) FROM nivo.{table}")).scalar()
+
+
+def test_season_of():
+    assert season_of(date(2019, 12, 1)) == 2019
+    assert season_of(date(2020, 7, 31)) == 2019
+    assert season_of(date(2020, 8, 1)) == 2020
+    assert season_bounds(2019) == [datetime(2019, 8, 1), datetime(2020, 8, 1)]
+
+
+class TestCreateSeasonPartitions:
+    def test_create_season_partitions(self, database):
+        with connection_scope(database.engine) as con:
+            assert is_partitioned(con)
+            assert get_partitions(con) == ["records_default"]
+            assert create_season_partitions(con, until=2012) == 3
+            assert create_season_partitions(con, until=2012) == 0
+            assert get_partitions(con) == [
+                "records_2010",
+                "records_2011",
+                "records_2012",
+                "records_default",
+            ]
+
+    def test_records_go_to_their_season(self, database):
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            copy_nivo_records(
+                con,
+                [
+                    {"nr_date": datetime(2011, 7, 31), "nr_nivo_sensor": station},
+                    {"nr_date": datetime(2011, 8, 1), "nr_nivo_sensor": station},
+                ],
+            )
+            assert _count(con, "records_default") == 2
+            create_season_partitions(con, until=2011)
+            assert _count(con, "records_default") == 0
+            assert _count(con, "records_2010") == 1
+            assert _count(con, "records_2011") == 1
+            assert len(con.execute(select([NivoRecordTable])).fetchall()) == 2
+
+    def test_bounded_query_prune_partitions(self, database):
+        with connection_scope(database.engine) as con:
+            create_season_partitions(con, until=2012)
+            plan = "\n".join(
+                r[0]
+                for r in con.execute(
+                    text(
+                        "EXPLAIN SELECT nr_id FROM nivo.records "
+                        "WHERE nr_date >= :start AND nr_date < :end"
+                    ),
+                    start=datetime(2011, 12, 1),
+                    end=datetime(2011, 12, 2),
+                )
+            )
+        assert "records_2011" in plan
+        assert "records_2010" not in plan
+        assert "records_2012" not in plan
+
+    def test_detached_season_is_not_created_again(self, database):
+        with connection_scope(database.engine) as con:
+            create_season_partitions(con, until=2011)
+            assert archive_season(con, 2010, detach=True) == "nivo.records_2010"
+            assert "records_2010" not in get_partitions(con)
+            assert create_season_partitions(con, until=2011) == 0
+
+
+class TestPartitionNivoRecords:
+    def test_partition_nivo_records(self, database):
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            # nivo.records as created before the partitions
+            con.execute(text("CREATE TABLE nivo.legacy (LIKE nivo.records)"))
+            NivoRecordTable.drop(con)
+            con.execute(text("ALTER TABLE nivo.legacy RENAME TO records"))
+            con.execute(text("ALTER TABLE nivo.records ADD PRIMARY KEY (nr_id)"))
+            con.execute(
+                text("CREATE INDEX ix_nivo_records_nr_date ON nivo.records (nr_date)")
+            )
+            assert not is_partitioned(con)
+            con.execute(
+                NivoRecordTable.insert(),
+                [{"nr_date": datetime(2012, 1, 1), "nr_nivo_sensor": station}],
+            )
+        assert partition_nivo_records(database.engine) == 1
+        with connection_scope(database.engine) as con:
+            assert is_partitioned(con)
+            assert _count(con, "records_2011") == 1
+            assert partition_nivo_records(database.engine) == 0
+        assert "records_unpartitioned" not in inspect(database.engine).get_table_names(
+            schema="nivo"
+        )
@@ -0,0 +1,103 @@
+import os
+from csv import DictReader
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import select
+
+from nivo_api.cli.nivo_record_helper import (
+    create_new_unknown_nivo_sensor_station,
+    copy_nivo_records,
+    import_nivo,
+    NivoCsv,
+    NivoDate,
+)
+from nivo_api.cli.nivo_rollup import update_nivo_rollups, rebuild_nivo_rollups
+from nivo_api.core.db.connection import connection_scope
+from nivo_api.core.db.models.sql.nivo import (
+    NivoDailyRollupTable,
+    NivoSeasonRollupTable,
+)
+from test.pytest_fixtures import database
+
+CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def _records(station):
+    return [
+        {"nr_date": datetime(2019, 12, 1, 0), "nr_nivo_sensor": station, "nr_t": 270.0},
+        {
+            "nr_date": datetime(2019, 12, 1, 12),
+            "nr_nivo_sensor": station,
+            "nr_t": 280.0,
+        },
+        {"nr_date": datetime(2019, 12, 2, 0), "nr_nivo_sensor": station, "nr_t": 260.0},
+    ]
+
+
+class TestUpdateNivoRollups:
+    def test_update_nivo_rollups(self, database):
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            copy_nivo_records(con, _records(station))
+            update_nivo_rollups(con, {date(2019, 12, 1)})
+            days = con.execute(select([NivoDailyRollupTable])).fetchall()
+            seasons = con.execute(select([NivoSeasonRollupTable])).fetchall()
+        assert len(days) == 1
+        assert days[0].ndr_date == date(2019, 12, 1)
+        assert days[0].ndr_records == 2
+        assert days[0].ndr_t_min == 270.0
+        assert days[0].ndr_t_max == 280.0
+        assert days[0].ndr_t_mean == 275.0
+        assert days[0].ndr_ht_neige_mean is None
+        assert len(seasons) == 1
+        assert seasons[0].nsr_season == 2019
+        assert seasons[0].nsr_days == 1
+
+    def test_only_affected_days_are_refreshed(self, database):
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            copy_nivo_records(con, _records(station))
+            update_nivo_rollups(con, {date(2019, 12, 1), date(2019, 12, 2)})
+            copy_nivo_records(
+                con,
+                [
+                    {
+                        "nr_date": datetime(2019, 12, 2, 12),
+                        "nr_nivo_sensor": station,
+                        "nr_t": 250.0,
+                    }
+                ],
+            )
+            update_nivo_rollups(con, {date(2019, 12, 2)})
+            days = con.execute(
+                select([NivoDailyRollupTable]).order_by(NivoDailyRollupTable.c.ndr_date)
+            ).fetchall()
+            season = con.execute(select([NivoSeasonRollupTable])).first()
+        assert [d.ndr_records for d in days] == [2, 2]
+        assert days[1].ndr_t_min == 250.0
+        assert season.nsr_days == 2
+        assert season.nsr_records == 4
+        assert season.nsr_t_min == 250.0
+        assert season.nsr_t_mean == pytest.approx((275.0 + 255.0) / 2)
+
+    def test_rebuild_nivo_rollups(self, database):
+        with connection_scope(database.engine) as con:
+            station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+            copy_nivo_records(con, _records(station))
+            assert rebuild_nivo_rollups(con) == 2
+            assert len(con.execute(select([NivoSeasonRollupTable])).fetchall()) == 1
+
+    def test_import_nivo_updates_rollups(self, database):
+        with open(os.path.join(CURRENT_DIR, "test_data/nivo.20190812.csv")) as f:
+            with connection_scope(database.engine) as con:
+                n = NivoCsv(
+                    NivoDate(is_archive=False, nivo_date=date(2019, 8, 12)), con
+                )
+                n.nivo_csv = DictReader(f, delimiter=";")
+                import_nivo(con, n)
+                days = con.execute(select([NivoDailyRollupTable])).fetchall()
+                seasons = con.execute(select([NivoSeasonRollupTable])).fetchall()
+        assert {d.ndr_date for d in days} == {date(2019, 8, 12)}
+        assert sum(d.ndr_records for d in days) == n.imported
+        assert {s.nsr_season for s in seasons} == {2019}
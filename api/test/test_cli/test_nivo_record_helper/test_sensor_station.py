@@ -0,0 +1,63 @@
+from sqlalchemy import select
+
+from nivo_api.cli.nivo_record_helper import (
+    create_new_unknown_nivo_sensor_station,
+    upsert_nivo_sensor_stations,
+    SensorStationUpsertReport,
+)
+from nivo_api.core.db.connection import connection_scope
+from nivo_api.core.db.models.sql.nivo import SensorStationTable
+from test.pytest_fixtures import database
+
+
+def _feature(name, mf_id, lon=6.0, lat=45.0, altitude=2000):
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [lon, lat]},
+        "properties": {"Nom": name, "ID": mf_id, "Altitude": str(altitude)},
+    }
+
+
+class TestUpsertNivoSensorStations:
+    def test_insert(self, database):
+        with connection_scope(database.engine) as con:
+            report = upsert_nivo_sensor_stations(
+                con, [_feature("Tignes", "7589"), _feature("No id", "")]
+            )
+            stations = con.execute(select([SensorStationTable])).fetchall()
+        assert report == SensorStationUpsertReport(inserted=2)
+        assert {s.nss_meteofrance_id for s in stations} == {7589, None}
+
+    def test_nothing_changed(self, database):
+        features = [_feature("Tignes", "7589"), _feature("No id", "")]
+        with connection_scope(database.engine) as con:
+            upsert_nivo_sensor_stations(con, features)
+            report = upsert_nivo_sensor_stations(con, features)
+        assert report == SensorStationUpsertReport(unchanged=2)
+        assert str(report) == "0 sensor stations inserted, 0 updated, 2 unchanged"
+
+    def test_update_moved_and_unknown_stations(self, database):
+        with connection_scope(database.engine) as con:
+            upsert_nivo_sensor_stations(
+                con, [_feature("Tignes", "7589"), _feature("No id", "")]
+            )
+            unknown = create_new_unknown_nivo_sensor_station(7590, con).nss_id
+            report = upsert_nivo_sensor_stations(
+                con,
+                [
+                    _feature("Tignes", "7589", lat=45.5),
+                    _feature("No id", ""),
+                    _feature("Val", "7590"),
+                ],
+            )
+            station = con.execute(
+                select([SensorStationTable]).where(
+                    SensorStationTable.c.nss_id == unknown
+                )
+            ).first()
+        assert report == SensorStationUpsertReport(updated=2, unchanged=1)
+        assert station.nss_name == "Val"
+
+    def test_nothing_to_upsert(self, database):
+        with connection_scope(database.engine) as con:
+            assert upsert_nivo_sensor_stations(con, []) == SensorStationUpsertReport()
@@ -0,0 +1,77 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import select, func
+
+from nivo_api.core.db.connection import connection_scope
+from nivo_api.core.db.copy import format_copy_value, copy_rows, _CopyReader
+from nivo_api.core.db.models.sql.bra import ZoneTable, DepartmentTable
+from test.pytest_fixtures import database
+
+
+class TestFormatCopyValue:
+    def test_null(self):
+        assert format_copy_value(None) == "\\N"
+
+    def test_escape(self):
+        assert format_copy_value("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
+
+    def test_scalar(self):
+        assert format_copy_value(True) == "t"
+        assert format_copy_value(12) == "12"
+        assert format_copy_value(datetime(2019, 1, 1, 12)) == "2019-01-01T12:00:00"
+
+    def test_array(self):
+        assert format_copy_value(["NE", 'S"W', None]) == '{"NE","S\\\\"W",NULL}'
+
+
+class TestCopyRows:
+    def test_copy_rows(self, database):
+        with connection_scope(database.engine) as con:
+            with con.begin():
+                assert copy_rows(con, ZoneTable, [{"z_name": "test\tzone"}]) == 1
+            zone = con.execute(select([ZoneTable])).first()
+            # python side default is applied
+            assert isinstance(zone.z_id, UUID)
+            assert zone.z_name == "test\tzone"
+            with con.begin():
+                copy_rows(
+                    con,
+                    DepartmentTable,
+                    [
+                        {"d_name": "a", "d_number": None, "d_zone": zone.z_id},
+                        {"d_name": "b", "d_number": 74, "d_zone": zone.z_id},
+                    ],
+                )
+            res = con.execute(
+                select([DepartmentTable.c.d_name, DepartmentTable.c.d_number]).order_by(
+                    DepartmentTable.c.d_name
+                )
+            ).fetchall()
+            assert [tuple(r) for r in res] == [("a", None), ("b", 74)]
+
+    def test_nothing_to_copy(self, database):
+        with connection_scope(database.engine) as con:
+            assert copy_rows(con, ZoneTable, []) == 0
+
+    def test_copy_streamed_rows(self, database):
+        def zones():
+            for i in range(1000):
+                yield {"z_name": f"zone {i}"}
+
+        with connection_scope(database.engine) as con:
+            with con.begin():
+                assert copy_rows(con, ZoneTable, zones(), columns=["z_name"]) == 1000
+            assert (
+                con.execute(select([func.count()]).select_from(ZoneTable)).scalar()
+                == 1000
+            )
+
+
+class TestCopyReader:
+    def test_read_by_chunk(self):
+        reader = _CopyReader(iter(["abc\n", "de\n", "f\n"]))
+        assert reader.read(5) == "abc\nd"
+        assert reader.read(5) == "e\nf\n"
+        assert reader.read(5) == ""
+        assert reader.rows == 3
@@ -0,0 +1,111 @@
+import pytest
+import requests
+import responses
+
+from nivo_api.core.http import (
+    HttpClient,
+    is_missing,
+    get_http_client,
+    get_api_http_client,
+    configure_http_client,
+)
+
+
+class TestHttpClient:
+    @responses.activate
+    def test_302_is_not_followed(self):
+        responses.add(
+            responses.GET,
+            "http://example.com/bra.json",
+            status=302,
+            headers={"Location": "http://example.com/404.html"},
+        )
+        res = HttpClient().get("http://example.com/bra.json", allow_redirects=False)
+        assert res.status_code == 302
+        assert is_missing(res)
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_stats(self):
+        responses.add(responses.GET, "http://example.com/a", body="12345")
+        responses.add(responses.GET, "http://other.com/b", body="123")
+        client = HttpClient()
+        client.get("http://example.com/a")
+        client.get("http://example.com/a")
+        client.get("http://other.com/b")
+        assert client.stats.requests == 3
+        assert client.stats.bytes == 13
+        stats = client.stats.as_dict()
+        assert stats["example.com"]["requests"] == 2
+        assert stats["other.com"]["bytes"] == 3
+
+    @responses.activate
+    def test_streamed_bytes_are_counted(self, tmp_path):
+        responses.add(responses.GET, "http://example.com/a.csv.gz", body=b"x" * 1000)
+        (tmp_path / "b.csv").write_bytes(b"y" * 10)
+        client = HttpClient()
+        res = client.get("http://example.com/a.csv.gz", stream=True)
+        assert client.stats.bytes == 0
+        assert b"".join(res.iter_content(64)) == b"x" * 1000
+        res = client.get((tmp_path / "b.csv").as_uri(), stream=True)
+        assert b"".join(res.iter_content(4)) == b"y" * 10
+        res.close()
+        assert client.stats.bytes == 1010
+        assert client.stats.as_dict()["example.com"]["requests"] == 1
+
+    @responses.activate
+    def test_error_are_counted(self):
+        responses.add(
+            responses.GET,
+            "http://example.com/a",
+            body=requests.ConnectionError("nope"),
+        )
+        client = HttpClient()
+        with pytest.raises(requests.ConnectionError):
+            client.get("http://example.com/a")
+        assert client.stats.as_dict()["example.com"]["errors"] == 1
+
+    def test_pool_is_bounded_per_host(self):
+        client = HttpClient(per_host=2)
+        adapter = client.session.get_adapter("https://donneespubliques.meteofrance.fr")
+        assert adapter._pool_maxsize == 2
+        assert adapter._pool_block is True
+        assert 302 not in adapter.max_retries.status_forcelist
+
+    def test_api_client_fails_fast(self):
+        client = get_api_http_client()
+        assert client is get_api_http_client()
+        assert client is not get_http_client()
+        assert client.cache is None
+        assert client.timeout == (3, 5)
+        adapter = client.session.get_adapter("http://www.isaw.ch")
+        assert adapter.max_retries.total == 0
+
+
+class TestFileAdapter:
+    def test_file_is_served(self, tmp_path):
+        (tmp_path / "bra.20200101.json").write_text("[]")
+        res = HttpClient().get((tmp_path / "bra.20200101.json").as_uri())
+        assert res.status_code == 200
+        assert res.json() == []
+        assert res.headers["Content-Length"] == "2"
+
+    def test_file_is_streamed(self, tmp_path):
+        (tmp_path / "nivo.202001.csv.gz").write_bytes(b"\x1f\x8b" * 10)
+        res = HttpClient().get((tmp_path / "nivo.202001.csv.gz").as_uri(), stream=True)
+        assert b"".join(res.iter_content(4)) == b"\x1f\x8b" * 10
+        assert res.headers["Content-Type"] == "application/octet-stream"
+        res.close()
+
+    def test_missing_file_is_a_404(self, tmp_path):
+        res = HttpClient().get((tmp_path / "nope.json").as_uri(), allow_redirects=False)
+        assert res.status_code == 404
+
+
+def test_configure_http_client_replace_the_shared_client():
+    first = get_http_client()
+    assert get_http_client() is first
+    second = configure_http_client(per_host=1)
+    assert second is not first
+    assert get_http_client() is second
+    assert second.per_host == 1
@@ -0,0 +1,134 @@
+import json
+import os
+import time
+from dataclasses import asdict
+from datetime import date
+
+import pytest
+import responses
+
+from nivo_api.core.http import HttpClient
+from nivo_api.core.http_cache import HttpCache, is_immutable
+
+BASE = "https://donneespubliques.meteofrance.fr/donnees_libres"
+
+
+@pytest.fixture
+def cache(tmp_path) -> HttpCache:
+    return HttpCache(str(tmp_path), max_size=1024**2)
+
+
+class TestIsImmutable:
+    @pytest.mark.parametrize(
+        "url,expected",
+        [
+            (f"{BASE}/Pdf/BRA/BRA.CHABLAIS.20190101142328.xml", True),
+            (f"{BASE}/Pdf/BRA/bra.20190101.json", True),
+            (f"{BASE}/Pdf/BRA/bra.20200110.json", False),
+            (f"{BASE}/Pdf/BRA/bra.20200109.json", False),
+            (f"{BASE}/Txt/Nivo/Archive/nivo.201912.csv.gz", True),
+            (f"{BASE}/Txt/Nivo/Archive/nivo.202001.csv.gz", False),
+            (f"{BASE}/Txt/Nivo/nivo.20200101.csv", True),
+            (f"{BASE}/Txt/Nivo/lastNivo.js", False),
+            (f"{BASE}/Txt/Nivo/postesNivo.json", False),
+        ],
+    )
+    def test_is_immutable(self, url, expected):
+        assert is_immutable(url, today=date(2020, 1, 10)) is expected
+
+
+class TestHttpCache:
+    @responses.activate
+    def test_immutable_file_is_served_from_disk(self, cache):
+        url = f"{BASE}/Pdf/BRA/BRA.CHABLAIS.20190101142328.xml"
+        responses.add(responses.GET, url, body=b"<xml/>")
+        client = HttpClient(cache=cache)
+        assert client.get(url).content == b"<xml/>"
+        res = client.get(url)
+        assert res.content == b"<xml/>"
+        assert res.headers["X-Nivo-Cache"] == "HIT"
+        assert len(responses.calls) == 1
+        assert client.stats.cache_hits == 1
+
+    @responses.activate
+    def test_302_of_an_immutable_file_is_fetched_again(self, cache):
+        # not published yet, then published
+        url = f"{BASE}/Pdf/BRA/BRA.CHABLAIS.20190101142328.xml"
+        responses.add(responses.GET, url, status=302)
+        responses.add(responses.GET, url, body=b"<xml/>")
+        client = HttpClient(cache=cache)
+        assert client.get(url, allow_redirects=False).status_code == 302
+        assert not cache.lookup(url).immutable
+        assert client.get(url, allow_redirects=False).content == b"<xml/>"
+        assert client.get(url, allow_redirects=False).content == b"<xml/>"
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_immutable_302_entry_is_not_trusted(self, cache):
+        url = f"{BASE}/Pdf/BRA/BRA.CHABLAIS.20190101142328.xml"
+        responses.add(responses.GET, url, status=302)
+        responses.add(responses.GET, url, body=b"<xml/>")
+        client = HttpClient(cache=cache)
+        client.get(url, allow_redirects=False)
+        # as an older cache wrote it
+        entry = cache.lookup(url)
+        entry.immutable = True
+        cache._write_atomic(cache._index_path(url), json.dumps(asdict(entry)).encode())
+        assert client.get(url, allow_redirects=False).content == b"<xml/>"
+
+    @responses.activate
+    def test_mutable_file_is_revalidated(self, cache):
+        url = f"{BASE}/Txt/Nivo/lastNivo.js"
+        responses.add(
+            responses.GET, url, body="jour=20190101;", headers={"ETag": '"abc"'}
+        )
+        responses.add(responses.GET, url, status=304)
+        client = HttpClient(cache=cache)
+        client.get(url)
+        res = client.get(url)
+        assert res.text == "jour=20190101;"
+        assert len(responses.calls) == 2
+        assert responses.calls[1].request.headers["If-None-Match"] == '"abc"'
+
+    @responses.activate
+    def test_stream_from_cache(self, cache):
+        url = f"{BASE}/Txt/Nivo/Archive/nivo.201701.csv.gz"
+        responses.add(responses.GET, url, body=b"x" * 1000)
+        client = HttpClient(cache=cache)
+        client.get(url)
+        res = client.get(url, stream=True)
+        assert b"".join(res.iter_content(100)) == b"x" * 1000
+
+    def test_same_body_is_stored_once(self, cache, tmp_path):
+        with responses.RequestsMock() as r:
+            r.add(responses.GET, f"{BASE}/a.xml", body=b"same")
+            r.add(responses.GET, f"{BASE}/b.xml", body=b"same")
+            client = HttpClient(cache=cache)
+            client.get(f"{BASE}/a.xml")
+            client.get(f"{BASE}/b.xml")
+        assert cache.info()["entries"] == 2
+        assert cache.size() == 4
+
+    def test_prune_least_recently_used(self, cache):
+        with responses.RequestsMock() as r:
+            for name in ("a", "b", "c"):
+                r.add(responses.GET, f"{BASE}/{name}.xml", body=name.encode() * 100)
+            client = HttpClient(cache=cache)
+            for name in ("a", "b", "c"):
+                client.get(f"{BASE}/{name}.xml")
+                time.sleep(0.01)
+        # b becomes the least recently used entry.
+        past = time.time() - 100
+        os.utime(cache._index_path(f"{BASE}/b.xml"), (past, past))
+        freed = cache.prune(200)
+        assert freed == 100
+        assert cache.lookup(f"{BASE}/b.xml") is None
+        assert cache.lookup(f"{BASE}/a.xml") is not None
+        assert cache.lookup(f"{BASE}/c.xml") is not None
+
+    def test_clear(self, cache):
+        with responses.RequestsMock() as r:
+            r.add(responses.GET, f"{BASE}/a.xml", body=b"abc")
+            HttpClient(cache=cache).get(f"{BASE}/a.xml")
+        assert cache.clear() == 3
+        assert cache.info()["entries"] == 0
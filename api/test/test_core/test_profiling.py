@@ -0,0 +1,68 @@
+import json
+import pstats
+import time
+
+from sqlalchemy import create_engine, text
+
+from nivo_api.core import profiling
+from nivo_api.core.profiling import profile, stage, add_stage, get_profiler
+
+
+class TestProfile:
+    def test_disabled(self):
+        with profile("cmd") as profiler:
+            assert profiler is None
+            with stage("fetch") as frame:
+                frame.rows += 1
+            add_stage("parse", 1, 1)
+        assert get_profiler() is None
+
+    def test_stages(self, tmp_path):
+        path = tmp_path / "profile.json"
+        with profile("cmd", str(path)) as profiler:
+            with stage("parse") as parse:
+                parse.rows += 2
+                with stage("fetch") as fetch:
+                    fetch.bytes += 10
+                    time.sleep(0.05)
+            add_stage("transform", 0.5, 0.25, rows=3)
+        assert get_profiler() is None
+        summary = json.loads(path.read_text())
+        assert summary["command"] == "cmd"
+        stages = summary["stages"]
+        assert stages["fetch"]["bytes"] == 10
+        assert stages["fetch"]["wall"] >= 0.05
+        # the time of the nested stage is not counted twice
+        assert stages["parse"]["wall"] < 0.05
+        assert stages["parse"]["rows"] == 2
+        assert stages["transform"] == {
+            "calls": 1,
+            "wall": 0.5,
+            "cpu": 0.25,
+            "bytes": 0,
+            "rows": 3,
+            "db_round_trips": 0,
+        }
+
+    def test_db_round_trips(self, tmp_path):
+        engine = create_engine("sqlite://")
+        path = tmp_path / "profile.json"
+        with profile("cmd", str(path)):
+            with engine.connect() as con:
+                con.execute(text("SELECT 1"))
+                with stage("persist"):
+                    con.execute(text("SELECT 1"))
+                    con.execute(text("SELECT 1"))
+        summary = json.loads(path.read_text())
+        assert summary["db_round_trips"] == 3
+        assert summary["stages"]["persist"]["db_round_trips"] == 2
+        # the listener is removed
+        with engine.connect() as con:
+            con.execute(text("SELECT 1"))
+        assert profiling._profiler is None
+
+    def test_pstats(self, tmp_path):
+        path = tmp_path / "profile.pstats"
+        with profile("cmd", pstats_path=str(path)):
+            sum(range(1000))
+        assert pstats.Stats(str(path)).total_calls > 0
@@ -0,0 +1,59 @@
+from datetime import date, datetime
+
+import pytest
+
+from nivo_api.app_factory import init_app
+from nivo_api.cli.nivo_record_helper import (
+    create_new_unknown_nivo_sensor_station,
+    copy_nivo_records,
+)
+from nivo_api.cli.nivo_rollup import update_nivo_rollups
+from nivo_api.core.db.connection import connection_scope
+from test.pytest_fixtures import database
+
+
+@pytest.fixture
+def station(database):
+    with connection_scope(database.engine) as con:
+        station = create_new_unknown_nivo_sensor_station(7589, con).nss_id
+        copy_nivo_records(
+            con,
+            [
+                {"nr_date": datetime(2019, 12, d), "nr_nivo_sensor": station, "nr_t": t}
+                for d, t in ((1, 270.0), (2, 260.0), (3, 250.0))
+            ],
+        )
+        update_nivo_rollups(con, {date(2019, 12, d) for d in (1, 2, 3)})
+    return station
+
+
+@pytest.fixture
+def client():
+    return init_app().test_client()
+
+
+class TestRollupsResource:
+    def test_daily(self, station, client):
+        res = client.get(f"/nivo/stations/{station}/records/daily")
+        assert res.status_code == 200
+        assert [d["date"] for d in res.json] == [
+            "2019-12-01",
+            "2019-12-02",
+            "2019-12-03",
+        ]
+        assert res.json[0]["t_max"] == 270.0
+        assert res.json[0]["records"] == 1
+
+    def test_daily_range(self, station, client):
+        res = client.get(
+            f"/nivo/stations/{station}/records/daily?from=2019-12-02&to=2019-12-02"
+        )
+        assert [d["date"] for d in res.json] == ["2019-12-02"]
+
+    def test_seasons(self, station, client):
+        res = client.get(f"/nivo/stations/{station}/records/seasons")
+        assert res.status_code == 200
+        assert len(res.json) == 1
+        assert res.json[0]["season"] == 2019
+        assert res.json[0]["days"] == 3
+        assert res.json[0]["t_mean"] == 260.0